@@ -0,0 +1,156 @@
+"""Admission control for upstream LLM calls.
+
+Each agent gets its own concurrency limiter and all agents share a global
+one. Callers beyond the limit wait in a bounded FIFO queue; when the queue
+is full, or the wait outlasts the caller's deadline, the request is shed
+with an Overloaded error carrying a Retry-After estimate.
+"""
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted in time"""
+
+    def __init__(self, reason: str, retry_after: int, status_code: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+class ConcurrencyLimiter:
+    """Counting limiter with a bounded FIFO wait queue and wait-time stats"""
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_use = 0
+        self._waiters: deque = deque()
+        self._avg_hold = 1.0  # EWMA of slot hold time, seeds Retry-After
+        self.counters = {"admitted": 0, "rejected": 0, "timed_out": 0}
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def retry_after(self) -> int:
+        """Rough seconds until a new caller could expect a free slot"""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._avg_hold * backlog / self.limit))
+
+    async def acquire(self, timeout: float) -> float:
+        """Take a slot, waiting at most ``timeout`` seconds; returns the wait time"""
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            self.counters["admitted"] += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise Overloaded(f"{self.name} queue full", self.retry_after(), 429)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self.counters["timed_out"] += 1
+            raise Overloaded(f"{self.name} queue wait exceeded deadline", self.retry_after(), 503)
+        except asyncio.CancelledError:
+            # A slot may have been handed over just before we were cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+        waited = time.monotonic() - started
+        self.counters["admitted"] += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        return waited
+
+    def release(self, held: Optional[float] = None):
+        """Free a slot, handing it directly to the next live waiter if any"""
+        if held is not None:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        admitted = self.counters["admitted"]
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "queued": len(self._waiters),
+            "max_queue": self.max_queue,
+            "avg_wait_ms": round(self._total_wait / admitted * 1000, 2) if admitted else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 2),
+            "avg_hold_ms": round(self._avg_hold * 1000, 2),
+            **self.counters,
+        }
+
+class AdmissionTicket:
+    """Slots held by one admitted request; release() is idempotent"""
+
+    def __init__(self, limiters):
+        self._limiters = limiters
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        held = time.monotonic() - self._started
+        for limiter in self._limiters:
+            limiter.release(held)
+
+class AdmissionController:
+    """Per-agent limiters in front of one global limiter"""
+
+    def __init__(self, global_limit: int, agent_limits: Dict[str, int], max_queue: int, queue_timeout: float):
+        self.queue_timeout = queue_timeout
+        self.global_limiter = ConcurrencyLimiter("global", global_limit, max_queue)
+        self.agent_limiters = {
+            agent_type: ConcurrencyLimiter(agent_type, limit, max_queue)
+            for agent_type, limit in agent_limits.items()
+        }
+
+    async def acquire(self, agent_type: str, deadline: Optional[float] = None) -> AdmissionTicket:
+        """Admit a request for an agent, waiting no longer than the queue timeout or deadline"""
+        agent_limiter = self.agent_limiters[agent_type]
+        await agent_limiter.acquire(self._wait_budget(deadline))
+        try:
+            await self.global_limiter.acquire(self._wait_budget(deadline))
+        except BaseException:
+            agent_limiter.release()
+            raise
+        return AdmissionTicket([self.global_limiter, agent_limiter])
+
+    @asynccontextmanager
+    async def admit(self, agent_type: str, deadline: Optional[float] = None):
+        ticket = await self.acquire(agent_type, deadline)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _wait_budget(self, deadline: Optional[float]) -> float:
+        if deadline is None:
+            return self.queue_timeout
+        return max(0.0, min(self.queue_timeout, deadline - time.monotonic()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "global": self.global_limiter.stats(),
+            "agents": {name: limiter.stats() for name, limiter in self.agent_limiters.items()},
+        }
@@ -0,0 +1,222 @@
+"""Incremental usage rollups per agent, model and day.
+
+Chat writes and upstream calls are counted in process and flushed every few
+seconds as ``$inc`` upserts into ``analytics_daily``, one document per
+(day, agent_type, model). Reports read a bounded number of those documents
+(days x agents x models), never ``messages``, so they answer in the same time
+however long the history is.
+
+Latency percentiles come from a log-bucketed sketch with 2% relative
+accuracy: each bucket is a counter, so sketches from different processes
+and days merge by addition, which ``$inc`` does for us.
+"""
+import math
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+SKETCH_ACCURACY = 0.02
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+SKETCH_MIN_MS = 0.1
+
+# USD per million tokens; MODEL_PRICES in the environment overrides these
+DEFAULT_MODEL_PRICES = {
+    "openai/gpt-5": {"prompt": 1.25, "completion": 10.0},
+    "openai/gpt-5-mini": {"prompt": 0.25, "completion": 2.0},
+}
+
+CALL_OUTCOMES = ("ok", "error", "timeout", "cancelled")
+
+def day_key(at: Optional[datetime] = None) -> str:
+    return (at or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+def sketch_bucket(ms: float) -> int:
+    return math.ceil(math.log(max(ms, SKETCH_MIN_MS)) / math.log(SKETCH_GAMMA))
+
+def sketch_quantiles(buckets: Dict[str, int], quantiles: Iterable[float]) -> Dict[str, Optional[float]]:
+    """Estimate quantiles (in ms) from merged sketch buckets"""
+    ordered = sorted((int(index), count) for index, count in buckets.items() if count > 0)
+    total = sum(count for _, count in ordered)
+    results: Dict[str, Optional[float]] = {}
+    for q in quantiles:
+        label = f"p{round(q * 100):d}"
+        if not total:
+            results[label] = None
+            continue
+        rank = q * (total - 1)
+        seen = 0
+        for index, count in ordered:
+            seen += count
+            if seen > rank:
+                # Midpoint of the bucket in the relative-error sense
+                results[label] = round(2 * SKETCH_GAMMA ** index / (SKETCH_GAMMA + 1), 1)
+                break
+    return results
+
+def estimate_cost(prices: Dict[str, Dict[str, float]], model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price = prices.get(model)
+    if not price:
+        return 0.0
+    return (prompt_tokens * price.get("prompt", 0) + completion_tokens * price.get("completion", 0)) / 1_000_000
+
+def merge_into(target: Dict[str, Any], source: Dict[str, Any]):
+    """Add the numeric leaves of one rollup document into another"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            merge_into(target.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            target[key] = target.get(key, 0) + value
+
+def finalize(rollup: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn summed counters into a report entry"""
+    calls = rollup.get("calls", {})
+    call_count = sum(calls.get(outcome, 0) for outcome in CALL_OUTCOMES)
+    latency = rollup.get("latency", {})
+    tokens = rollup.get("tokens", {})
+    return {
+        "messages": rollup.get("messages", {}),
+        "calls": call_count,
+        "errors": call_count - calls.get("ok", 0),
+        "error_rate": round((call_count - calls.get("ok", 0)) / call_count, 4) if call_count else 0.0,
+        "tokens": {"prompt": tokens.get("prompt", 0), "completion": tokens.get("completion", 0)},
+        "cost_usd": round(rollup.get("cost_usd", 0.0), 6),
+        "latency_ms": {
+            "mean": round(latency["sum_ms"] / latency["count"], 1) if latency.get("count") else None,
+            **sketch_quantiles(latency.get("buckets", {}), (0.5, 0.95, 0.99)),
+        },
+    }
+
+class AnalyticsRollup:
+    """Buffers usage counters and folds them into per-day rollup documents"""
+
+    def __init__(self, db, prices: Dict[str, Dict[str, float]], flush_interval: float = 5.0):
+        self.db = db
+        self.prices = prices
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[str, str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"flushes": 0, "documents_written": 0, "flush_errors": 0}
+
+    async def ensure_indexes(self):
+        await self.db.analytics_daily.create_index(
+            [("day", 1), ("agent_type", 1), ("model", 1)], unique=True, name="day_agent_model"
+        )
+
+    def _add(self, agent_type: str, model: str, increments: Dict[str, float]):
+        pending = self._pending[(day_key(), agent_type, model)]
+        for path, amount in increments.items():
+            pending[path] += amount
+
+    def record_message(self, agent_type: str, model: str, role: str, cached: bool = False):
+        increments = {f"messages.{role}": 1}
+        if cached:
+            increments["messages.cached"] = 1
+        self._add(agent_type, model, increments)
+
+    def record_call(self, agent_type: str, model: str, seconds: float, outcome: str):
+        increments = {f"calls.{outcome}": 1}
+        if outcome == "ok":
+            ms = seconds * 1000
+            increments.update({
+                "latency.count": 1,
+                "latency.sum_ms": ms,
+                f"latency.buckets.{sketch_bucket(ms)}": 1,
+            })
+        self._add(agent_type, model, increments)
+
+    def record_tokens(self, agent_type: str, model: str, prompt_tokens: int, completion_tokens: int):
+        self._add(agent_type, model, {
+            "tokens.prompt": prompt_tokens,
+            "tokens.completion": completion_tokens,
+            "cost_usd": estimate_cost(self.prices, model, prompt_tokens, completion_tokens),
+        })
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+        operations = [
+            UpdateOne(
+                {"day": day, "agent_type": agent_type, "model": model},
+                {"$inc": dict(increments), "$set": {"updated_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            for (day, agent_type, model), increments in pending.items()
+        ]
+        try:
+            await self.db.analytics_daily.bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Keep the counts for the next flush rather than losing them
+            self.counters["flush_errors"] += 1
+            logger.error(f"Analytics flush failed: {e}")
+            for key, increments in pending.items():
+                for path, amount in increments.items():
+                    self._pending[key][path] += amount
+            return
+        self.counters["flushes"] += 1
+        self.counters["documents_written"] += len(operations)
+
+    async def _read(self, days: int, agent_type: Optional[str], model: Optional[str]) -> Tuple[str, str, List[Dict[str, Any]]]:
+        end = datetime.now(timezone.utc)
+        first, last = day_key(end - timedelta(days=days - 1)), day_key(end)
+        query: Dict[str, Any] = {"day": {"$gte": first, "$lte": last}}
+        if agent_type:
+            query["agent_type"] = agent_type
+        if model:
+            query["model"] = model
+        documents = await self.db.analytics_daily.find(query, {"_id": 0, "updated_at": 0}).to_list(None)
+        return first, last, documents
+
+    async def summary(self, days: int = 7, agent_type: Optional[str] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """Totals for the last ``days`` days, broken down by agent and model"""
+        first, last, documents = await self._read(days, agent_type, model)
+        totals: Dict[str, Any] = {}
+        groups: Dict[Tuple[str, str], Dict[str, Any]] = defaultdict(dict)
+        for document in documents:
+            merge_into(totals, document)
+            merge_into(groups[(document["agent_type"], document["model"])], document)
+        return {
+            "from": first,
+            "to": last,
+            "totals": finalize(totals),
+            "breakdown": [
+                {"agent_type": group_agent, "model": group_model, **finalize(rollup)}
+                for (group_agent, group_model), rollup in sorted(groups.items())
+            ],
+        }
+
+    async def daily(self, days: int = 30, agent_type: Optional[str] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """One entry per day for the last ``days`` days"""
+        first, last, documents = await self._read(days, agent_type, model)
+        by_day: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        for document in documents:
+            merge_into(by_day[document["day"]], document)
+        return {
+            "from": first,
+            "to": last,
+            "days": [{"day": day, **finalize(rollup)} for day, rollup in sorted(by_day.items())],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"buffered_keys": len(self._pending), "flush_interval_seconds": self.flush_interval, **self.counters}
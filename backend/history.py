@@ -0,0 +1,169 @@
+"""Explicit conversation context for upstream LLM calls.
+
+Every call is sent with context assembled from the ``messages`` collection:
+a rolling summary of older turns plus as many recent turns as fit in a
+token budget. When turns fall out of the budget they are compacted into the
+summary in the background, so prompt size stays bounded however long a
+session grows.
+"""
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from llm_cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+ROLE_LABELS = {"user": "Kullanıcı", "assistant": "Asistan"}
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) that needs no tokenizer files"""
+    return len(text) // 4 + 1
+
+def format_turns(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{ROLE_LABELS.get(m['role'], m['role'])}: {m['content']}" for m in messages)
+
+def compose_prompt(summary: Optional[str], turns: List[Dict[str, Any]], content: str) -> str:
+    """Prefix a new message with the conversation context it continues"""
+    if not summary and not turns:
+        return content
+    parts = []
+    if summary:
+        parts.append(f"[Konuşma özeti]\n{summary}")
+    if turns:
+        parts.append(f"[Son mesajlar]\n{format_turns(turns)}")
+    parts.append(f"[Yeni mesaj]\n{content}")
+    return "\n\n".join(parts)
+
+def after_position(position: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Match messages after a (timestamp, id) position in a session's history"""
+    if not position:
+        return {}
+    return {"$or": [
+        {"timestamp": {"$gt": position["timestamp"]}},
+        {"timestamp": position["timestamp"], "id": {"$gt": position["id"]}},
+    ]}
+
+class HistoryAssembler:
+    """Builds bounded per-session context and maintains rolling summaries"""
+
+    def __init__(
+        self,
+        db,
+        summarize: Callable[[str, Optional[str], List[Dict[str, Any]]], Awaitable[str]],
+        spawn: Callable[[Awaitable[Any]], Any],
+        token_budget: int,
+        max_messages: int,
+        keep_recent: int,
+        compact_batch: int = 200
+    ):
+        self.db = db
+        self.summarize = summarize
+        self.spawn = spawn
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.keep_recent = keep_recent
+        self.compact_batch = compact_batch
+        self._summaries = LRUTTLCache(maxsize=2048, ttl=600)
+        self._compacting = set()
+        self.counters = {"assembled": 0, "truncated": 0, "compactions": 0, "compaction_errors": 0}
+
+    async def ensure_indexes(self):
+        await self.db.session_summaries.create_index("session_id", unique=True, name="session_id_unique")
+
+    async def get_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        summary = self._summaries.get(session_id)
+        if summary is None:
+            summary = await self.db.session_summaries.find_one({"session_id": session_id}, {"_id": 0}) or {}
+            self._summaries.set(session_id, summary)
+        return summary or None
+
+    async def build(self, session_id: str, agent_type: str, content: str, exclude_id: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """Return the upstream prompt for a new message and a hash of its context.
+
+        The hash is None when the session has no prior context, so first
+        messages stay shareable across sessions for caching and coalescing.
+        """
+        summary_doc = await self.get_summary(session_id)
+        summary = summary_doc.get("summary") if summary_doc else None
+
+        query = {"session_id": session_id, **after_position(summary_doc.get("covered_until") if summary_doc else None)}
+        if exclude_id:
+            query["id"] = {"$ne": exclude_id}
+        recent = await self.db.messages.find(
+            query, {"_id": 0, "id": 1, "role": 1, "content": 1, "timestamp": 1}
+        ).sort([("timestamp", -1), ("id", -1)]).limit(self.max_messages + 1).to_list(self.max_messages + 1)
+
+        budget = self.token_budget - (estimate_tokens(summary) if summary else 0)
+        turns, used = [], 0
+        for message in recent[:self.max_messages]:
+            cost = estimate_tokens(message["content"]) + 4
+            if used + cost > budget:
+                break
+            turns.append(message)
+            used += cost
+        turns.reverse()
+
+        self.counters["assembled"] += 1
+        if len(turns) < len(recent):
+            # Older turns no longer fit; fold them into the summary for next time
+            self.counters["truncated"] += 1
+            self.schedule_compaction(session_id, agent_type)
+
+        prompt = compose_prompt(summary, turns, content)
+        if prompt == content:
+            return prompt, None
+        return prompt, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def schedule_compaction(self, session_id: str, agent_type: str):
+        if session_id in self._compacting:
+            return
+        self._compacting.add(session_id)
+        self.spawn(self._compact(session_id, agent_type))
+
+    async def _compact(self, session_id: str, agent_type: str):
+        try:
+            summary_doc = await self.get_summary(session_id) or {}
+            query = {"session_id": session_id, **after_position(summary_doc.get("covered_until"))}
+            pending = await self.db.messages.find(
+                query, {"_id": 0, "id": 1, "role": 1, "content": 1, "timestamp": 1}
+            ).sort([("timestamp", 1), ("id", 1)]).limit(self.compact_batch + self.keep_recent).to_list(None)
+
+            # Always leave the newest turns verbatim
+            older = pending[:max(len(pending) - self.keep_recent, 0)][:self.compact_batch]
+            if not older:
+                return
+
+            summary = await self.summarize(agent_type, summary_doc.get("summary"), older)
+            last = older[-1]
+            await self.db.session_summaries.update_one(
+                {"session_id": session_id},
+                {
+                    "$set": {
+                        "summary": summary,
+                        "covered_until": {"timestamp": last["timestamp"], "id": last["id"]},
+                        "updated_at": datetime.now(timezone.utc),
+                    },
+                    "$inc": {"message_count": len(older)},
+                },
+                upsert=True
+            )
+            self._summaries.set(session_id, {
+                "session_id": session_id,
+                "summary": summary,
+                "covered_until": {"timestamp": last["timestamp"], "id": last["id"]},
+            })
+            self.counters["compactions"] += 1
+        except Exception as e:
+            self.counters["compaction_errors"] += 1
+            logger.error(f"Compacting history for session {session_id} failed: {e}")
+        finally:
+            self._compacting.discard(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "token_budget": self.token_budget,
+            "compacting": len(self._compacting),
+            **self.counters,
+        }
@@ -0,0 +1,89 @@
+"""Conditional GET and fast JSON responses for read endpoints.
+
+Read endpoints hand documents straight from Mongo to ``json_response``:
+they are serialized with orjson (when installed) without another pass
+through the pydantic response model, tagged with an ETag and answered with
+304 Not Modified when the client already holds that version.
+
+ETags are either a hash of the response body or, cheaper, a hash of a
+version key the caller already knows changes on every write (for example a
+session's ``updated_at`` and ``message_count``), which lets unchanged
+polls skip the main query entirely.
+"""
+import json
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def json_bytes(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from a response body or from the parts of a version key"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else json_bytes(part))
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()}"'
+
+def not_modified(request: Optional[Request], etag: str) -> bool:
+    if request is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+def not_modified_response(etag: str, cache_control: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Response:
+    response_headers = {**(headers or {}), "ETag": etag}
+    if cache_control:
+        response_headers["Cache-Control"] = cache_control
+    return Response(status_code=304, headers=response_headers)
+
+def json_response(
+    content: Any = None,
+    request: Optional[Request] = None,
+    etag: Optional[str] = None,
+    cache_control: Optional[str] = "no-cache",
+    headers: Optional[Dict[str, str]] = None,
+    body: Optional[bytes] = None
+) -> Response:
+    """Serialize ``content`` (or send a pre-serialized ``body``) with an ETag, or answer 304.
+
+    ``no-cache`` by default: clients may store the response but must
+    revalidate, which the ETag makes cheap.
+    """
+    if body is None:
+        body = json_bytes(content)
+    etag = etag or make_etag(body)
+    if not_modified(request, etag):
+        return not_modified_response(etag, cache_control, headers)
+
+    response_headers = {**(headers or {}), "ETag": etag}
+    if cache_control:
+        response_headers["Cache-Control"] = cache_control
+    return Response(content=body, media_type="application/json", headers=response_headers)
@@ -0,0 +1,167 @@
+"""Demo image rendering off the event loop.
+
+Drawing and PNG-encoding run in a process pool so they never block request
+handling. Rendered images are cached by a hash of the prompt and render
+parameters, and identical renders in flight are coalesced.
+"""
+import os
+import io
+import time
+import asyncio
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from singleflight import SingleFlight
+
+# Bump when the drawing code changes so cached renders are not reused
+RENDER_VERSION = 1
+
+def render_image(prompt: str, size: int = 512) -> bytes:
+    """Draw the demo placeholder image for a prompt and return it as PNG bytes"""
+    from PIL import Image, ImageDraw
+
+    # Create a square image, steel blue by default
+    img = Image.new('RGB', (size, size), color=(70, 130, 180))
+    draw = ImageDraw.Draw(img)
+
+    # Add prompt text to image
+    try:
+        prompt_short = prompt[:50] + "..." if len(prompt) > 50 else prompt
+        draw.text((20, 20), f"Generated: {prompt_short}", fill='white')
+        draw.text((20, size - 62), "Demo Mode - Meta AI Platform", fill='white')
+    except Exception:
+        # If text drawing fails, just use solid color
+        pass
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def make_thumbnail(data: bytes, size: int = 128) -> bytes:
+    """Downscale PNG bytes to fit within a size x size box"""
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    img.thumbnail((size, size))
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+def load_worker():
+    """Import PIL in a pool worker ahead of its first render"""
+    from PIL import Image  # noqa: F401
+
+def render_key(prompt: str, **params) -> str:
+    """Content address of a render: hash of the prompt and every render parameter"""
+    digest = hashlib.sha256()
+    digest.update(f"v{RENDER_VERSION}\x00{prompt}".encode("utf-8"))
+    for name in sorted(params):
+        digest.update(f"\x00{name}={params[name]}".encode("utf-8"))
+    return digest.hexdigest()
+
+class ByteLRU:
+    """LRU cache bounded by the total size of its values"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        previous = self._data.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._data[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._data)
+
+class ImageRenderer:
+    """Process pool plus content-addressed cache for rendered images"""
+
+    def __init__(self, workers: int, cache_bytes: int):
+        self.workers = workers
+        self.cache = ByteLRU(cache_bytes)
+        self._flights = SingleFlight()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.counters = {"hits": 0, "misses": 0, "renders": 0, "render_ms_total": 0.0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn keeps workers free of the parent's event loop and client threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def render(self, prompt: str, size: int = 512) -> bytes:
+        """Return PNG bytes for a prompt, rendering in the pool only on a cache miss"""
+        key = render_key(prompt, size=size)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.counters["hits"] += 1
+            return cached
+        self.counters["misses"] += 1
+
+        async def run():
+            started = time.monotonic()
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(self._get_pool(), render_image, prompt, size)
+            self.counters["renders"] += 1
+            self.counters["render_ms_total"] += (time.monotonic() - started) * 1000
+            self.cache.set(key, image)
+            return image
+
+        return await self._flights.do(key, run)
+
+    async def thumbnail(self, data: bytes, size: int = 128) -> bytes:
+        """Produce a thumbnail of an image in the process pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), make_thumbnail, data, size)
+
+    async def warm(self):
+        """Start the worker processes now instead of on the first render"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, load_worker) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        renders = self.counters["renders"]
+        return {
+            "pool_workers": self.workers,
+            "pool_started": self._pool is not None,
+            "cache_entries": len(self.cache),
+            "cache_bytes": self.cache.size,
+            "cache_max_bytes": self.cache.max_bytes,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "hits": self.counters["hits"],
+            "misses": self.counters["misses"],
+            "renders": renders,
+            "avg_render_ms": round(self.counters["render_ms_total"] / renders, 2) if renders else 0.0,
+            "coalesced": self._flights.counters["coalesced"],
+        }
+
+def default_workers() -> int:
+    return min(4, os.cpu_count() or 1)
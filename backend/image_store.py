@@ -0,0 +1,76 @@
+"""Binary storage for generated images in GridFS.
+
+Blobs are content-addressed: the GridFS filename is the SHA-256 of the bytes,
+so identical renders are stored once and the hash doubles as a strong ETag.
+"""
+import hashlib
+from typing import Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+class ImageStore:
+    """Content-addressed image blobs in a GridFS bucket"""
+
+    def __init__(self, db, bucket_name: str = "images"):
+        self.db = db
+        self.bucket_name = bucket_name
+        self._bucket: Optional[AsyncIOMotorGridFSBucket] = None
+
+    @property
+    def bucket(self) -> AsyncIOMotorGridFSBucket:
+        if self._bucket is None:
+            self._bucket = AsyncIOMotorGridFSBucket(self.db, bucket_name=self.bucket_name)
+        return self._bucket
+
+    async def ensure_indexes(self):
+        await self.db[f"{self.bucket_name}.files"].create_index("filename", unique=True, name="filename_unique")
+
+    async def exists(self, content_hash: str) -> bool:
+        files = self.db[f"{self.bucket_name}.files"]
+        return await files.count_documents({"filename": content_hash}, limit=1) > 0
+
+    async def put(self, data: bytes, content_type: str = "image/png") -> str:
+        """Store bytes unless an identical blob exists; returns the content hash"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        if not await self.exists(content_hash):
+            try:
+                await self.bucket.upload_from_stream(
+                    content_hash, data, metadata={"content_type": content_type}
+                )
+            except Exception:
+                # A concurrent upload of the same bytes won the unique index
+                if not await self.exists(content_hash):
+                    raise
+        return content_hash
+
+    async def open(self, content_hash: str):
+        """Open a blob for reading; returns a GridOut or None"""
+        try:
+            return await self.bucket.open_download_stream_by_name(content_hash)
+        except Exception:
+            return None
+
+def parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range ``Range: bytes=...`` header into inclusive (start, end).
+
+    Returns None when no range applies; raises ValueError when the range
+    cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None  # Multipart ranges are not supported; serve the full body
+    start_text, _, end_text = spec.partition("-")
+    if start_text == "":
+        suffix = int(end_text)
+        if suffix <= 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(length - suffix, 0), length - 1
+    else:
+        start = int(start_text)
+        end = int(end_text) if end_text else length - 1
+        end = min(end, length - 1)
+    if start >= length or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
@@ -0,0 +1,106 @@
+"""Import-time profile of the backend, for catching cold-start regressions.
+
+Imports ``server`` in a fresh interpreter under ``python -X importtime`` and
+reports the total import time, the slowest top-level packages and any
+module that is meant to load lazily but was imported eagerly.
+
+    python import_profile.py                      # report
+    python import_profile.py --budget-ms 1500     # exit 1 when over budget
+    python import_profile.py --json               # machine-readable
+
+The eager-import check always applies: the process exits 1 when one of
+LAZY_MODULES (or a submodule) is part of the import tree.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+BACKEND_DIR = Path(__file__).parent
+
+# Loaded on first use (or by the startup warm-up), never at import
+LAZY_MODULES = ("emergentintegrations", "litellm", "openai", "google", "boto3", "botocore", "PIL")
+
+def run_importtime(module: str) -> str:
+    env = {**os.environ}
+    # Import never connects, so any well-formed URL will do
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "import_profile")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return result.stderr
+
+def parse_importtime(output: str) -> List[Dict[str, Any]]:
+    """Rows of (module, depth, self_us, cumulative_us) in -X importtime order"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        stripped = name.lstrip(" ")
+        rows.append({
+            "module": stripped,
+            "depth": (len(name) - len(stripped) - 1) // 2,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return rows
+
+def summarize(rows: List[Dict[str, Any]], module: str, top: int) -> Dict[str, Any]:
+    by_package: Dict[str, int] = defaultdict(int)
+    for row in rows:
+        by_package[row["module"].split(".")[0]] += row["self_us"]
+    total = next((row["cumulative_us"] for row in rows if row["module"] == module and row["depth"] == 0), 0)
+    eager = sorted({
+        row["module"] for row in rows
+        if row["module"].split(".")[0] in LAZY_MODULES
+    })
+    return {
+        "module": module,
+        "total_ms": round(total / 1000, 1),
+        "modules": len(rows),
+        "packages": [
+            {"package": package, "ms": round(us / 1000, 1)}
+            for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]
+        ],
+        "eager_lazy_modules": eager,
+    }
+
+def print_report(report: Dict[str, Any]):
+    print(f"import {report['module']}: {report['total_ms']} ms across {report['modules']} modules")
+    print(f"{'package':<32} {'self ms':>9}")
+    for entry in report["packages"]:
+        print(f"{entry['package']:<32} {entry['ms']:>9.1f}")
+    if report["eager_lazy_modules"]:
+        print("Imported eagerly but meant to be lazy: " + ", ".join(report["eager_lazy_modules"][:20]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile backend import time")
+    parser.add_argument("--module", default="server", help="Module to import")
+    parser.add_argument("--top", type=int, default=15, help="Packages to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail when the import takes longer")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = summarize(parse_importtime(run_importtime(args.module)), args.module, args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failed = bool(report["eager_lazy_modules"])
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        print(f"Import time {report['total_ms']} ms is over the {args.budget_ms} ms budget", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Background processing of batch chat jobs.
+
+Jobs live in the ``jobs`` collection, one document per job with an entry per
+prompt. A fixed set of worker tasks picks job ids off an in-process queue and
+runs each job's pending items with bounded concurrency and retries. Finished
+items are flushed in groups: their messages with a single ``insert_many`` and
+their progress with a single job update.
+
+A worker claims a job with a lease (``lease_owner``, ``lease_until``) and
+renews it while the job runs, however long one item takes. Jobs whose lease
+has expired lost their process and are claimed again, and only the lease
+holder may record progress. Item messages have ids derived from the job and
+item, so items redone after a lost lease are not stored twice.
+"""
+import os
+import uuid
+import random
+import socket
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo.errors import BulkWriteError
+
+from write_buffer import DUPLICATE_KEY
+
+logger = logging.getLogger(__name__)
+
+# Job and item statuses
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+PENDING = "pending"
+
+TERMINAL_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+def item_message_id(job_id: str, index: int, role: str) -> str:
+    """Stable message id for one side of a job item's exchange"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"job:{job_id}:{index}:{role}"))
+
+class JobRunner:
+    """Worker pool that drains batch jobs from the jobs collection"""
+
+    def __init__(
+        self,
+        db,
+        execute: Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[str]],
+        make_documents: Callable[[Dict[str, Any], Dict[str, Any], str], List[Dict[str, Any]]],
+        workers: int = 2,
+        item_concurrency: int = 4,
+        max_retries: int = 2,
+        flush_size: int = 20,
+        lease_seconds: float = 60,
+        on_messages: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]]], Awaitable[None]]] = None
+    ):
+        self.db = db
+        self.execute = execute
+        self.make_documents = make_documents
+        self.workers = workers
+        self.item_concurrency = item_concurrency
+        self.max_retries = max_retries
+        self.flush_size = flush_size
+        self.lease_seconds = lease_seconds
+        self.on_messages = on_messages
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """Start the workers and pick up queued jobs and jobs whose worker went away"""
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        cursor = self.db.jobs.find({"status": QUEUED}, {"id": 1}).sort("created_at", 1)
+        async for job in cursor:
+            self.submit(job["id"])
+        self._tasks.append(asyncio.create_task(self._reclaim_expired()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id: str):
+        if job_id in self._queued:
+            return
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    def _expired(self, now: datetime) -> Dict[str, Any]:
+        # Running jobs without a lease were started before leases existed; go by their last progress
+        return {"status": RUNNING, "$or": [
+            {"lease_until": {"$lt": now}},
+            {"lease_until": None, "updated_at": {"$lt": now - timedelta(seconds=self.lease_seconds)}},
+        ]}
+
+    async def _reclaim_expired(self):
+        while True:
+            try:
+                cursor = self.db.jobs.find(self._expired(datetime.now(timezone.utc)), {"id": 1})
+                async for job in cursor:
+                    self.submit(job["id"])
+            except Exception as e:
+                logger.error(f"Job lease check failed: {e}")
+            await asyncio.sleep(self.lease_seconds / 2)
+
+    async def _renew_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            result = await self.db.jobs.update_one(
+                {"id": job_id, "status": RUNNING, "lease_owner": self.owner},
+                {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}}
+            )
+            if result.matched_count == 0:
+                return  # Cancelled, or the lease went to another worker
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    async def _worker(self, number: int):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {number} failed on job {job_id}: {e}")
+                await self.db.jobs.update_one(
+                    {"id": job_id, "lease_owner": self.owner},
+                    {"$set": {"status": FAILED, "error": str(e), "updated_at": datetime.now(timezone.utc)}}
+                )
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        # Claim the job; another worker (or process) may hold a live lease on it
+        now = datetime.now(timezone.utc)
+        job = await self.db.jobs.find_one_and_update(
+            {"id": job_id, "$or": [{"status": QUEUED}, self._expired(now)]},
+            {"$set": {
+                "status": RUNNING,
+                "lease_owner": self.owner,
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "updated_at": now,
+            }},
+            projection={"_id": 0}
+        )
+        if job is None:
+            return
+        renewer = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            await self._process(job)
+        finally:
+            renewer.cancel()
+
+    async def _process(self, job: Dict[str, Any]):
+        job_id = job["id"]
+
+        pending = [item for item in job["items"] if item["status"] == PENDING]
+        semaphore = asyncio.Semaphore(self.item_concurrency)
+        finished: List[Dict[str, Any]] = []
+        flush_lock = asyncio.Lock()
+        cancelled = False
+
+        async def flush():
+            nonlocal cancelled
+            async with flush_lock:
+                if not finished:
+                    return
+                batch = finished[:]
+                finished.clear()
+                documents = [
+                    doc for item in batch if item["status"] == COMPLETED
+                    for doc in self.make_documents(job, item, item["output"])
+                ]
+                if documents:
+                    documents = await self._insert_messages(documents)
+                    if self.on_messages is not None and documents:
+                        await self.on_messages(job, documents)
+                update = {f"items.{item['index']}": item for item in batch}
+                update["updated_at"] = datetime.now(timezone.utc)
+                result = await self.db.jobs.find_one_and_update(
+                    {"id": job_id, "lease_owner": self.owner},
+                    {
+                        "$set": update,
+                        "$inc": {
+                            "completed": sum(1 for item in batch if item["status"] == COMPLETED),
+                            "failed": sum(1 for item in batch if item["status"] == FAILED),
+                        },
+                    },
+                    projection={"status": 1}
+                )
+                # A lost lease stops this worker the same way a cancellation does
+                cancelled = result is None or result["status"] == CANCELLED
+
+        async def process(item):
+            async with semaphore:
+                if cancelled:
+                    return
+                item = dict(item)
+                item["started_at"] = datetime.now(timezone.utc)
+                for attempt in range(self.max_retries + 1):
+                    item["attempts"] = attempt + 1
+                    try:
+                        item["output"] = await self.execute(job, item)
+                        item["status"] = COMPLETED
+                        item["error"] = None
+                        break
+                    except Exception as e:
+                        item["status"] = FAILED
+                        item["error"] = str(e)
+                        if attempt < self.max_retries:
+                            delay = getattr(e, "retry_after", None) or 2 ** attempt
+                            await asyncio.sleep(delay + random.uniform(0, 1))
+                item["finished_at"] = datetime.now(timezone.utc)
+                finished.append(item)
+            if len(finished) >= self.flush_size:
+                await flush()
+
+        await asyncio.gather(*(process(item) for item in pending))
+        await flush()
+
+        if cancelled:
+            return
+        now = datetime.now(timezone.utc)
+        final = await self.db.jobs.find_one({"id": job_id}, {"failed": 1, "total": 1})
+        status = FAILED if final and final["failed"] == final["total"] else COMPLETED
+        await self.db.jobs.update_one(
+            {"id": job_id, "status": RUNNING, "lease_owner": self.owner},
+            {
+                "$set": {"status": status, "updated_at": now, "finished_at": now},
+                "$unset": {"lease_owner": "", "lease_until": ""},
+            }
+        )
+
+    async def _insert_messages(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert item messages; returns those not already stored by an earlier run of the item"""
+        try:
+            await self.db.messages.insert_many(documents, ordered=False)
+            return documents
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            duplicates = {error["index"] for error in errors}
+            return [document for index, document in enumerate(documents) if index not in duplicates]
@@ -0,0 +1,139 @@
+"""Two-tier response cache for agent LLM calls.
+
+An in-process LRU with TTL answers repeats from the same worker in
+microseconds; a MongoDB collection with a TTL index shares answers between
+workers and survives restarts.
+"""
+import re
+import time
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt so trivially different phrasings share a cache entry"""
+    return _WHITESPACE.sub(" ", prompt).strip().casefold()
+
+def make_cache_key(system_message: str, model: str, prompt: str, context_hash: Optional[str] = None) -> str:
+    """Build the cache key for an agent prompt"""
+    digest = hashlib.sha256()
+    for part in (system_message, model, normalize_prompt(prompt), context_hash or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class LRUTTLCache:
+    """Bounded LRU mapping whose entries expire after a fixed TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class ResponseCache:
+    """LRU front tier backed by a shared MongoDB collection"""
+
+    def __init__(self, collection, enabled: bool, maxsize: int, ttl_seconds: int):
+        self.collection = collection
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUTTLCache(maxsize, ttl_seconds)
+        self.counters = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "bypasses": 0, "errors": 0}
+
+    def enabled_for(self, agent_config: Dict[str, Any]) -> bool:
+        """Whether responses for this agent may be served from cache"""
+        return self.enabled and agent_config.get("cache", False)
+
+    async def ensure_indexes(self):
+        # Mongo removes expired entries on its own
+        await self.collection.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a cached response, promoting shared hits into memory"""
+        response = self.memory.get(key)
+        if response is not None:
+            self.counters["memory_hits"] += 1
+            return response
+
+        try:
+            document = await self.collection.find_one(
+                {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+                {"response": 1, "expires_at": 1}
+            )
+        except Exception:
+            self.counters["errors"] += 1
+            document = None
+
+        if document is None:
+            self.counters["misses"] += 1
+            return None
+
+        self.counters["shared_hits"] += 1
+        remaining = (document["expires_at"] - datetime.now(timezone.utc)).total_seconds()
+        self.memory.set(key, document["response"], ttl=max(remaining, 0))
+        return document["response"]
+
+    async def set(self, key: str, response: str, agent_type: str, model: str):
+        """Store a response in both tiers"""
+        self.memory.set(key, response)
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {
+                    "response": response,
+                    "agent_type": agent_type,
+                    "model": model,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                },
+                upsert=True
+            )
+        except Exception:
+            # The shared tier is best effort; the memory tier already has the entry
+            self.counters["errors"] += 1
+
+    def record_bypass(self):
+        self.counters["bypasses"] += 1
+
+    async def clear(self, agent_type: Optional[str] = None) -> int:
+        """Drop cached responses, optionally only those of one agent"""
+        self.memory.clear()
+        result = await self.collection.delete_many({"agent_type": agent_type} if agent_type else {})
+        return result.deleted_count
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["shared_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self.memory),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            **self.counters,
+        }
@@ -0,0 +1,60 @@
+"""Process-wide keep-alive HTTP pool for upstream LLM calls.
+
+LlmChat talks to the provider through litellm. Handing litellm one
+long-lived httpx client means every request reuses warm connections instead
+of paying for new TCP and TLS handshakes.
+"""
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class LlmHttpPool:
+    """Owns the shared httpx client that litellm uses for async calls"""
+
+    def __init__(self, max_connections: int, max_keepalive: int, keepalive_expiry: float, timeout: float):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.client: Optional[Any] = None
+
+    def start(self):
+        if self.client is not None:
+            return
+        try:
+            import httpx
+            import litellm
+        except ImportError:
+            logger.warning("httpx/litellm not available; upstream calls use per-call connections")
+            return
+
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+        )
+        litellm.aclient_session = self.client
+
+    async def stop(self):
+        if self.client is None:
+            return
+        try:
+            import litellm
+            if litellm.aclient_session is self.client:
+                litellm.aclient_session = None
+        except ImportError:
+            pass
+        await self.client.aclose()
+        self.client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.client is not None,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive,
+            "keepalive_expiry": self.keepalive_expiry,
+        }
@@ -0,0 +1,313 @@
+"""Async load generator and benchmark for the Meta AI Orchestrator API.
+
+Drives the app in-process (default) or a running server at a configurable
+concurrency, using the offline stub LLM so results do not depend on a
+provider. Reports p50/p95/p99 latency, throughput and error rate per
+endpoint, and can save a baseline and fail on regressions against it.
+
+Usage (from the backend directory):
+
+    python loadtest.py --in-memory --concurrency 32 --duration 30 --save-baseline baseline.json
+    python loadtest.py --in-memory --concurrency 32 --duration 30 --compare baseline.json
+    python loadtest.py --base-url http://localhost:8001 --concurrency 64 --requests 5000
+
+In-process runs use ``--mongo-url`` (a local mongod) or ``--in-memory``
+(mongomock). Against ``--base-url`` the server should be started with
+``LLM_BACKEND=stub`` for repeatable numbers.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+DEFAULT_MIX = "chat=4,stream=2,messages=2,sessions=1,agents=1,search=1"
+
+PROMPTS = [
+    "Yeni ürün lansmanı için bir sosyal medya planı hazırla",
+    "Instagram etkileşimini artırmak için üç öneri ver",
+    "Bu haftanın içerik takvimini özetle",
+    "Rakip analizi için hangi metrikleri izlemeliyiz?",
+    "Kampanya bütçesini kanallara nasıl dağıtmalıyız?",
+    "TikTok için kısa video fikirleri üret",
+]
+AGENTS = ["research", "content", "growth", "planner", "memory"]
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight or 1)
+    unknown = set(weights) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+class Recorder:
+    """Per-endpoint latencies and errors"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int]):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        key = str(status) if status is not None else "exception"
+        statuses = self.statuses.setdefault(endpoint, {})
+        statuses[key] = statuses.get(key, 0) + 1
+        if status is None or status >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {name: summarize(latencies, self.errors.get(name, 0), elapsed, self.statuses[name])
+                     for name, latencies in sorted(self.latencies.items())}
+        every = [value for latencies in self.latencies.values() for value in latencies]
+        total = summarize(every, sum(self.errors.values()), elapsed, {})
+        return {"endpoints": endpoints, "total": total}
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+def summarize(latencies: List[float], errors: int, elapsed: float, statuses: Dict[str, int]) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    count = len(ordered)
+    summary = {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0,
+    }
+    if statuses:
+        summary["statuses"] = statuses
+    return summary
+
+class VirtualUser:
+    """One simulated client with its own chat session"""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.agent_type = rng.choice(AGENTS)
+        self.session_id: Optional[str] = None
+
+    async def timed(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(endpoint, time.perf_counter() - started, None)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def setup(self):
+        response = await self.timed("create_session", "POST", "/api/sessions", json={
+            "name": f"Load test {uuid.uuid4().hex[:8]}",
+            "agent_type": self.agent_type,
+        })
+        if response is not None and response.status_code == 200:
+            self.session_id = response.json()["id"]
+        else:
+            self.session_id = str(uuid.uuid4())
+
+    def chat_payload(self) -> Dict[str, Any]:
+        return {"session_id": self.session_id, "agent_type": self.agent_type, "content": self.rng.choice(PROMPTS)}
+
+    async def chat(self):
+        await self.timed("chat", "POST", "/api/chat", json=self.chat_payload())
+
+    async def stream(self):
+        started = time.perf_counter()
+        try:
+            async with self.client.stream("POST", "/api/chat/stream", json=self.chat_payload()) as response:
+                async for _ in response.aiter_bytes():
+                    pass
+                status = response.status_code
+        except httpx.HTTPError:
+            status = None
+        self.recorder.record("stream", time.perf_counter() - started, status)
+
+    async def messages(self):
+        await self.timed("messages", "GET", f"/api/chat/{self.session_id}/messages", params={"latest": "true", "limit": 50})
+
+    async def sessions(self):
+        await self.timed("sessions", "GET", "/api/sessions")
+
+    async def agents(self):
+        await self.timed("agents", "GET", "/api/agents")
+
+    async def search(self):
+        query = self.rng.choice(PROMPTS).split()[1]
+        await self.timed("search", "GET", "/api/search", params={"q": query, "limit": 20})
+
+SCENARIOS = {
+    "chat": VirtualUser.chat,
+    "stream": VirtualUser.stream,
+    "messages": VirtualUser.messages,
+    "sessions": VirtualUser.sessions,
+    "agents": VirtualUser.agents,
+    "search": VirtualUser.search,
+}
+
+async def run_load(client: httpx.AsyncClient, concurrency: int, duration: Optional[float],
+                   total_requests: Optional[int], mix: Dict[str, int], seed: int) -> Dict[str, Any]:
+    recorder = Recorder()
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+    remaining = total_requests
+    users = [VirtualUser(client, recorder, random.Random(seed + index)) for index in range(concurrency)]
+    await asyncio.gather(*(user.setup() for user in users))
+
+    started = time.perf_counter()
+    stop_at = started + duration if duration else None
+
+    async def drive(user: VirtualUser):
+        nonlocal remaining
+        while True:
+            if stop_at is not None and time.perf_counter() >= stop_at:
+                return
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+            scenario = user.rng.choices(scenarios, weights)[0]
+            await SCENARIOS[scenario](user)
+
+    await asyncio.gather(*(drive(user) for user in users))
+    elapsed = time.perf_counter() - started
+    return {**recorder.summary(elapsed), "elapsed_seconds": round(elapsed, 2)}
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float = 5.0) -> List[str]:
+    """List regressions of latency, throughput or error rate against a baseline.
+
+    Latency must grow by more than ``tolerance`` and by at least
+    ``min_delta_ms``, so jitter on sub-millisecond endpoints is not flagged.
+    """
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if current[metric] > max(previous[metric] * (1 + tolerance), previous[metric] + min_delta_ms):
+                regressions.append(f"{name} {metric}: {previous[metric]} -> {current[metric]}")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} throughput_rps: {previous['throughput_rps']} -> {current['throughput_rps']}")
+        if current["error_rate"] > previous["error_rate"] + 0.01:
+            regressions.append(f"{name} error_rate: {previous['error_rate']} -> {current['error_rate']}")
+    return regressions
+
+def print_report(results: Dict[str, Any]):
+    header = f"{'endpoint':<16}{'requests':>10}{'rps':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(results["endpoints"].items()) + [("TOTAL", results["total"])]
+    for name, stats in rows:
+        print(f"{name:<16}{stats['requests']:>10}{stats['throughput_rps']:>10}{stats['error_rate']:>8.1%}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+@asynccontextmanager
+async def in_process_client(args):
+    """Import the app with the stub LLM and run its startup/shutdown hooks around the test"""
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_MS"] = str(args.stub_latency_ms)
+    os.environ["LLM_STUB_TOKENS_PER_SECOND"] = str(args.stub_tokens_per_second)
+    os.environ["LLM_STUB_ERROR_RATE"] = str(args.stub_error_rate)
+    os.environ["MONGO_URL"] = "mongomock://" if args.in_memory else args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    os.environ.setdefault("VECTOR_MEMORY_PATH", os.path.join(tempfile.mkdtemp(), "vector_memory.npz"))
+    if args.in_memory:
+        # mongomock has no $text support
+        os.environ["SEARCH_BACKEND"] = "memory"
+
+    from server import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            yield client
+
+@asynccontextmanager
+async def remote_client(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        yield client
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Meta AI Orchestrator load test")
+    parser.add_argument("--base-url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--in-memory", action="store_true", help="Use an in-memory Mongo stand-in (in-process only)")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="loadtest")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, help="Seconds to run (default 30 unless --requests is set)")
+    parser.add_argument("--requests", type=int, help="Total requests to send")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--stub-latency-ms", type=float, default=300)
+    parser.add_argument("--stub-tokens-per-second", type=float, default=50)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--save-baseline", help="Write the results as the new baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore latency changes smaller than this")
+    args = parser.parse_args(argv)
+    # Per-request client logs would swamp the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    duration = args.duration if args.duration or args.requests else 30.0
+    mix = parse_mix(args.mix)
+    make_client = remote_client if args.base_url else in_process_client
+
+    async with make_client(args) as client:
+        results = await run_load(client, args.concurrency, duration, args.requests, mix, args.seed)
+
+    results["config"] = {
+        "target": args.base_url or ("in-process/in-memory" if args.in_memory else "in-process"),
+        "concurrency": args.concurrency,
+        "duration": duration,
+        "requests": args.requests,
+        "mix": mix,
+        "stub_latency_ms": args.stub_latency_ms,
+        "stub_tokens_per_second": args.stub_tokens_per_second,
+    }
+    print_report(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,343 @@
+"""One-off data migrations for the Meta AI Orchestrator database.
+
+Usage (from the backend directory):
+
+    python migrations.py datetimes [--batch-size 1000] [--dry-run]
+    python migrations.py images [--dry-run]
+    python migrations.py sessions [--batch-size 1000] [--dry-run]
+    python migrations.py export OUTPUT [--session-id ID ...] [--agent-type TYPE] [--images]
+    python migrations.py import INPUT [--batch-size 500]
+    python migrations.py unique-ids [--dry-run]
+    python migrations.py analytics [--model openai/gpt-5] [--until YYYY-MM-DD] [--dry-run]
+
+``export`` and ``import`` move sessions between environments as gzip'd
+NDJSON ("-" for stdout/stdin); imports skip records that already exist.
+Imports run here bypass the server's in-memory search and vector indexes;
+use ``POST /api/import`` when those backends are enabled.
+"""
+import os
+import sys
+import json
+import uuid
+import base64
+import asyncio
+import argparse
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from image_store import ImageStore
+from sessions import message_preview
+from transfer import RECORD_TYPES, ensure_unique_ids, export_records, gzip_ndjson, import_records, read_ndjson
+from retention import SessionRetention
+from analytics import DEFAULT_MODEL_PRICES, estimate_cost
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("migrations")
+
+# Datetime fields that older releases stored as ISO strings
+DATETIME_FIELDS = {
+    "messages": ["timestamp"],
+    "chat_sessions": ["created_at", "updated_at"],
+    "generated_images": ["timestamp"],
+}
+
+def get_database():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True, tzinfo=timezone.utc)
+    return client, client[os.environ['DB_NAME']]
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse an ISO timestamp written by prepare_for_mongo, assuming UTC when naive"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+async def migrate_datetimes(db, batch_size: int, dry_run: bool):
+    """Convert string timestamps to native BSON dates with batched bulk writes"""
+    for collection_name, fields in DATETIME_FIELDS.items():
+        collection = db[collection_name]
+        query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        projection = {field: 1 for field in fields}
+
+        if dry_run:
+            count = await collection.count_documents(query)
+            logger.info(f"{collection_name}: {count} documents need conversion")
+            continue
+
+        converted = skipped = 0
+        operations = []
+        async for document in collection.find(query, projection, batch_size=batch_size):
+            update = {}
+            for field in fields:
+                value = document.get(field)
+                if not isinstance(value, str):
+                    continue
+                try:
+                    update[field] = parse_timestamp(value)
+                except ValueError:
+                    logger.warning(f"{collection_name} {document['_id']}: unparseable {field}={value!r}")
+            if not update:
+                skipped += 1
+                continue
+            operations.append(UpdateOne({"_id": document["_id"]}, {"$set": update}))
+            if len(operations) >= batch_size:
+                result = await collection.bulk_write(operations, ordered=False)
+                converted += result.modified_count
+                operations = []
+
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            converted += result.modified_count
+
+        logger.info(f"{collection_name}: converted {converted} documents, skipped {skipped}")
+
+async def migrate_images(db, dry_run: bool):
+    """Move inline base64 images out of generated_images documents into GridFS"""
+    query = {"image_base64": {"$exists": True}}
+    if dry_run:
+        count = await db.generated_images.count_documents(query)
+        logger.info(f"generated_images: {count} documents hold inline image data")
+        return
+
+    store = ImageStore(db)
+    moved = 0
+    async for document in db.generated_images.find(query, {"image_base64": 1, "id": 1}):
+        data = base64.b64decode(document["image_base64"])
+        content_hash = await store.put(data)
+        await db.generated_images.update_one(
+            {"_id": document["_id"]},
+            {
+                "$set": {
+                    "id": document.get("id") or str(uuid.uuid4()),
+                    "content_hash": content_hash,
+                    "content_type": "image/png",
+                    "size": len(data),
+                },
+                "$unset": {"image_base64": ""},
+            }
+        )
+        moved += 1
+
+    logger.info(f"generated_images: moved {moved} images to GridFS")
+
+async def backfill_sessions(db, batch_size: int, dry_run: bool):
+    """Fill message_count, last_message_preview and updated_at from each session's messages"""
+    pipeline = [
+        {"$sort": {"session_id": 1, "timestamp": 1, "id": 1}},
+        {"$group": {
+            "_id": "$session_id",
+            "count": {"$sum": 1},
+            "last_content": {"$last": "$content"},
+            "last_at": {"$last": "$timestamp"},
+        }},
+    ]
+    updated = 0
+    operations = []
+    async for group in db.messages.aggregate(pipeline, allowDiskUse=True):
+        if dry_run:
+            updated += 1
+            continue
+        operations.append(UpdateOne(
+            {"id": group["_id"]},
+            {
+                "$set": {
+                    "message_count": group["count"],
+                    "last_message_preview": message_preview(group["last_content"]),
+                },
+                "$max": {"updated_at": group["last_at"]},
+            }
+        ))
+        if len(operations) >= batch_size:
+            result = await db.chat_sessions.bulk_write(operations, ordered=False)
+            updated += result.matched_count
+            operations = []
+
+    if operations:
+        result = await db.chat_sessions.bulk_write(operations, ordered=False)
+        updated += result.matched_count
+
+    if dry_run:
+        logger.info(f"chat_sessions: {updated} sessions have messages to backfill")
+        return
+
+    # Sessions without any messages still need the counter
+    empty = await db.chat_sessions.update_many({"message_count": {"$exists": False}}, {"$set": {"message_count": 0}})
+    logger.info(f"chat_sessions: backfilled {updated} sessions, initialised {empty.modified_count} empty ones")
+
+async def export_sessions(db, output: str, session_ids, agent_type, images: bool, batch_size: int):
+    """Write sessions with their messages (and optionally images) as gzip'd NDJSON"""
+    # Only reads session_archives (archived sessions are exported without rehydrating), so no policies
+    archive = SessionRetention(db, {})
+    records = export_records(
+        db, ImageStore(db) if images else None, session_ids, agent_type, batch_size, archive=archive
+    )
+    stream = sys.stdout.buffer if output == "-" else open(output, "wb")
+    written = 0
+    try:
+        async for chunk in gzip_ndjson(records):
+            stream.write(chunk)
+            written += len(chunk)
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+    logger.info(f"export: wrote {written} compressed bytes to {output}")
+
+async def import_sessions(db, path: str, batch_size: int):
+    """Load an export file with insert_many batches, skipping ids already stored"""
+    async def chunks():
+        stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+        try:
+            while chunk := stream.read(1024 * 1024):
+                yield chunk
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+    counts = await import_records(db, read_ndjson(chunks()), ImageStore(db), batch_size)
+    for kind, values in counts.items():
+        logger.info(f"import: {kind} " + ", ".join(f"{name} {count}" for name, count in values.items()))
+
+async def dedupe_ids(db, dry_run: bool):
+    """Remove repeated ids (keeping the first stored copy) so the unique id indexes can be built"""
+    for collection_name, _ in RECORD_TYPES.values():
+        collection = db[collection_name]
+        pipeline = [
+            {"$group": {"_id": "$id", "copies": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]
+        removed = 0
+        async for group in collection.aggregate(pipeline, allowDiskUse=True):
+            extra = sorted(group["copies"])[1:]
+            if not dry_run:
+                await collection.delete_many({"_id": {"$in": extra}})
+            removed += len(extra)
+        logger.info(f"{collection_name}: {'would remove' if dry_run else 'removed'} {removed} duplicate documents")
+    if not dry_run:
+        await ensure_unique_ids(db)
+
+async def backfill_analytics(db, model: str, until: Optional[str], dry_run: bool):
+    """Rebuild analytics_daily message and token counts for days before live rollups began.
+
+    History carries no model or latency, so backfilled rows use model
+    "unknown" (priced as ``model``) and have no latency sketch. Values are
+    $set, not $inc, so the backfill can be re-run.
+    """
+    if until is None:
+        # The first day with live rollups is only partly covered by them; leave it alone
+        first_live = await db.analytics_daily.find_one({"backfilled": {"$ne": True}}, sort=[("day", 1)])
+        until = first_live["day"] if first_live else datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    until_at = datetime.fromisoformat(until).replace(tzinfo=timezone.utc)
+
+    pipeline = [
+        {"$match": {"timestamp": {"$lt": until_at}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                "agent_type": "$agent_type",
+                "role": "$role",
+            },
+            "count": {"$sum": 1},
+            "chars": {"$sum": {"$strLenCP": "$content"}},
+        }},
+    ]
+    rollups: Dict[Tuple[str, str], Dict[str, int]] = {}
+    async for group in db.messages.aggregate(pipeline, allowDiskUse=True):
+        key = (group["_id"]["day"], group["_id"]["agent_type"])
+        rollup = rollups.setdefault(key, {"user": 0, "assistant": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        role = group["_id"]["role"]
+        rollup[role] = rollup.get(role, 0) + group["count"]
+        # Same estimate as history.estimate_tokens, summed: chars // 4 + 1 per message
+        tokens = group["chars"] // 4 + group["count"]
+        rollup["prompt_tokens" if role == "user" else "completion_tokens"] += tokens
+
+    if dry_run:
+        logger.info(f"analytics_daily: {len(rollups)} day/agent rows to backfill before {until}")
+        return
+
+    prices = {**DEFAULT_MODEL_PRICES, **json.loads(os.environ.get('MODEL_PRICES', '{}'))}
+    operations = [
+        UpdateOne(
+            {"day": day, "agent_type": agent_type, "model": "unknown"},
+            {"$set": {
+                "messages": {"user": rollup["user"], "assistant": rollup["assistant"]},
+                "tokens": {"prompt": rollup["prompt_tokens"], "completion": rollup["completion_tokens"]},
+                "cost_usd": estimate_cost(prices, model, rollup["prompt_tokens"], rollup["completion_tokens"]),
+                "backfilled": True,
+                "updated_at": datetime.now(timezone.utc),
+            }},
+            upsert=True
+        )
+        for (day, agent_type), rollup in rollups.items()
+    ]
+    if operations:
+        await db.analytics_daily.bulk_write(operations, ordered=False)
+    logger.info(f"analytics_daily: backfilled {len(operations)} day/agent rows before {until}")
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Meta AI Orchestrator data migrations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    datetimes = subparsers.add_parser("datetimes", help="Convert ISO string timestamps to BSON dates")
+    datetimes.add_argument("--batch-size", type=int, default=1000)
+    datetimes.add_argument("--dry-run", action="store_true", help="Only count documents to convert")
+
+    images = subparsers.add_parser("images", help="Move inline base64 images into GridFS")
+    images.add_argument("--dry-run", action="store_true", help="Only count documents to convert")
+
+    sessions = subparsers.add_parser("sessions", help="Backfill session message counts and previews")
+    sessions.add_argument("--batch-size", type=int, default=1000)
+    sessions.add_argument("--dry-run", action="store_true", help="Only count sessions to backfill")
+
+    export = subparsers.add_parser("export", help="Export sessions and messages as gzip'd NDJSON")
+    export.add_argument("output", help="Output file, or - for stdout")
+    export.add_argument("--session-id", action="append", help="Only this session (repeatable)")
+    export.add_argument("--agent-type", help="Only sessions of this agent")
+    export.add_argument("--images", action="store_true", help="Include generated images and their bytes")
+    export.add_argument("--batch-size", type=int, default=500)
+
+    load = subparsers.add_parser("import", help="Import an export file; existing ids are skipped")
+    load.add_argument("input", help="Export file (gzip'd or plain NDJSON), or - for stdin")
+    load.add_argument("--batch-size", type=int, default=500)
+
+    unique_ids = subparsers.add_parser("unique-ids", help="Drop duplicate ids and build the unique id indexes")
+    unique_ids.add_argument("--dry-run", action="store_true", help="Only count duplicates")
+
+    analytics = subparsers.add_parser("analytics", help="Backfill usage rollups from stored messages")
+    analytics.add_argument("--model", default="openai/gpt-5", help="Model whose prices apply to backfilled tokens")
+    analytics.add_argument("--until", help="First day (YYYY-MM-DD) not to backfill; defaults to the first live rollup day")
+    analytics.add_argument("--dry-run", action="store_true", help="Only count rows to backfill")
+
+    args = parser.parse_args(argv)
+    client, db = get_database()
+    try:
+        if args.command == "datetimes":
+            await migrate_datetimes(db, args.batch_size, args.dry_run)
+        elif args.command == "images":
+            await migrate_images(db, args.dry_run)
+        elif args.command == "sessions":
+            await backfill_sessions(db, args.batch_size, args.dry_run)
+        elif args.command == "export":
+            await export_sessions(db, args.output, args.session_id, args.agent_type, args.images, args.batch_size)
+        elif args.command == "import":
+            await import_sessions(db, args.input, args.batch_size)
+        elif args.command == "unique-ids":
+            await dedupe_ids(db, args.dry_run)
+        elif args.command == "analytics":
+            await backfill_analytics(db, args.model, args.until, args.dry_run)
+    finally:
+        client.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,134 @@
+"""Concurrent execution of multi-agent plans.
+
+A plan is a DAG of steps. Every step starts as soon as the steps it depends
+on have completed, so independent agents run in parallel and the total
+latency follows the critical path instead of the sum of all calls.
+"""
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Step statuses
+COMPLETED = "completed"
+FAILED = "failed"
+TIMEOUT = "timeout"
+SKIPPED = "skipped"
+
+class PlanError(ValueError):
+    """Raised for plans that reference unknown steps or contain cycles"""
+
+def topological_order(steps) -> List[str]:
+    """Validate a plan and return its step ids in dependency order"""
+    by_id = {}
+    for step in steps:
+        if step.id in by_id:
+            raise PlanError(f"Duplicate step id '{step.id}'")
+        by_id[step.id] = step
+
+    for step in steps:
+        for dependency in step.depends_on:
+            if dependency not in by_id:
+                raise PlanError(f"Step '{step.id}' depends on unknown step '{dependency}'")
+
+    order, state = [], {}
+
+    def visit(step_id, path):
+        if state.get(step_id) == "done":
+            return
+        if state.get(step_id) == "visiting":
+            raise PlanError(f"Dependency cycle: {' -> '.join(path + [step_id])}")
+        state[step_id] = "visiting"
+        for dependency in by_id[step_id].depends_on:
+            visit(dependency, path + [step_id])
+        state[step_id] = "done"
+        order.append(step_id)
+
+    for step in steps:
+        visit(step.id, [])
+    return order
+
+def critical_path_ms(steps, results: Dict[str, Dict[str, Any]]) -> float:
+    """Length of the longest dependency chain, using measured step durations"""
+    finish = {}
+    for step_id in topological_order(steps):
+        step = next(s for s in steps if s.id == step_id)
+        start = max((finish[d] for d in step.depends_on), default=0.0)
+        finish[step_id] = start + (results.get(step_id, {}).get("duration_ms") or 0.0)
+    return round(max(finish.values(), default=0.0), 2)
+
+async def run_plan(
+    steps,
+    execute: Callable[[Any, Dict[str, str]], Awaitable[str]],
+    step_timeout: float,
+    total_timeout: float,
+    on_event: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Run every step of a plan, feeding each step the outputs of its dependencies.
+
+    ``execute(step, dependency_outputs)`` produces a step's output. A step
+    whose dependencies did not complete is skipped; steps still running when
+    ``total_timeout`` expires are cancelled and reported as timed out, so the
+    caller always gets partial results.
+    """
+    topological_order(steps)
+    by_id = {step.id: step for step in steps}
+    results: Dict[str, Dict[str, Any]] = {
+        step.id: {"id": step.id, "agent_type": step.agent_type, "status": None, "output": None,
+                  "error": None, "started_at": None, "duration_ms": None}
+        for step in steps
+    }
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def emit(event: str, result: Dict[str, Any]):
+        if on_event is not None:
+            try:
+                await on_event(event, dict(result))
+            except Exception:
+                pass  # Progress listeners must never break the run
+
+    async def run_step(step):
+        if step.depends_on:
+            await asyncio.wait([tasks[d] for d in step.depends_on])
+        result = results[step.id]
+        if any(results[d]["status"] != COMPLETED for d in step.depends_on):
+            result["status"] = SKIPPED
+            result["error"] = "Dependency did not complete"
+            await emit("step_skipped", result)
+            return
+
+        inputs = {d: results[d]["output"] for d in step.depends_on}
+        result["started_at"] = datetime.now(timezone.utc)
+        started = time.monotonic()
+        await emit("step_started", result)
+        try:
+            result["output"] = await asyncio.wait_for(execute(step, inputs), timeout=step.timeout or step_timeout)
+            result["status"] = COMPLETED
+        except asyncio.TimeoutError:
+            result["status"] = TIMEOUT
+            result["error"] = "Step timed out"
+        except asyncio.CancelledError:
+            result["status"] = TIMEOUT
+            result["error"] = "Plan timed out"
+            raise
+        except Exception as e:
+            result["status"] = FAILED
+            result["error"] = str(e)
+        finally:
+            result["duration_ms"] = round((time.monotonic() - started) * 1000, 2)
+        await emit(f"step_{result['status']}", result)
+
+    for step_id in topological_order(steps):
+        tasks[step_id] = asyncio.ensure_future(run_step(by_id[step_id]))
+
+    done, pending = await asyncio.wait(tasks.values(), timeout=total_timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    for result in results.values():
+        if result["status"] is None:
+            result["status"] = TIMEOUT
+            result["error"] = result["error"] or "Plan timed out"
+    return results
@@ -0,0 +1,77 @@
+"""Publish step for scheduled tasks with ``publish`` set.
+
+``PUBLISH_BACKEND`` picks the implementation: "local" records each post in
+the ``published_posts`` collection (a stand-in for development and tests),
+"webhook" POSTs it as JSON to ``PUBLISH_WEBHOOK_URL`` for the service that
+talks to the social platforms. Both take the run's idempotency key, so a
+run that is retried or reclaimed after a crash is published once.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+def post_payload(task: Dict[str, Any], output: str, key: str) -> Dict[str, Any]:
+    return {
+        "key": key,
+        "task_id": task["id"],
+        "agent_type": task["agent_type"],
+        "target": task.get("target"),
+        "content": output,
+        "scheduled_for": task["run_at"].isoformat(),
+    }
+
+class LocalPublisher:
+    """Stores posts in Mongo instead of sending them anywhere"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def start(self):
+        await self.db.published_posts.create_index("key", unique=True, name="key_unique")
+
+    async def stop(self):
+        pass
+
+    async def publish(self, task: Dict[str, Any], output: str, key: str) -> Dict[str, Any]:
+        post = {**post_payload(task, output, key), "published_at": datetime.now(timezone.utc)}
+        # $setOnInsert: publishing the same key again keeps the first post
+        await self.db.published_posts.update_one({"key": key}, {"$setOnInsert": post}, upsert=True)
+        return {"backend": "local", "key": key}
+
+class WebhookPublisher:
+    """POSTs posts to an external publishing service with an Idempotency-Key header"""
+
+    def __init__(self, url: str, timeout: float = 30, token: Optional[str] = None):
+        self.url = url
+        self.timeout = timeout
+        self.token = token
+        self.client = None
+
+    async def start(self):
+        import httpx
+        self.client = httpx.AsyncClient(timeout=self.timeout)
+
+    async def stop(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def publish(self, task: Dict[str, Any], output: str, key: str) -> Dict[str, Any]:
+        headers = {"Idempotency-Key": key}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        response = await self.client.post(self.url, json=post_payload(task, output, key), headers=headers)
+        response.raise_for_status()
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return {"backend": "webhook", "key": key, "status": response.status_code, "response": body}
+
+def create_publisher(backend: str, db, webhook_url: Optional[str] = None, webhook_token: Optional[str] = None):
+    if backend == "local":
+        return LocalPublisher(db)
+    if backend == "webhook":
+        if not webhook_url:
+            raise ValueError("PUBLISH_BACKEND=webhook needs PUBLISH_WEBHOOK_URL")
+        return WebhookPublisher(webhook_url, token=webhook_token)
+    raise ValueError(f"Unknown PUBLISH_BACKEND {backend!r}")
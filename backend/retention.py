@@ -0,0 +1,345 @@
+"""Session lifecycle: soft delete, background purging and the archive tier.
+
+Deleting a session only stamps ``deleted_at``; a background worker then
+removes its messages in small chunks so no request waits on a large
+``delete_many``. The same worker applies per-agent retention: sessions idle
+longer than ``archive_after_days`` have their messages compressed into
+per-session blobs in ``session_archives`` and removed from ``messages``,
+and sessions idle longer than ``delete_after_days`` are soft-deleted.
+
+Archived sessions are rehydrated on their next access. A session's
+``archive_state`` moves through::
+
+    (none) -> archiving -> purging -> archived -> rehydrating -> (none)
+
+Readers cancel an archive run that is still copying ("archiving"), wait out
+the short "purging" and "rehydrating" steps, and rehydrate "archived"
+sessions themselves. States left behind by a crashed process are picked up
+again once they go stale.
+"""
+import zlib
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from bson import Binary
+
+from history import after_position
+from http_cache import json_bytes, json_loads
+from transfer import Importer, parse_datetimes
+
+logger = logging.getLogger(__name__)
+
+# Session archive states
+ARCHIVING = "archiving"
+PURGING = "purging"
+ARCHIVED = "archived"
+REHYDRATING = "rehydrating"
+
+# States in which session_archives holds the complete history
+ARCHIVE_READABLE = (PURGING, ARCHIVED, REHYDRATING)
+
+class ArchiveBusy(Exception):
+    """Raised when a session stays mid-transition for longer than readers wait"""
+
+def encode_part(messages: List[Dict[str, Any]]) -> bytes:
+    return zlib.compress(b"\n".join(json_bytes(message) for message in messages), 6)
+
+def decode_part(data: bytes) -> List[Dict[str, Any]]:
+    messages = [json_loads(line) for line in zlib.decompress(data).split(b"\n") if line]
+    for message in messages:
+        parse_datetimes(message, ("timestamp",))
+    return messages
+
+class SessionRetention:
+    """Soft delete, chunked purging, per-agent retention and archive rehydration"""
+
+    def __init__(
+        self,
+        db,
+        policies: Dict[str, Dict[str, Optional[float]]],
+        interval: float = 300,
+        purge_chunk: int = 1000,
+        part_messages: int = 1000,
+        sessions_per_run: int = 50,
+        stale_after: float = 300,
+        wait_timeout: float = 10,
+        on_messages: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+    ):
+        self.db = db
+        self.policies = policies
+        self.interval = interval
+        self.purge_chunk = purge_chunk
+        self.part_messages = part_messages
+        self.sessions_per_run = sessions_per_run
+        self.stale_after = stale_after
+        self.wait_timeout = wait_timeout
+        self.on_messages = on_messages  # Called with each batch of rehydrated messages, e.g. to reindex them
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {
+            "purged_sessions": 0, "purged_messages": 0, "expired_sessions": 0,
+            "archived_sessions": 0, "archived_messages": 0, "cancelled_archives": 0,
+            "rehydrated_sessions": 0, "rehydrated_messages": 0, "runs": 0,
+        }
+
+    async def ensure_indexes(self):
+        await self.db.session_archives.create_index([("session_id", 1), ("part", 1)], unique=True, name="session_part")
+        await self.db.chat_sessions.create_index("deleted_at", sparse=True, name="deleted_at")
+        await self.db.chat_sessions.create_index("archive_state", sparse=True, name="archive_state")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        """Run a pass now, e.g. right after a delete"""
+        self._wakeup.set()
+
+    async def soft_delete(self, session_id: str) -> bool:
+        now = datetime.now(timezone.utc)
+        # Bumping updated_at changes the session list's ETag
+        result = await self.db.chat_sessions.update_one(
+            {"id": session_id, "deleted_at": None},
+            {"$set": {"deleted_at": now, "updated_at": now}}
+        )
+        if result.matched_count:
+            self.wake()
+        return result.matched_count > 0
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retention pass failed: {e}")
+
+    async def run_once(self):
+        """One pass: recover stale transitions, purge deleted sessions, expire, archive"""
+        self.counters["runs"] += 1
+        await self._recover()
+        await self._purge_deleted()
+        await self._expire()
+        await self._archive_idle()
+
+    # Purging
+
+    async def _delete_messages(self, query: Dict[str, Any]) -> int:
+        """Delete matching messages a chunk at a time, yielding to other work in between"""
+        deleted = 0
+        while True:
+            chunk = [
+                document["_id"] async for document in
+                self.db.messages.find(query, {"_id": 1}).limit(self.purge_chunk)
+            ]
+            if not chunk:
+                return deleted
+            result = await self.db.messages.delete_many({"_id": {"$in": chunk}})
+            deleted += result.deleted_count
+            await asyncio.sleep(0)
+
+    async def _purge_deleted(self):
+        # Sessions mid-transition are purged once the transition finishes (or is recovered)
+        sessions = self.db.chat_sessions.find(
+            {"deleted_at": {"$ne": None}, "archive_state": {"$nin": [ARCHIVING, PURGING, REHYDRATING]}},
+            {"_id": 0, "id": 1}
+        ).limit(self.sessions_per_run)
+        async for session in sessions:
+            purged = await self._delete_messages({"session_id": session["id"]})
+            await self.db.session_archives.delete_many({"session_id": session["id"]})
+            await self.db.session_summaries.delete_many({"session_id": session["id"]})
+            await self.db.chat_sessions.delete_one({"id": session["id"], "deleted_at": {"$ne": None}})
+            self.counters["purged_sessions"] += 1
+            self.counters["purged_messages"] += purged
+
+    async def _expire(self):
+        now = datetime.now(timezone.utc)
+        for agent_type, policy in self.policies.items():
+            if not policy.get("delete_after_days"):
+                continue
+            cutoff = now - timedelta(days=policy["delete_after_days"])
+            result = await self.db.chat_sessions.update_many(
+                {"agent_type": agent_type, "updated_at": {"$lt": cutoff}, "deleted_at": None},
+                {"$set": {"deleted_at": now, "updated_at": now}}
+            )
+            if result.modified_count:
+                self.counters["expired_sessions"] += result.modified_count
+                self.wake()
+
+    # Archiving
+
+    async def _archive_idle(self):
+        now = datetime.now(timezone.utc)
+        for agent_type, policy in self.policies.items():
+            if not policy.get("archive_after_days"):
+                continue
+            cutoff = now - timedelta(days=policy["archive_after_days"])
+            candidates = await self.db.chat_sessions.find(
+                {
+                    "agent_type": agent_type, "updated_at": {"$lt": cutoff},
+                    "archive_state": None, "deleted_at": None, "message_count": {"$gt": 0},
+                    # Reading a session does not move updated_at; this keeps it from bouncing straight back
+                    "rehydrated_at": {"$not": {"$gte": cutoff}},
+                },
+                {"_id": 0, "id": 1, "updated_at": 1}
+            ).limit(self.sessions_per_run).to_list(self.sessions_per_run)
+            for session in candidates:
+                await self.archive_session(session["id"], session["updated_at"])
+
+    async def _set_state(self, session_id: str, expected: Optional[str], state: Optional[str], **fields) -> bool:
+        now = datetime.now(timezone.utc)
+        update: Dict[str, Any] = {"$set": {"archive_state": state, "archive_state_at": now, **fields}}
+        if state is None:
+            update = {"$unset": {"archive_state": "", "archive_state_at": "", "archived_at": ""}}
+            if fields:
+                update["$set"] = fields
+        result = await self.db.chat_sessions.update_one({"id": session_id, "archive_state": expected}, update)
+        return result.modified_count > 0
+
+    async def archive_session(self, session_id: str, updated_at: datetime) -> bool:
+        """Move a session's messages into compressed parts; False when claimed or cancelled elsewhere"""
+        # Claim only if nothing happened to the session since it was picked
+        claimed = await self.db.chat_sessions.update_one(
+            {"id": session_id, "archive_state": None, "deleted_at": None, "updated_at": updated_at},
+            {"$set": {"archive_state": ARCHIVING, "archive_state_at": datetime.now(timezone.utc)}}
+        )
+        if not claimed.modified_count:
+            return False
+
+        archived_ids: List[str] = []
+        position = None
+        part = 0
+        while True:
+            batch = await self.db.messages.find(
+                {"session_id": session_id, **after_position(position)}, {"_id": 0}
+            ).sort([("timestamp", 1), ("id", 1)]).limit(self.part_messages).to_list(self.part_messages)
+            if not batch:
+                break
+            data = await asyncio.to_thread(encode_part, batch)
+            await self.db.session_archives.replace_one(
+                {"session_id": session_id, "part": part},
+                {
+                    "session_id": session_id, "part": part, "count": len(batch),
+                    "first_at": batch[0]["timestamp"], "last_at": batch[-1]["timestamp"], "data": Binary(data),
+                },
+                upsert=True
+            )
+            archived_ids.extend(message["id"] for message in batch)
+            position = {"timestamp": batch[-1]["timestamp"], "id": batch[-1]["id"]}
+            part += 1
+            # Keeps the claim fresh so recovery does not take it over
+            if not await self._set_state(session_id, ARCHIVING, ARCHIVING):
+                break
+
+        if not await self._set_state(session_id, ARCHIVING, PURGING):
+            # A reader needed the session (or it was deleted) while the copy ran
+            await self.db.session_archives.delete_many({"session_id": session_id})
+            self.counters["cancelled_archives"] += 1
+            return False
+
+        for start in range(0, len(archived_ids), self.purge_chunk):
+            await self.db.messages.delete_many(
+                {"session_id": session_id, "id": {"$in": archived_ids[start:start + self.purge_chunk]}}
+            )
+        await self._set_state(session_id, PURGING, ARCHIVED, archived_at=datetime.now(timezone.utc))
+        self.counters["archived_sessions"] += 1
+        self.counters["archived_messages"] += len(archived_ids)
+        return True
+
+    @staticmethod
+    def reads_archive(state: Optional[str]) -> bool:
+        return state in ARCHIVE_READABLE
+
+    async def iter_archived_messages(self, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        async for part in self.db.session_archives.find({"session_id": session_id}).sort("part", 1):
+            for message in await asyncio.to_thread(decode_part, part["data"]):
+                yield message
+
+    async def _rehydrate(self, session_id: str):
+        # Ids already in messages (from an interrupted run or a crash mid-purge) are skipped
+        importer = Importer(self.db, batch_size=self.part_messages, on_messages=self.on_messages)
+        async for message in self.iter_archived_messages(session_id):
+            await importer.add({"type": "message", "data": message})
+        counts = await importer.finish()
+        await self.db.session_archives.delete_many({"session_id": session_id})
+        await self._set_state(session_id, REHYDRATING, None, rehydrated_at=datetime.now(timezone.utc))
+        self.counters["rehydrated_sessions"] += 1
+        self.counters["rehydrated_messages"] += counts["message"]["inserted"]
+
+    async def ensure_hydrated(self, session_id: str, state: Optional[str] = None):
+        """Make sure a session's messages are in ``messages`` before it is read or extended.
+
+        ``state`` is the session's archive_state when the caller has already
+        read it. Raises ArchiveBusy if another process holds the session in
+        a transition for longer than ``wait_timeout``.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        if state is None:
+            state = await self._archive_state(session_id)
+        while state is not None:
+            if state == ARCHIVING:
+                # Still a copy: cancelling it leaves every message where it was
+                await self._set_state(session_id, ARCHIVING, None)
+            elif state == ARCHIVED and await self._set_state(session_id, ARCHIVED, REHYDRATING):
+                await self._rehydrate(session_id)
+                return
+            elif loop.time() >= deadline:
+                raise ArchiveBusy(f"Session {session_id} is busy ({state})")
+            else:
+                await asyncio.sleep(0.05)
+            state = await self._archive_state(session_id)
+
+    async def _archive_state(self, session_id: str) -> Optional[str]:
+        session = await self.db.chat_sessions.find_one(
+            {"id": session_id, "archive_state": {"$ne": None}}, {"_id": 0, "archive_state": 1}
+        )
+        return session["archive_state"] if session else None
+
+    async def _recover(self):
+        """Finish or undo transitions whose owner stopped refreshing them"""
+        stale = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+        for state in (ARCHIVING, PURGING, REHYDRATING):
+            while True:
+                session = await self.db.chat_sessions.find_one_and_update(
+                    {"archive_state": state, "archive_state_at": {"$lt": stale}},
+                    {"$set": {"archive_state_at": datetime.now(timezone.utc)}},
+                    projection={"_id": 0, "id": 1}
+                )
+                if session is None:
+                    break
+                session_id = session["id"]
+                logger.warning(f"Recovering session {session_id} left in archive state '{state}'")
+                if state == ARCHIVING:
+                    await self.db.session_archives.delete_many({"session_id": session_id})
+                    await self._set_state(session_id, ARCHIVING, None)
+                elif state == PURGING:
+                    # Every part was written before purging began; drop whatever is still live
+                    archived = [message["id"] async for message in self.iter_archived_messages(session_id)]
+                    for start in range(0, len(archived), self.purge_chunk):
+                        await self.db.messages.delete_many(
+                            {"session_id": session_id, "id": {"$in": archived[start:start + self.purge_chunk]}}
+                        )
+                    await self._set_state(session_id, PURGING, ARCHIVED, archived_at=datetime.now(timezone.utc))
+                else:
+                    await self._rehydrate(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policies": self.policies,
+            "interval_seconds": self.interval,
+            **self.counters,
+        }
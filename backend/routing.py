@@ -0,0 +1,181 @@
+"""Latency-aware model routing for agent LLM calls.
+
+Each agent has a primary model, fallback models and optionally a cheaper
+fast model for short prompts. Calls get a per-attempt timeout inside the
+request deadline, transient failures are retried with jittered backoff, and
+a slow primary call can be hedged with a duplicate request to the first
+fallback once it runs past the primary's observed p95 latency.
+"""
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+class UpstreamUnavailable(Exception):
+    """Raised when every model in an agent's route failed"""
+
+def split_model(name: str) -> Tuple[str, str]:
+    """Split a "provider/model" route name"""
+    provider, _, model = name.partition("/")
+    return provider, model
+
+class LatencyTracker:
+    """Recent latencies for one model, for percentile estimates"""
+
+    def __init__(self, window: int = 200):
+        self.samples: deque = deque(maxlen=window)
+        self.counters = {"calls": 0, "errors": 0, "timeouts": 0}
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "samples": len(self.samples),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            **self.counters,
+        }
+
+class ModelRouter:
+    """Chooses models per agent and drives retries, fallbacks and hedging"""
+
+    def __init__(
+        self,
+        call: Callable[[str, str, str, str], Awaitable[str]],
+        default_route: Dict[str, Any],
+        agent_routes: Dict[str, Dict[str, Any]],
+        attempt_timeout: float,
+        retries: int,
+        hedge_min_samples: int = 20
+    ):
+        self.call = call
+        self.routes = {agent: {**default_route, **route} for agent, route in agent_routes.items()}
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.hedge_min_samples = hedge_min_samples
+        self.trackers: Dict[str, LatencyTracker] = {}
+        self.counters = {"fast_routed": 0, "retries": 0, "fallbacks": 0, "hedges": 0, "hedges_won": 0}
+
+    def tracker(self, model: str) -> LatencyTracker:
+        if model not in self.trackers:
+            self.trackers[model] = LatencyTracker()
+        return self.trackers[model]
+
+    def candidates(self, agent_type: str, prompt: str) -> List[str]:
+        """Models to try for a prompt, in order"""
+        route = self.routes[agent_type]
+        first = route["primary"]
+        if route.get("fast") and len(prompt) <= route.get("short_prompt_chars", 0):
+            first = route["fast"]
+        models = [first] + [m for m in [route["primary"]] + route.get("fallbacks", []) if m != first]
+        return list(dict.fromkeys(models))
+
+    def primary_for(self, agent_type: str, prompt: str) -> str:
+        return self.candidates(agent_type, prompt)[0]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        tracker = self.tracker(model)
+        if len(tracker.samples) < self.hedge_min_samples:
+            return None
+        return tracker.percentile(0.95)
+
+    async def _attempt(self, model: str, agent_type: str, session_id: str, prompt: str, timeout: float) -> str:
+        tracker = self.tracker(model)
+        tracker.counters["calls"] += 1
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self.call(model, agent_type, session_id, prompt), timeout=timeout)
+        except asyncio.TimeoutError:
+            tracker.counters["timeouts"] += 1
+            raise
+        except Exception:
+            tracker.counters["errors"] += 1
+            raise
+        tracker.record(time.monotonic() - started)
+        return result
+
+    async def _hedged(self, model: str, hedge_model: Optional[str], agent_type: str, session_id: str,
+                      prompt: str, deadline: float) -> Tuple[str, str]:
+        """Call ``model``; if it outlives its p95, race a duplicate on ``hedge_model``"""
+        def timeout():
+            return max(min(self.attempt_timeout, deadline - time.monotonic()), 0)
+
+        primary = asyncio.ensure_future(self._attempt(model, agent_type, session_id, prompt, timeout()))
+        hedge = None
+        try:
+            delay = self.hedge_delay(model) if hedge_model else None
+            if delay is None:
+                return await asyncio.shield(primary), model
+
+            done, _ = await asyncio.wait({primary}, timeout=min(delay, timeout()))
+            if done:
+                return primary.result(), model
+
+            self.counters["hedges"] += 1
+            hedge = asyncio.ensure_future(self._attempt(hedge_model, agent_type, session_id, prompt, timeout()))
+            racers = {primary: model, hedge: hedge_model}
+            pending = set(racers)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedges_won"] += 1
+                        return task.result(), racers[task]
+                    error = task.exception()
+            raise error
+        finally:
+            # Whichever call lost the race (or was abandoned) is cancelled
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def complete(self, agent_type: str, session_id: str, prompt: str, deadline: float,
+                       models: Optional[List[str]] = None) -> Tuple[str, str]:
+        """Answer a prompt through the agent's route; returns the text and the model used.
+
+        ``models`` overrides the candidate list, e.g. when it was chosen from
+        the bare user message rather than the full prompt with context.
+        """
+        models = models or self.candidates(agent_type, prompt)
+        if models[0] != self.routes[agent_type]["primary"]:
+            self.counters["fast_routed"] += 1
+        hedge_model = models[1] if self.routes[agent_type].get("hedge") and len(models) > 1 else None
+
+        errors = []
+        for index, model in enumerate(models):
+            if index:
+                self.counters["fallbacks"] += 1
+            # The first model gets retries; fallbacks are tried once each
+            for attempt in range(self.retries + 1 if index == 0 else 1):
+                if time.monotonic() >= deadline:
+                    raise asyncio.TimeoutError()
+                try:
+                    return await self._hedged(model, hedge_model if index == 0 else None,
+                                              agent_type, session_id, prompt, deadline)
+                except Exception as e:
+                    errors.append(f"{model}: {type(e).__name__} {e}".strip())
+                    if attempt < (self.retries if index == 0 else 0):
+                        self.counters["retries"] += 1
+                        backoff = min(0.5 * 2 ** attempt, 4.0) * random.uniform(0.5, 1.5)
+                        await asyncio.sleep(min(backoff, max(deadline - time.monotonic(), 0)))
+
+        if time.monotonic() >= deadline:
+            raise asyncio.TimeoutError()
+        raise UpstreamUnavailable("; ".join(errors))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": {model: tracker.stats() for model, tracker in self.trackers.items()},
+            **self.counters,
+        }
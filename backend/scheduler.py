@@ -0,0 +1,301 @@
+"""Persistent scheduled agent tasks.
+
+Tasks live in ``scheduled_tasks``, one document per task with its next
+``run_at``. Each process keeps the tasks due within the next ``horizon``
+seconds in an in-memory timer heap and sleeps until the earliest one, so
+Mongo is only read when a task is submitted here and on a slow refresh
+(which also picks up tasks created by other processes and catches up on
+anything missed while no process was running).
+
+Due tasks are claimed with a single ``find_one_and_update`` that takes a
+lease, so across any number of uvicorn workers each run is executed by one
+of them. The lease is renewed while the task runs; a worker that dies
+leaves its lease to expire and the task is claimed again. Finishing is
+guarded on the lease owner, and the publish step gets a per-run
+idempotency key, so a reclaimed run never publishes twice.
+"""
+import os
+import heapq
+import random
+import socket
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Task statuses
+SCHEDULED = "scheduled"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+TERMINAL_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+def next_occurrence(run_at: datetime, every_seconds: Optional[float], now: datetime) -> Optional[datetime]:
+    """First occurrence after ``now``; runs missed while nothing was running collapse into the one just made"""
+    if not every_seconds:
+        return None
+    missed = max(0, int((now - run_at).total_seconds() // every_seconds))
+    return run_at + timedelta(seconds=every_seconds * (missed + 1))
+
+def publish_key(task: Dict[str, Any]) -> str:
+    """Stable per-run key; a reclaimed run publishes under the same key"""
+    return f"{task['id']}:{task.get('runs', 0)}"
+
+class TaskScheduler:
+    """Timer heap plus a bounded worker pool over the scheduled_tasks collection"""
+
+    def __init__(
+        self,
+        db,
+        execute: Callable[[Dict[str, Any]], Awaitable[str]],
+        publisher=None,
+        workers: int = 4,
+        lease_seconds: float = 120,
+        refresh_interval: float = 60,
+        horizon: float = 300,
+        max_retries: int = 2,
+        retry_delay: float = 30
+    ):
+        self.db = db
+        self.execute = execute
+        self.publisher = publisher
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.refresh_interval = refresh_interval
+        self.horizon = max(horizon, refresh_interval)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}  # Latest due time per task; older heap entries are skipped
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._running: Set[str] = set()
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.counters = {
+            "refreshes": 0, "claimed": 0, "claims_lost": 0, "completed": 0,
+            "retried": 0, "failed": 0, "published": 0, "leases_lost": 0,
+        }
+
+    async def ensure_indexes(self):
+        await self.db.scheduled_tasks.create_index("id", unique=True, name="id_unique")
+        await self.db.scheduled_tasks.create_index([("status", 1), ("run_at", 1)], name="status_run_at")
+        await self.db.scheduled_tasks.create_index([("status", 1), ("lease_until", 1)], name="status_lease_until")
+        await self.db.scheduled_tasks.create_index([("agent_type", 1), ("run_at", 1)], name="agent_type_run_at")
+
+    async def start(self):
+        """Start the timer and workers; overdue tasks and expired leases are picked up by the first refresh"""
+        if self.publisher is not None:
+            await self.publisher.start()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._timer()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.publisher is not None:
+            await self.publisher.stop()
+
+    def submit(self, task_id: str, run_at: datetime):
+        """Put a task on this process's timer heap if it is due within the horizon"""
+        due = run_at.timestamp()
+        if due > datetime.now(timezone.utc).timestamp() + self.horizon:
+            return  # A later refresh will load it
+        if self._due.get(task_id) == due:
+            return
+        self._due[task_id] = due
+        heapq.heappush(self._heap, (due, task_id))
+        self._wake.set()
+
+    def forget(self, task_id: str):
+        self._due.pop(task_id, None)
+
+    async def _refresh(self):
+        now = datetime.now(timezone.utc)
+        until = now + timedelta(seconds=self.horizon)
+        cursor = self.db.scheduled_tasks.find(
+            {"$or": [
+                {"status": SCHEDULED, "run_at": {"$lte": until}},
+                {"status": RUNNING, "lease_until": {"$lte": until}},
+            ]},
+            {"_id": 0, "id": 1, "status": 1, "run_at": 1, "lease_until": 1}
+        )
+        async for task in cursor:
+            if task["id"] in self._running:
+                continue
+            self.submit(task["id"], task["run_at"] if task["status"] == SCHEDULED else task["lease_until"])
+        self.counters["refreshes"] += 1
+
+    async def _timer(self):
+        next_refresh = 0.0
+        while True:
+            now = datetime.now(timezone.utc).timestamp()
+            if now >= next_refresh:
+                try:
+                    await self._refresh()
+                except Exception as e:
+                    logger.error(f"Scheduler refresh failed: {e}")
+                next_refresh = now + self.refresh_interval
+            while self._heap and self._heap[0][0] <= now:
+                due, task_id = heapq.heappop(self._heap)
+                if self._due.get(task_id) != due:
+                    continue  # Rescheduled or cancelled since it was pushed
+                del self._due[task_id]
+                if task_id not in self._queued and task_id not in self._running:
+                    self._queued.add(task_id)
+                    self._queue.put_nowait(task_id)
+            timeout = next_refresh - now
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - now)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, number: int):
+        while True:
+            task_id = await self._queue.get()
+            self._queued.discard(task_id)
+            self._running.add(task_id)
+            try:
+                await self._run(task_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduler worker {number} failed on task {task_id}: {e}")
+            finally:
+                self._running.discard(task_id)
+                self._queue.task_done()
+
+    async def _claim(self, task_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        claimed = {
+            "status": RUNNING,
+            "lease_owner": self.owner,
+            "lease_until": now + timedelta(seconds=self.lease_seconds),
+            "started_at": now,
+            "updated_at": now,
+        }
+        task = await self.db.scheduled_tasks.find_one_and_update(
+            {"id": task_id, "$or": [
+                {"status": SCHEDULED, "run_at": {"$lte": now}},
+                {"status": RUNNING, "lease_until": {"$lt": now}},
+            ]},
+            {"$set": claimed, "$inc": {"attempts": 1}},
+            projection={"_id": 0}
+        )
+        if task is None:
+            return None
+        task.update(claimed, attempts=task.get("attempts", 0) + 1)
+        return task
+
+    async def _renew_lease(self, task_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            now = datetime.now(timezone.utc)
+            result = await self.db.scheduled_tasks.update_one(
+                {"id": task_id, "status": RUNNING, "lease_owner": self.owner},
+                {"$set": {"lease_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now}}
+            )
+            if result.matched_count == 0:
+                return  # Cancelled, or the lease went to another worker
+
+    async def _finish(self, task_id: str, update: Dict[str, Any]) -> bool:
+        """Apply a final update if this process still holds the lease"""
+        update.setdefault("$set", {})["updated_at"] = datetime.now(timezone.utc)
+        update["$unset"] = {"lease_owner": "", "lease_until": ""}
+        result = await self.db.scheduled_tasks.update_one(
+            {"id": task_id, "status": RUNNING, "lease_owner": self.owner}, update
+        )
+        if result.matched_count == 0:
+            self.counters["leases_lost"] += 1
+            return False
+        return True
+
+    async def _run(self, task_id: str):
+        task = await self._claim(task_id)
+        if task is None:
+            self.counters["claims_lost"] += 1
+            return
+        self.counters["claimed"] += 1
+
+        renewer = asyncio.create_task(self._renew_lease(task_id))
+        try:
+            # A retried run reuses the output it already produced (and recorded)
+            output = task.get("output") if task.get("output_run") == task.get("runs", 0) else None
+            if output is None:
+                output = await self.execute(task)
+            # Also checks that the task was not cancelled (or reclaimed) before publishing
+            saved = await self.db.scheduled_tasks.update_one(
+                {"id": task_id, "status": RUNNING, "lease_owner": self.owner},
+                {"$set": {"output": output, "output_run": task.get("runs", 0)}}
+            )
+            if saved.matched_count == 0:
+                self.counters["leases_lost"] += 1
+                return
+            published = None
+            if task.get("publish") and self.publisher is not None:
+                published = await self.publisher.publish(task, output, publish_key(task))
+                self.counters["published"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._failed(task, e)
+            return
+        finally:
+            renewer.cancel()
+
+        now = datetime.now(timezone.utc)
+        fields = {"attempts": 0, "error": None, "last_run_at": now, "published": published}
+        next_at = next_occurrence(task["run_at"], task.get("every_seconds"), now)
+        if next_at is not None:
+            fields.update({"status": SCHEDULED, "run_at": next_at})
+        else:
+            fields.update({"status": COMPLETED, "finished_at": now})
+        if await self._finish(task_id, {"$set": fields, "$inc": {"runs": 1}}):
+            self.counters["completed"] += 1
+            if next_at is not None:
+                self.submit(task_id, next_at)
+
+    async def _failed(self, task: Dict[str, Any], error: Exception):
+        now = datetime.now(timezone.utc)
+        logger.error(f"Scheduled task {task['id']} failed (attempt {task['attempts']}): {error}")
+        fields: Dict[str, Any] = {"error": str(error)}
+        if task["attempts"] <= self.max_retries:
+            delay = getattr(error, "retry_after", None) or self.retry_delay * 2 ** (task["attempts"] - 1)
+            fields.update({"status": SCHEDULED, "run_at": now + timedelta(seconds=delay + random.uniform(0, 1))})
+            counter = "retried"
+        else:
+            next_at = next_occurrence(task["run_at"], task.get("every_seconds"), now)
+            if next_at is not None:
+                # A recurring task gives up on this run only
+                fields.update({"status": SCHEDULED, "run_at": next_at, "attempts": 0})
+            else:
+                fields.update({"status": FAILED, "finished_at": now})
+            counter = "failed"
+        update: Dict[str, Any] = {"$set": fields}
+        if counter == "failed":
+            update["$inc"] = {"runs": 1}
+        if await self._finish(task["id"], update):
+            self.counters[counter] += 1
+            if fields["status"] == SCHEDULED:
+                self.submit(task["id"], fields["run_at"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "timers": len(self._due),
+            "queued": self._queue.qsize(),
+            "running": len(self._running),
+            "workers": self.workers,
+            **self.counters,
+        }
@@ -0,0 +1,238 @@
+"""Full-text search over stored messages.
+
+Production deployments use a Mongo text index on ``messages.content``. For
+the mock/dev setup, where the database may not support ``$text``, an
+in-process inverted index with BM25 ranking can be used instead; it catches
+up incrementally from the ``messages`` collection before each search.
+
+Catch-up follows insertion order (``_id``), not message timestamps: a
+message is often stored well after its timestamp was taken (streamed
+replies, job items, imports, rehydrated archives).
+
+Soft-deleted sessions keep their messages until the background purge
+removes them; both backends leave them out of results in the meantime.
+"""
+import re
+import math
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.casefold()) if len(token) > 1]
+
+def inserted_since(position: Optional[ObjectId], settle_seconds: float) -> Dict[str, Any]:
+    """Match messages inserted after ``position``, the newest ``_id`` already indexed.
+
+    ``_id``s are only ordered to the second across processes, and an insert
+    can still be in flight when a newer one is visible, so the last
+    ``settle_seconds`` before the position are read again; callers skip ids
+    they already hold.
+    """
+    if position is None:
+        return {}
+    return {"_id": {"$gt": ObjectId.from_datetime(position.generation_time - timedelta(seconds=settle_seconds))}}
+
+def matches_filters(doc: Dict[str, Any], agent_type: Optional[str], session_id: Optional[str],
+                    since: Optional[datetime], until: Optional[datetime], exclude_sessions: Collection[str] = ()) -> bool:
+    if agent_type and doc["agent_type"] != agent_type:
+        return False
+    if session_id and doc["session_id"] != session_id:
+        return False
+    if doc["session_id"] in exclude_sessions:
+        return False
+    if since and doc["timestamp"] < since:
+        return False
+    if until and doc["timestamp"] >= until:
+        return False
+    return True
+
+class InvertedIndex:
+    """Term -> message postings with BM25 scoring"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0
+
+    def add(self, message: Dict[str, Any]):
+        if message["id"] in self.docs:
+            return
+        tokens = tokenize(message["content"])
+        for token in tokens:
+            postings = self.postings[token]
+            postings[message["id"]] = postings.get(message["id"], 0) + 1
+        self.docs[message["id"]] = {
+            "session_id": message["session_id"],
+            "agent_type": message["agent_type"],
+            "timestamp": message["timestamp"],
+            "length": len(tokens),
+            "terms": set(tokens),
+        }
+        self.total_length += len(tokens)
+
+    def remove(self, message_id: str):
+        doc = self.docs.pop(message_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        for token in doc["terms"]:
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(message_id, None)
+                if not postings:
+                    del self.postings[token]
+
+    def remove_session(self, session_id: str):
+        for message_id in [mid for mid, doc in self.docs.items() if doc["session_id"] == session_id]:
+            self.remove(message_id)
+
+    def search(self, query: str, **filters) -> List[Tuple[str, float]]:
+        """Rank matching message ids, best first (newest first on ties)"""
+        if not self.docs:
+            return []
+        average_length = self.total_length / len(self.docs) or 1
+        scores: Dict[str, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for message_id, frequency in postings.items():
+                doc = self.docs[message_id]
+                if not matches_filters(doc, **filters):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * doc["length"] / average_length)
+                scores[message_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], -self.docs[item[0]]["timestamp"].timestamp()))
+
+class MessageSearch:
+    """Searches messages through a Mongo text index or the in-process index"""
+
+    def __init__(
+        self,
+        db,
+        backend: str = "mongo",
+        language: str = "turkish",
+        sync_batch: int = 5000,
+        settle_seconds: float = 5
+    ):
+        if backend not in ("mongo", "memory"):
+            raise ValueError(f"Unknown search backend '{backend}'")
+        self.db = db
+        self.backend = backend
+        self.language = language
+        self.sync_batch = sync_batch
+        self.settle_seconds = settle_seconds
+        self.index = InvertedIndex() if backend == "memory" else None
+        self._position: Optional[ObjectId] = None
+        self.counters = {"queries": 0}
+
+    async def ensure_indexes(self):
+        if self.backend == "mongo":
+            await self.db.messages.create_index(
+                [("content", "text")], name="content_text", default_language=self.language
+            )
+
+    async def sync(self):
+        """Index messages stored since the last sync (InvertedIndex.add skips ids it already has)"""
+        query = inserted_since(self._position, self.settle_seconds)
+        while True:
+            batch = await self.db.messages.find(
+                query, {"id": 1, "session_id": 1, "agent_type": 1, "content": 1, "timestamp": 1}
+            ).sort("_id", 1).limit(self.sync_batch).to_list(self.sync_batch)
+            for message in batch:
+                self.index.add(message)
+            if batch:
+                self._position = max(self._position or batch[-1]["_id"], batch[-1]["_id"])
+                query = {"_id": {"$gt": batch[-1]["_id"]}}
+            if len(batch) < self.sync_batch:
+                return
+
+    def add_backfilled(self, messages: List[Dict[str, Any]]):
+        """Index messages as soon as they are inserted (imports, rehydrated archives), ahead of the next sync"""
+        if self.index is None:
+            return
+        for message in messages:
+            self.index.add(message)
+
+    def forget_session(self, session_id: str):
+        if self.index is not None:
+            self.index.remove_session(session_id)
+
+    async def _deleted_sessions(self) -> List[str]:
+        """Sessions soft-deleted but not purged yet; the purge keeps this list short"""
+        return await self.db.chat_sessions.distinct("id", {"deleted_at": {"$ne": None}})
+
+    async def search(
+        self,
+        query: str,
+        agent_type: Optional[str] = None,
+        session_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        offset: int = 0,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Return a page of matching messages with a ``score`` and whether more follow"""
+        self.counters["queries"] += 1
+        deleted = await self._deleted_sessions()
+        if session_id in deleted:
+            return [], False
+        if self.backend == "memory":
+            return await self._search_memory(query, agent_type, session_id, since, until, offset, limit, set(deleted))
+
+        filters: Dict[str, Any] = {"$text": {"$search": query}}
+        if agent_type:
+            filters["agent_type"] = agent_type
+        if session_id:
+            filters["session_id"] = session_id
+        elif deleted:
+            filters["session_id"] = {"$nin": deleted}
+        time_range = {}
+        if since:
+            time_range["$gte"] = since
+        if until:
+            time_range["$lt"] = until
+        if time_range:
+            filters["timestamp"] = time_range
+
+        score = {"$meta": "textScore"}
+        # Fetch one extra document to know whether another page exists
+        hits = await self.db.messages.find(filters, {"_id": 0, "score": score}).sort(
+            [("score", score), ("timestamp", -1)]
+        ).skip(offset).limit(limit + 1).to_list(limit + 1)
+        return hits[:limit], len(hits) > limit
+
+    async def _search_memory(self, query, agent_type, session_id, since, until, offset, limit, deleted):
+        await self.sync()
+        ranked = self.index.search(
+            query, agent_type=agent_type, session_id=session_id, since=since, until=until, exclude_sessions=deleted
+        )
+        page = ranked[offset:offset + limit]
+        if not page:
+            return [], False
+
+        scores = dict(page)
+        documents = await self.db.messages.find({"id": {"$in": list(scores)}}, {"_id": 0}).to_list(len(scores))
+        # Messages deleted since they were indexed drop out of the results
+        found = {doc["id"] for doc in documents}
+        for message_id in set(scores) - found:
+            self.index.remove(message_id)
+        hits = sorted(({**doc, "score": scores[doc["id"]]} for doc in documents), key=lambda doc: -doc["score"])
+        return hits, len(ranked) > offset + limit
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"backend": self.backend, **self.counters}
+        if self.index is not None:
+            stats.update({"indexed_messages": len(self.index.docs), "terms": len(self.index.postings)})
+        return stats
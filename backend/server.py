@@ -1,34 +1,123 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Query, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import json
+import time
+import asyncio
 import logging
+import threading
 import base64
+import hashlib
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple, Literal
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-from openai import AsyncOpenAI
+from llm_cache import ResponseCache, make_cache_key
+from singleflight import SingleFlight
+from admission import AdmissionController, Overloaded
+from routing import ModelRouter, UpstreamUnavailable, split_model
+from orchestrator import PlanError, run_plan, critical_path_ms
+from image_render import ImageRenderer, default_workers
+from image_store import ImageStore, parse_range
+from history import HistoryAssembler, format_turns, estimate_tokens
+from llm_pool import LlmHttpPool
+from jobs import JobRunner, TERMINAL_STATUSES, CANCELLED, QUEUED, PENDING, item_message_id
+from ws_channel import ChannelConnection
+from search import MessageSearch
+from vector_memory import VectorMemory
+from metrics import registry, stage, MetricsMiddleware, MongoCommandTimer
+from stub_llm import StubLlmChat, StubUserMessage
+from write_buffer import WriteBehindBuffer
+from sessions import INTERNAL_FIELDS, activity_update
+from http_cache import json_bytes, json_response, make_etag, not_modified, not_modified_response
+from transfer import ensure_unique_ids, export_records, gzip_ndjson, import_records, read_ndjson
+from retention import ArchiveBusy, SessionRetention
+from analytics import AnalyticsRollup, DEFAULT_MODEL_PRICES
+from scheduler import TaskScheduler, TERMINAL_STATUSES as TASK_TERMINAL_STATUSES, CANCELLED as TASK_CANCELLED, SCHEDULED
+from publishers import create_publisher
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
+def create_mongo_client(url: str):
+    """Connect to MongoDB; "mongomock://" gives an in-memory database for offline load tests"""
+    if url.startswith("mongomock://"):
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient(tz_aware=True)
+    # connect=False: no server monitoring threads until the first operation (index creation at startup)
+    return AsyncIOMotorClient(url, tz_aware=True, tzinfo=timezone.utc, connect=False, event_listeners=[MongoCommandTimer()])
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = create_mongo_client(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Initialize LLM integrations
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+LLM_PROVIDER = "openai"
+LLM_MODEL = "gpt-5"
+LLM_SUMMARY_MODEL = os.environ.get('LLM_SUMMARY_MODEL', LLM_MODEL)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'emergent')  # "stub" answers offline, for load tests
+
+# Shared keep-alive connections for upstream calls
+llm_http_pool = LlmHttpPool(
+    max_connections=int(os.environ.get('LLM_HTTP_MAX_CONNECTIONS', '100')),
+    max_keepalive=int(os.environ.get('LLM_HTTP_MAX_KEEPALIVE', '20')),
+    keepalive_expiry=float(os.environ.get('LLM_HTTP_KEEPALIVE_EXPIRY', '60')),
+    timeout=float(os.environ.get('LLM_DEADLINE_SECONDS', '90'))
+)
+
+# Slow first-use setup done in the background right after startup: "llm"
+# (SDK import and connection pool), "images" (render worker processes)
+STARTUP_WARMUP = [step.strip() for step in os.environ.get('STARTUP_WARMUP', 'llm').split(',') if step.strip()]
+warmup_state: Dict[str, Any] = {"status": "pending" if STARTUP_WARMUP else "disabled", "steps": {}}
+
+# Response cache (opt-in globally, then per agent via the "cache" flag in AGENTS_CONFIG)
+response_cache = ResponseCache(
+    db.llm_cache,
+    enabled=os.environ.get('LLM_CACHE_ENABLED', 'false').lower() == 'true',
+    maxsize=int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '1024')),
+    ttl_seconds=int(os.environ.get('LLM_CACHE_TTL_SECONDS', '3600'))
+)
+CACHE_HEADER = "X-LLM-Cache"
+
+# Identical concurrent prompts share one upstream call
+llm_flights = SingleFlight()
+
+# Streaming configuration
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', '24'))
+SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', '10'))
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Disable proxy buffering so tokens flush immediately
+}
+
+# Message history pagination
+MESSAGES_PAGE_DEFAULT = int(os.environ.get('MESSAGES_PAGE_DEFAULT', '100'))
+MESSAGES_PAGE_MAX = int(os.environ.get('MESSAGES_PAGE_MAX', '500'))
+SESSIONS_PAGE_DEFAULT = int(os.environ.get('SESSIONS_PAGE_DEFAULT', '50'))
+SESSIONS_PAGE_MAX = int(os.environ.get('SESSIONS_PAGE_MAX', '200'))
 
 # Agent Configuration
 AGENTS_CONFIG = {
@@ -36,70 +125,241 @@ AGENTS_CONFIG = {
         "name": "Research Agent",
         "role": "Araştırmacı",
         "system_message": "Sen bir araştırmacı ajansın. Web araştırması, trend analizi, rakip incelemesi ve veri toplama konularında uzmanısın.",
-        "capabilities": ["Web araştırma", "Trend/SEO analizi", "Rakip inceleme", "Veri toplama"]
+        "capabilities": ["Web araştırma", "Trend/SEO analizi", "Rakip inceleme", "Veri toplama"],
+        "cache": True
     },
     "design": {
         "name": "Design Agent", 
         "role": "Tasarımcı",
         "system_message": "Sen bir tasarımcı ajansın. Görsel üretim, tasarım önerileri ve yaratıcı içerik oluşturma konularında uzmanısın.",
-        "capabilities": ["DALL-E/Midjourney görsel üretim", "Post & Story şablonları", "Canva entegrasyonu"]
+        "capabilities": ["DALL-E/Midjourney görsel üretim", "Post & Story şablonları", "Canva entegrasyonu"],
+        "cache": False
     },
     "content": {
         "name": "Content Agent",
         "role": "İçerik Üretici", 
         "system_message": "Sen bir içerik üretim uzmanısın. Metin yazma, başlık oluşturma ve çok dilli içerik üretimi konularında uzmanısın.",
-        "capabilities": ["Metin yazma", "Başlık & hashtag setleri", "Çok dilli içerik üretimi"]
+        "capabilities": ["Metin yazma", "Başlık & hashtag setleri", "Çok dilli içerik üretimi"],
+        "cache": True
     },
     "code": {
         "name": "Code Agent",
         "role": "Yazılımcı",
         "system_message": "Sen bir yazılım geliştirici ajansın. Kod üretimi, API entegrasyonu ve otomasyon kurma konularında uzmanısın.",
-        "capabilities": ["Kod üretimi", "API entegrasyonu", "Bot geliştirme", "Otomasyon kurma"]
+        "capabilities": ["Kod üretimi", "API entegrasyonu", "Bot geliştirme", "Otomasyon kurma"],
+        "cache": False
     },
     "planner": {
         "name": "Planner Agent",
         "role": "Planlayıcı", 
         "system_message": "Sen bir planlama uzmanısın. Görev dağılımı, zaman yönetimi ve strateji geliştirme konularında uzmanısın.",
-        "capabilities": ["Paylaşım takvimi", "Saat optimizasyonu", "Görev dağılımı"]
+        "capabilities": ["Paylaşım takvimi", "Saat optimizasyonu", "Görev dağılımı"],
+        "cache": False
     },
     "publisher": {
         "name": "Publisher Agent",
         "role": "Yayıncı",
         "system_message": "Sen bir yayın uzmanısın. Sosyal medya yönetimi ve otomatik paylaşım konularında uzmanısın.",
-        "capabilities": ["Instagram/YouTube/TikTok entegrasyonu", "Otomatik paylaşım", "Fallback & hata yönetimi"]
+        "capabilities": ["Instagram/YouTube/TikTok entegrasyonu", "Otomatik paylaşım", "Fallback & hata yönetimi"],
+        "cache": False
     },
     "report": {
         "name": "Report Agent", 
         "role": "Raporlayıcı",
         "system_message": "Sen bir analiz ve raporlama uzmanısın. Performans analizi ve KPI raporları oluşturma konularında uzmanısın.",
-        "capabilities": ["Performans analizi", "KPI raporları", "Öneri geliştirme"]
+        "capabilities": ["Performans analizi", "KPI raporları", "Öneri geliştirme"],
+        "cache": False,
+        "analytics": True
     },
     "memory": {
         "name": "Memory Agent",
         "role": "Öğrenme & Hafıza",
         "system_message": "Sen öğrenme ve hafıza uzmanısın. Geçmiş görevleri kaydetme ve sistem optimizasyonu konularında uzmanısın.",
-        "capabilities": ["Geçmiş görevleri kaydetme", "Kendi kendini geliştirme", "Hafıza optimizasyonu"]
+        "capabilities": ["Geçmiş görevleri kaydetme", "Kendi kendini geliştirme", "Hafıza optimizasyonu"],
+        "cache": False,
+        "recall": True
     },
     "cost": {
         "name": "Cost Agent",
         "role": "Maliyet Kontrol",
         "system_message": "Sen maliyet optimizasyon uzmanısın. Bütçe yönetimi ve kaynak optimizasyonu konularında uzmanısın.",
-        "capabilities": ["Ücretsiz kotaları zorlama", "Ücretli modelleri optimize etme", "Bütçe takibi"]
+        "capabilities": ["Ücretsiz kotaları zorlama", "Ücretli modelleri optimize etme", "Bütçe takibi"],
+        "cache": False,
+        "analytics": True
     },
     "growth": {
         "name": "Growth Agent",
         "role": "Büyüme & Pazarlama",
         "system_message": "Sen büyüme ve pazarlama uzmanısın. Trend yakalama ve viral içerik geliştirme konularında uzmanısın.",
-        "capabilities": ["Trend yakalama", "Viral içerik önerileri", "Funnel geliştirme"]
+        "capabilities": ["Trend yakalama", "Viral içerik önerileri", "Funnel geliştirme"],
+        "cache": True
     },
     "safety": {
         "name": "Safety Agent",
         "role": "Güvenlik & Uyum",
         "system_message": "Sen güvenlik ve uyum uzmanısın. Platform kuralları ve veri güvenliği konularında uzmanısın.",
-        "capabilities": ["Platform kural kontrolü", "Telif hakkı taraması", "Gizlilik & veri güvenliği"]
+        "capabilities": ["Platform kural kontrolü", "Telif hakkı taraması", "Gizlilik & veri güvenliği"],
+        "cache": False
     }
 }
 
+# Model routing; agents may override any of these keys with a "routing"
+# entry in AGENTS_CONFIG. Models are named "provider/model".
+DEFAULT_MODEL_ROUTE = {
+    "primary": f"{LLM_PROVIDER}/{LLM_MODEL}",
+    "fallbacks": [m for m in os.environ.get('LLM_FALLBACK_MODELS', 'openai/gpt-5-mini').split(',') if m],
+    "fast": os.environ.get('LLM_FAST_MODEL') or None,  # Used for prompts up to short_prompt_chars
+    "short_prompt_chars": int(os.environ.get('LLM_SHORT_PROMPT_CHARS', '280')),
+    "hedge": os.environ.get('LLM_HEDGING', 'false').lower() == 'true',
+}
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.environ.get('LLM_ATTEMPT_TIMEOUT_SECONDS', '45'))
+LLM_RETRIES = int(os.environ.get('LLM_RETRIES', '1'))
+
+# Admission control for upstream LLM calls; agents may override their
+# concurrency with a "max_concurrency" entry in AGENTS_CONFIG
+LLM_DEADLINE_SECONDS = float(os.environ.get('LLM_DEADLINE_SECONDS', '90'))
+LLM_AGENT_MAX_CONCURRENCY = int(os.environ.get('LLM_AGENT_MAX_CONCURRENCY', '8'))
+admission = AdmissionController(
+    global_limit=int(os.environ.get('LLM_MAX_CONCURRENCY', '32')),
+    agent_limits={
+        agent_type: config.get("max_concurrency", LLM_AGENT_MAX_CONCURRENCY)
+        for agent_type, config in AGENTS_CONFIG.items()
+    },
+    max_queue=int(os.environ.get('LLM_MAX_QUEUE', '64')),
+    queue_timeout=float(os.environ.get('LLM_QUEUE_TIMEOUT_SECONDS', '10'))
+)
+
+# /agents is static per deploy: serialize it once and let clients cache it
+AGENTS_BODY = json_bytes(AGENTS_CONFIG)
+AGENTS_ETAG = make_etag(AGENTS_BODY)
+AGENTS_CACHE_CONTROL = os.environ.get('AGENTS_CACHE_CONTROL', 'public, max-age=86400, stale-while-revalidate=604800')
+
+# Upstream LLM metrics for /api/metrics
+LLM_LATENCY = registry.histogram(
+    "llm_call_duration_seconds", "Upstream LLM call latency", ("agent_type", "model", "outcome")
+)
+LLM_ERRORS = registry.counter("llm_call_errors_total", "Failed upstream LLM calls", ("agent_type", "model", "error"))
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "Estimated tokens sent to and received from upstream models", ("agent_type", "model", "direction")
+)
+LLM_IN_FLIGHT = registry.gauge("llm_calls_in_flight", "Upstream LLM calls in progress", ("agent_type",))
+
+# Per agent/model/day usage rollups behind /api/analytics; agents with the
+# "analytics" flag also get a usage summary in their context
+analytics = AnalyticsRollup(
+    db,
+    prices={**DEFAULT_MODEL_PRICES, **json.loads(os.environ.get('MODEL_PRICES', '{}'))},
+    flush_interval=float(os.environ.get('ANALYTICS_FLUSH_SECONDS', '5'))
+)
+ANALYTICS_CONTEXT_DAYS = int(os.environ.get('ANALYTICS_CONTEXT_DAYS', '7'))
+registry.callback_gauge(
+    "llm_admission_in_use", "Admission slots held per limiter", ("limiter",),
+    lambda: [((name,), stats["in_use"]) for name, stats in admission_limiter_stats()]
+)
+registry.callback_gauge(
+    "llm_admission_queued", "Requests waiting for admission per limiter", ("limiter",),
+    lambda: [((name,), stats["queued"]) for name, stats in admission_limiter_stats()]
+)
+
+# Orchestration
+ORCHESTRATION_TIMEOUT_SECONDS = float(os.environ.get('ORCHESTRATION_TIMEOUT_SECONDS', '180'))
+ORCHESTRATION_STEP_TIMEOUT_SECONDS = float(os.environ.get('ORCHESTRATION_STEP_TIMEOUT_SECONDS', str(LLM_DEADLINE_SECONDS)))
+DEFAULT_ORCHESTRATION_PLAN = [
+    {"id": "research", "agent_type": "research"},
+    {"id": "growth", "agent_type": "growth"},
+    {"id": "content", "agent_type": "content", "depends_on": ["research", "growth"]},
+    {"id": "safety", "agent_type": "safety", "depends_on": ["content"]},
+    {"id": "publisher", "agent_type": "publisher", "depends_on": ["safety"]},
+]
+
+# Image rendering runs in a process pool with a content-addressed cache
+image_renderer = ImageRenderer(
+    workers=int(os.environ.get('IMAGE_RENDER_WORKERS', str(default_workers()))),
+    cache_bytes=int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+)
+
+# Generated images are stored as binary blobs and served from /api/images/{id}
+image_store = ImageStore(db)
+IMAGE_THUMBNAIL_SIZE = int(os.environ.get('IMAGE_THUMBNAIL_SIZE', '128'))
+IMAGE_STREAM_CHUNK_SIZE = 256 * 1024
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"  # Image ids never change content
+
+# Bulk export/import (gzip'd NDJSON) reads and writes in batches of this many documents
+TRANSFER_BATCH_SIZE = int(os.environ.get('TRANSFER_BATCH_SIZE', '500'))
+
+# Session retention per agent: idle sessions are archived (compressed out of
+# `messages`) after archive_after_days and deleted after delete_after_days;
+# 0 disables either. SESSION_RETENTION overrides agents as JSON, e.g.
+# {"research": {"archive_after_days": 7, "delete_after_days": 365}}
+def retention_policies() -> Dict[str, Dict[str, float]]:
+    default = {
+        "archive_after_days": float(os.environ.get('SESSION_ARCHIVE_AFTER_DAYS', '30')),
+        "delete_after_days": float(os.environ.get('SESSION_DELETE_AFTER_DAYS', '0')),
+    }
+    overrides = json.loads(os.environ.get('SESSION_RETENTION', '{}'))
+    unknown = set(overrides) - set(AGENTS_CONFIG)
+    if unknown:
+        raise ValueError(f"SESSION_RETENTION names unknown agent types: {sorted(unknown)}")
+    return {agent_type: {**default, **overrides.get(agent_type, {})} for agent_type in AGENTS_CONFIG}
+
+retention = SessionRetention(
+    db,
+    retention_policies(),
+    interval=float(os.environ.get('RETENTION_INTERVAL_SECONDS', '300')),
+    purge_chunk=int(os.environ.get('RETENTION_PURGE_CHUNK', '1000')),
+    part_messages=int(os.environ.get('ARCHIVE_PART_MESSAGES', '1000')),
+    # Rehydrated messages go straight back into search and vector memory (defined with /import)
+    on_messages=lambda documents: index_imported_messages(documents)
+)
+
+# Batch jobs
+JOB_MAX_PROMPTS = int(os.environ.get('JOB_MAX_PROMPTS', '1000'))
+JOB_EVENTS_POLL_SECONDS = float(os.environ.get('JOB_EVENTS_POLL_SECONDS', '1'))
+
+# Scheduled tasks; "publish" tasks hand their output to PUBLISH_BACKEND
+# ("local" keeps posts in Mongo, "webhook" POSTs them to PUBLISH_WEBHOOK_URL)
+SCHEDULE_MIN_INTERVAL_SECONDS = float(os.environ.get('SCHEDULE_MIN_INTERVAL_SECONDS', '60'))
+SCHEDULE_PAGE_MAX = int(os.environ.get('SCHEDULE_PAGE_MAX', '200'))
+task_publisher = create_publisher(
+    os.environ.get('PUBLISH_BACKEND', 'local'),
+    db,
+    webhook_url=os.environ.get('PUBLISH_WEBHOOK_URL'),
+    webhook_token=os.environ.get('PUBLISH_WEBHOOK_TOKEN')
+)
+
+# Message writes are batched; MESSAGE_WRITE_ACK=false returns chat replies before the write is acknowledged
+message_writer = WriteBehindBuffer(
+    db.messages,
+    max_batch=int(os.environ.get('MESSAGE_WRITE_BATCH', '100'))
+)
+MESSAGE_WRITE_ACK = os.environ.get('MESSAGE_WRITE_ACK', 'true').lower() == 'true'
+
+# Message search ("mongo" text index, or "memory" for the in-process index in mock/dev setups)
+message_search = MessageSearch(
+    db,
+    backend=os.environ.get('SEARCH_BACKEND', 'mongo'),
+    language=os.environ.get('SEARCH_LANGUAGE', 'turkish'),
+    settle_seconds=float(os.environ.get('SEARCH_SYNC_SETTLE_SECONDS', '5'))
+)
+SEARCH_PAGE_DEFAULT = int(os.environ.get('SEARCH_PAGE_DEFAULT', '20'))
+SEARCH_PAGE_MAX = int(os.environ.get('SEARCH_PAGE_MAX', '100'))
+
+# Vector memory: related turns from other sessions, for agents with "recall" enabled
+vector_memory = VectorMemory(
+    db,
+    path=os.environ.get('VECTOR_MEMORY_PATH', str(ROOT_DIR / 'data' / 'vector_memory.npz')),
+    dim=int(os.environ.get('VECTOR_MEMORY_DIM', '256')),
+    settle_seconds=float(os.environ.get('SEARCH_SYNC_SETTLE_SECONDS', '5'))
+)
+VECTOR_MEMORY_TOP_K = int(os.environ.get('VECTOR_MEMORY_TOP_K', '4'))
+VECTOR_MEMORY_MIN_SCORE = float(os.environ.get('VECTOR_MEMORY_MIN_SCORE', '0.2'))
+
+# WebSocket channel
+WS_SEND_QUEUE_SIZE = int(os.environ.get('WS_SEND_QUEUE_SIZE', '256'))
+WS_HEARTBEAT_SECONDS = float(os.environ.get('WS_HEARTBEAT_SECONDS', '20'))
+WS_IDLE_TIMEOUT_SECONDS = float(os.environ.get('WS_IDLE_TIMEOUT_SECONDS', '90'))
+WS_MAX_INFLIGHT = int(os.environ.get('WS_MAX_INFLIGHT', '8'))
+
 # Models
 class Message(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -110,11 +370,16 @@ class Message(BaseModel):
     role: str  # "user" or "assistant"
     content: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    partial: bool = False  # True when a streamed answer was cut off before completion
 
 class MessageCreate(BaseModel):
     session_id: str
     agent_type: str
     content: str
+    recall: Optional[bool] = None  # Inject related past turns; defaults to the agent's "recall" flag
+
+class SearchHit(Message):
+    score: float
 
 class ChatSession(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -123,50 +388,782 @@ class ChatSession(BaseModel):
     name: str
     agent_type: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))  # Time of the latest chat activity
+    message_count: int = 0
+    last_message_preview: Optional[str] = None
 
 class ChatSessionCreate(BaseModel):
     name: str
     agent_type: str
 
+class OrchestrationStep(BaseModel):
+    id: str
+    agent_type: str
+    prompt: Optional[str] = None  # Defaults to the orchestration task
+    depends_on: List[str] = Field(default_factory=list)
+    timeout: Optional[float] = None
+
+class OrchestrationRequest(BaseModel):
+    task: str
+    steps: Optional[List[OrchestrationStep]] = None  # Defaults to DEFAULT_ORCHESTRATION_PLAN
+    timeout: Optional[float] = None
+
+class OrchestrationStepResult(BaseModel):
+    id: str
+    agent_type: str
+    status: str  # "completed", "failed", "timeout" or "skipped"
+    output: Optional[str] = None
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+
+class Orchestration(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    task: str
+    status: str  # "completed", "partial" or "failed"
+    steps: List[OrchestrationStepResult]
+    duration_ms: float
+    critical_path_ms: float
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class BatchJobCreate(BaseModel):
+    agent_type: str
+    prompts: List[str] = Field(min_length=1)
+    session_id: Optional[str] = None  # Defaults to the job id
+    name: Optional[str] = None
+
+class BatchJobItem(BaseModel):
+    index: int
+    prompt: str
+    status: str  # "pending", "completed" or "failed"
+    output: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class BatchJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: Optional[str] = None
+    agent_type: str
+    session_id: str
+    status: str = QUEUED  # "queued", "running", "completed", "failed" or "cancelled"
+    total: int
+    completed: int = 0
+    failed: int = 0
+    items: List[BatchJobItem] = Field(default_factory=list)
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: Optional[datetime] = None
+
+# Query filters for GET /schedules; anything else is a 422
+ScheduledTaskStatus = Literal["scheduled", "running", "completed", "failed", "cancelled"]
+AgentType = Literal[tuple(AGENTS_CONFIG)]
+
+class ScheduledTaskCreate(BaseModel):
+    agent_type: str
+    prompt: str
+    run_at: datetime  # Naive times are taken as UTC
+    every_seconds: Optional[float] = None  # Repeat interval; None runs once
+    publish: bool = False  # Hand the reply to the publish backend
+    target: Optional[str] = None  # Passed through to the publish backend, e.g. "instagram"
+    session_id: Optional[str] = None  # Defaults to the task id
+    name: Optional[str] = None
+
+class ScheduledTask(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: Optional[str] = None
+    agent_type: str
+    prompt: str
+    session_id: str
+    run_at: datetime
+    every_seconds: Optional[float] = None
+    publish: bool = False
+    target: Optional[str] = None
+    status: str = SCHEDULED  # "scheduled", "running", "completed", "failed" or "cancelled"
+    attempts: int = 0
+    runs: int = 0
+    output: Optional[str] = None
+    published: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    last_run_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: Optional[datetime] = None
+
 class ImageGenerationRequest(BaseModel):
     prompt: str
     agent_session_id: Optional[str] = None
+    inline: bool = False  # Also return image_base64, for clients that predate /api/images
+
+class GeneratedImage(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    prompt: str
+    agent_session_id: Optional[str] = None
+    content_hash: str  # GridFS blob name (SHA-256 of the PNG bytes)
+    content_type: str = "image/png"
+    size: int
+    thumbnail_hash: Optional[str] = None  # Filled on first thumbnail request
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ImageGenerationResponse(BaseModel):
-    image_base64: str
+    id: str
+    url: str
+    thumbnail_url: str
+    image_base64: Optional[str] = None
     prompt: str
     timestamp: datetime
 
 # Helper functions
-def prepare_for_mongo(data):
-    """Prepare data for MongoDB storage by converting datetime objects to ISO strings"""
-    if isinstance(data, dict):
-        result = {}
-        for key, value in data.items():
-            if isinstance(value, datetime):
-                result[key] = value.isoformat()
-            elif isinstance(value, dict):
-                result[key] = prepare_for_mongo(value)
-            else:
-                result[key] = value
-        return result
-    return data
-
-def parse_from_mongo(item):
-    """Parse data from MongoDB by converting ISO strings back to datetime objects"""
-    if isinstance(item, dict):
-        result = {}
-        for key, value in item.items():
-            if key in ['timestamp', 'created_at', 'updated_at'] and isinstance(value, str):
-                try:
-                    result[key] = datetime.fromisoformat(value)
-                except:
-                    result[key] = value
-            else:
-                result[key] = value
-        return result
-    return item
+def to_mongo(model: BaseModel) -> Dict[str, Any]:
+    """Serialize a model for MongoDB storage.
+
+    Datetimes are left as native objects so they are stored as BSON dates;
+    the client is tz-aware, so reads come back as UTC datetimes without any
+    per-field parsing.
+    """
+    return model.model_dump()
+
+def encode_cursor(document: Dict[str, Any], field: str = "timestamp") -> str:
+    """Build an opaque keyset cursor from a document's (timestamp, id)"""
+    timestamp = document[field]
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    raw = json.dumps([timestamp, document["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Decode a keyset cursor back into its (timestamp, id) pair"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(timestamp, str) or not isinstance(message_id, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return datetime.fromisoformat(timestamp), message_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(session_id: str, cursor: str, op: str) -> Dict[str, Any]:
+    """Match messages strictly before ($lt) or after ($gt) a cursor position"""
+    timestamp, message_id = decode_cursor(cursor)
+    return {
+        "session_id": session_id,
+        "$or": [
+            {"timestamp": {op: timestamp}},
+            {"timestamp": timestamp, "id": {op: message_id}}
+        ]
+    }
+
+async def record_session_activity(session_id: str, count: int, last_content: str, writes=()):
+    """Bump a session's message count, preview and recency in one atomic update.
+
+    Runs only once ``writes`` (the messages' write futures, or earlier
+    activity updates that must land first) are done, so the session version
+    used for ETags never covers unwritten messages.
+    """
+    if writes:
+        await asyncio.gather(*writes)
+    await db.chat_sessions.update_one(
+        {"id": session_id}, activity_update(count, last_content, datetime.now(timezone.utc))
+    )
+
+# Keep references to fire-and-forget tasks so they are not garbage collected mid-flight
+_background_tasks = set()
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', '10'))
+
+def spawn_background(coro):
+    """Run a coroutine in the background, detached from the current request"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def drain_background_tasks(timeout: float):
+    """Wait for background tasks (and any they spawn) to finish; cancel whatever outlives ``timeout``"""
+    deadline = time.monotonic() + timeout
+    while _background_tasks and time.monotonic() < deadline:
+        await asyncio.wait(set(_background_tasks), timeout=deadline - time.monotonic())
+    leftover = list(_background_tasks)
+    if leftover:
+        logger.warning(f"Cancelling {len(leftover)} background tasks still running at shutdown")
+        for task in leftover:
+            task.cancel()
+        await asyncio.gather(*leftover, return_exceptions=True)
+
+_llm_sdk = None
+_llm_sdk_lock = threading.Lock()
+
+def llm_sdk():
+    """The emergentintegrations chat module, imported on first use.
+    
+    It drags in litellm and the provider SDKs, which take longer to import
+    than the rest of the app together, so it stays out of module import.
+    The startup warm-up loads it in a thread once the worker is serving.
+    """
+    global _llm_sdk
+    if _llm_sdk is None:
+        with _llm_sdk_lock:
+            if _llm_sdk is None:
+                from emergentintegrations.llm import chat
+                llm_http_pool.start()
+                _llm_sdk = chat
+    return _llm_sdk
+
+def llm_message(text: str):
+    if LLM_BACKEND == "stub":
+        return StubUserMessage(text=text)
+    return llm_sdk().UserMessage(text=text)
+
+def build_llm_chat(session_id: str, agent_config: Dict[str, Any], model: Optional[str] = None):
+    """Create the LLM chat client for an agent session"""
+    provider, model_name = split_model(model) if model else (LLM_PROVIDER, LLM_MODEL)
+    chat_class = StubLlmChat if LLM_BACKEND == "stub" else llm_sdk().LlmChat
+    return chat_class(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=session_id,
+        system_message=agent_config["system_message"]
+    ).with_model(provider, model_name)
+
+def admission_limiter_stats():
+    stats = admission.stats()
+    return [("global", stats["global"]), *stats["agents"].items()]
+
+def record_llm_tokens(agent_type: str, model: str, prompt: str, completion: str):
+    prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(completion)
+    LLM_TOKENS.inc(agent_type, model, "prompt", amount=prompt_tokens)
+    LLM_TOKENS.inc(agent_type, model, "completion", amount=completion_tokens)
+    analytics.record_tokens(agent_type, model, prompt_tokens, completion_tokens)
+
+def observe_llm_call(agent_type: str, model: str, seconds: float, outcome: str):
+    LLM_LATENCY.observe(seconds, agent_type, model, outcome)
+    analytics.record_call(agent_type, model, seconds, outcome)
+
+async def call_model(model: str, agent_type: str, session_id: str, prompt: str) -> str:
+    """Send one prompt to one model; retries and fallbacks are up to the router"""
+    chat = build_llm_chat(session_id, AGENTS_CONFIG[agent_type], model)
+    LLM_IN_FLIGHT.inc(agent_type)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await chat.send_message(llm_message(prompt))
+        outcome = "ok"
+    except asyncio.CancelledError:
+        # Timeouts and lost hedges cancel the call
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        LLM_ERRORS.inc(agent_type, model, type(e).__name__)
+        raise
+    finally:
+        LLM_IN_FLIGHT.dec(agent_type)
+        observe_llm_call(agent_type, model, time.perf_counter() - started, outcome)
+    record_llm_tokens(agent_type, model, prompt, response)
+    return response
+
+llm_router = ModelRouter(
+    call=call_model,
+    default_route=DEFAULT_MODEL_ROUTE,
+    agent_routes={agent_type: config.get("routing", {}) for agent_type, config in AGENTS_CONFIG.items()},
+    attempt_timeout=LLM_ATTEMPT_TIMEOUT_SECONDS,
+    retries=LLM_RETRIES
+)
+
+def chunk_text(text: str) -> List[str]:
+    """Split a complete answer into stream-sized chunks"""
+    return [text[start:start + STREAM_CHUNK_SIZE] for start in range(0, len(text), STREAM_CHUNK_SIZE)]
+
+def cache_bypass_requested(request: Optional[Request]) -> bool:
+    return request is not None and request.headers.get(CACHE_HEADER, "").lower() == "bypass"
+
+def cache_key_for(
+    input: MessageCreate,
+    request: Optional[Request] = None,
+    context_hash: Optional[str] = None,
+    bypass: bool = False
+) -> Optional[str]:
+    """Return the response cache key for a chat request, or None when caching does not apply"""
+    agent_config = AGENTS_CONFIG[input.agent_type]
+    if not response_cache.enabled_for(agent_config):
+        return None
+    if bypass or cache_bypass_requested(request):
+        response_cache.record_bypass()
+        return None
+    model = llm_router.primary_for(input.agent_type, input.content)
+    return make_cache_key(agent_config["system_message"], model, input.content, context_hash)
+
+def flight_key(input: MessageCreate, context_hash: Optional[str] = None):
+    """Identify requests that would produce the same upstream call"""
+    return (input.agent_type, llm_router.primary_for(input.agent_type, input.content), input.content, context_hash)
+
+def request_deadline() -> float:
+    """Monotonic time by which an LLM request must be answered"""
+    return time.monotonic() + LLM_DEADLINE_SECONDS
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    """Shed load with a fast 429/503 and a Retry-After hint"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=f"Server busy: {e.reason}",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def generate_reply(
+    input: MessageCreate,
+    cache_key: Optional[str],
+    deadline: float,
+    prompt: Optional[str] = None,
+    context_hash: Optional[str] = None
+):
+    """Get the agent's answer, from the response cache when possible.
+
+    ``prompt`` is the upstream text with conversation context (defaults to
+    the bare message) and ``context_hash`` identifies that context. Upstream
+    calls go through admission control and must finish before ``deadline``.
+    Returns the answer text and the cache status reported to the client.
+    """
+    if cache_key is None:
+        status = "skip"
+    else:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            return cached, "hit"
+        status = "miss"
+
+    async def call_llm():
+        async with admission.admit(input.agent_type, deadline):
+            # Route on the user's own message so context does not push short questions to the big model
+            response, model = await llm_router.complete(
+                input.agent_type,
+                input.session_id,
+                prompt or input.content,
+                deadline,
+                models=llm_router.candidates(input.agent_type, input.content)
+            )
+        if cache_key is not None:
+            await response_cache.set(cache_key, response, input.agent_type, model)
+        return response
+
+    response = await llm_flights.do(flight_key(input, context_hash), call_llm)
+    return response, status
+
+async def iter_llm_reply(chat, message, deadline: Optional[float] = None) -> AsyncIterator[Optional[str]]:
+    """Yield the LLM answer in text chunks as it becomes available.
+
+    Uses the client's native token stream when it offers one. Otherwise the
+    full answer is awaited and re-chunked, yielding ``None`` every
+    SSE_KEEPALIVE_SECONDS while waiting so callers can send heartbeats.
+    Raises asyncio.TimeoutError once ``deadline`` passes.
+    """
+    stream = getattr(chat, "stream_message", None)
+    if callable(stream):
+        async for chunk in stream(message):
+            if deadline is not None and time.monotonic() > deadline:
+                raise asyncio.TimeoutError()
+            if chunk:
+                yield chunk
+        return
+
+    task = asyncio.ensure_future(chat.send_message(message))
+    try:
+        while True:
+            timeout = SSE_KEEPALIVE_SECONDS
+            if deadline is not None:
+                timeout = min(timeout, max(deadline - time.monotonic(), 0))
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise asyncio.TimeoutError()
+            yield None
+        response = task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+
+    for chunk in chunk_text(response):
+        yield chunk
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+async def iter_cached_reply(text: str) -> AsyncIterator[Optional[str]]:
+    """Replay a cached answer through the same chunked interface as the LLM stream"""
+    for chunk in chunk_text(text):
+        yield chunk
+
+async def chat_events(
+    input: MessageCreate,
+    user_message: Message,
+    cache_key: Optional[str] = None,
+    cached: Optional[str] = None,
+    ticket=None,
+    deadline: Optional[float] = None,
+    prompt: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]:
+    """Stream an agent answer as (event, data) pairs and persist the assembled message when it ends.
+
+    Events are ``start``, ``token``, ``done`` and ``error``; ``keepalive``
+    (with no data) marks a pause in which transports should send heartbeats.
+
+    ``cached`` replays a cache hit instead of calling the LLM; ``ticket`` is
+    the admission slot held for the upstream call and is released when the
+    stream finishes.
+    """
+    agent_config = AGENTS_CONFIG[input.agent_type]
+    assistant_message = Message(
+        session_id=input.session_id,
+        agent_type=input.agent_type,
+        role="assistant",
+        content=""
+    )
+    chunks: List[str] = []
+    persisted = False
+    model = llm_router.primary_for(input.agent_type, input.content)
+    started = time.perf_counter()
+    outcome = "cancelled"
+
+    yield "start", {
+        "message_id": assistant_message.id,
+        "user_message_id": user_message.id,
+        "session_id": input.session_id
+    }
+
+    try:
+        if cached is not None:
+            source = iter_cached_reply(cached)
+        else:
+            LLM_IN_FLIGHT.inc(input.agent_type)
+            chat = build_llm_chat(input.session_id, agent_config, model)
+            source = iter_llm_reply(chat, llm_message(prompt or input.content), deadline)
+
+        async for chunk in source:
+            if chunk is None:
+                yield "keepalive", None
+                continue
+            chunks.append(chunk)
+            yield "token", {"delta": chunk}
+
+        assistant_message.content = "".join(chunks)
+        outcome = "ok"
+        await message_writer.write(to_mongo(assistant_message))
+        persisted = True
+        analytics.record_message(input.agent_type, model, "assistant", cached=cached is not None)
+        await record_session_activity(input.session_id, 1, assistant_message.content)
+        if cache_key and cached is None:
+            await response_cache.set(cache_key, assistant_message.content, input.agent_type, model)
+        yield "done", assistant_message.model_dump(mode="json")
+
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        logger.error(f"Streaming response deadline exceeded for session {input.session_id}")
+        yield "error", {"detail": "LLM response deadline exceeded"}
+
+    except Exception as e:
+        if outcome != "ok":
+            outcome = "error"
+            LLM_ERRORS.inc(input.agent_type, model, type(e).__name__)
+        logger.error(f"Error streaming response for session {input.session_id}: {e}")
+        yield "error", {"detail": f"Error generating response: {str(e)}"}
+
+    finally:
+        if ticket is not None:
+            ticket.release()
+        if cached is None:
+            LLM_IN_FLIGHT.dec(input.agent_type)
+            observe_llm_call(input.agent_type, model, time.perf_counter() - started, outcome)
+            record_llm_tokens(input.agent_type, model, prompt or input.content, "".join(chunks))
+        # Client disconnects cancel the generator; keep whatever was already
+        # streamed so the conversation history matches what the user saw.
+        if chunks and not persisted:
+            assistant_message.content = "".join(chunks)
+            assistant_message.partial = True
+            analytics.record_message(input.agent_type, model, "assistant", cached=cached is not None)
+            spawn_background(record_session_activity(
+                input.session_id, 1, assistant_message.content,
+                writes=(message_writer.write(to_mongo(assistant_message)),)
+            ))
+
+async def stream_chat_events(events: AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]) -> AsyncIterator[str]:
+    """Format chat events as Server-Sent Events"""
+    try:
+        async for event, data in events:
+            yield ": keep-alive\n\n" if event == "keepalive" else sse_event(event, data)
+    finally:
+        # Close the inner stream now so a disconnect persists partial output immediately
+        await events.aclose()
+
+async def open_chat_stream(input: MessageCreate, bypass_cache: bool = False):
+    """Prepare a streamed chat reply for any transport.
+
+    Assembles context, checks the cache, admits the upstream call and queues
+    the user message for writing. Returns the ``chat_events`` iterator and the admission
+    ticket (None on a cache hit), which callers must release if the iterator
+    is never consumed. Raises Overloaded when admission is refused.
+    """
+    user_message = Message(
+        session_id=input.session_id,
+        agent_type=input.agent_type,
+        role="user",
+        content=input.content
+    )
+    
+    with stage("context"):
+        prompt, context_hash = await build_context(input)
+    cache_key = cache_key_for(input, context_hash=context_hash, bypass=bypass_cache)
+    with stage("cache"):
+        cached = await response_cache.get(cache_key) if cache_key else None
+    
+    # Admit the upstream call before the stream opens so overload is reported up front
+    deadline = request_deadline()
+    ticket = None
+    if cached is None:
+        with stage("admission"):
+            ticket = await admission.acquire(input.agent_type, deadline)
+    
+    # Queue the user message; the writer stores it ahead of the reply
+    user_write = message_writer.write(to_mongo(user_message))
+    analytics.record_message(input.agent_type, llm_router.primary_for(input.agent_type, input.content), "user")
+    spawn_background(record_session_activity(input.session_id, 1, user_message.content, writes=(user_write,)))
+    
+    return chat_events(input, user_message, cache_key, cached, ticket, deadline, prompt), ticket
+
+def build_step_prompt(task: str, step, inputs: Dict[str, str]) -> str:
+    """Compose a step prompt from the task, the step instruction and upstream outputs"""
+    parts = [f"Görev: {task}"]
+    if step.prompt:
+        parts.append(step.prompt)
+    for dependency, output in inputs.items():
+        parts.append(f"[{dependency} adımının çıktısı]\n{output}")
+    return "\n\n".join(parts)
+
+async def run_orchestration(input: OrchestrationRequest, on_event=None) -> Orchestration:
+    """Execute an orchestration plan and store the run"""
+    steps = input.steps or [OrchestrationStep(**step) for step in DEFAULT_ORCHESTRATION_PLAN]
+    for step in steps:
+        if step.agent_type not in AGENTS_CONFIG:
+            raise HTTPException(status_code=400, detail=f"Invalid agent type for step '{step.id}'")
+    
+    orchestration_id = str(uuid.uuid4())
+    
+    async def execute(step, inputs):
+        message = MessageCreate(
+            session_id=orchestration_id,
+            agent_type=step.agent_type,
+            content=build_step_prompt(input.task, step, inputs)
+        )
+        deadline = time.monotonic() + (step.timeout or ORCHESTRATION_STEP_TIMEOUT_SECONDS)
+        reply, _ = await generate_reply(message, cache_key_for(message), deadline)
+        return reply
+    
+    started = time.monotonic()
+    try:
+        results = await run_plan(
+            steps,
+            execute,
+            step_timeout=ORCHESTRATION_STEP_TIMEOUT_SECONDS,
+            total_timeout=input.timeout or ORCHESTRATION_TIMEOUT_SECONDS,
+            on_event=on_event
+        )
+    except PlanError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    completed = sum(1 for result in results.values() if result["status"] == "completed")
+    orchestration = Orchestration(
+        id=orchestration_id,
+        task=input.task,
+        status="completed" if completed == len(steps) else ("partial" if completed else "failed"),
+        steps=[results[step.id] for step in steps],
+        duration_ms=round((time.monotonic() - started) * 1000, 2),
+        critical_path_ms=critical_path_ms(steps, results)
+    )
+    await db.orchestrations.insert_one(to_mongo(orchestration))
+    return orchestration
+
+SUMMARY_SYSTEM_MESSAGE = "Sen bir konuşma özetleyicisin. Konuşmaları önemli bilgileri, kararları ve kullanıcı tercihlerini koruyarak kısa ve öz biçimde özetlersin."
+
+async def summarize_history(agent_type: str, previous_summary: Optional[str], messages: List[Dict[str, Any]]) -> str:
+    """Fold older turns into a session's rolling summary with the LLM"""
+    parts = []
+    if previous_summary:
+        parts.append(f"[Mevcut özet]\n{previous_summary}")
+    parts.append(f"[Özetlenecek mesajlar]\n{format_turns(messages)}")
+    parts.append("Mevcut özeti ve yeni mesajları tek bir güncel özet halinde birleştir.")
+    
+    async with admission.admit(agent_type):
+        chat = build_llm_chat(
+            f"summary-{uuid.uuid4()}",
+            {"system_message": SUMMARY_SYSTEM_MESSAGE},
+            f"{LLM_PROVIDER}/{LLM_SUMMARY_MODEL}"
+        )
+        return await asyncio.wait_for(
+            chat.send_message(llm_message("\n\n".join(parts))),
+            timeout=LLM_DEADLINE_SECONDS
+        )
+
+history = HistoryAssembler(
+    db,
+    summarize=summarize_history,
+    spawn=spawn_background,
+    token_budget=int(os.environ.get('LLM_CONTEXT_TOKEN_BUDGET', '3000')),
+    max_messages=int(os.environ.get('LLM_HISTORY_MAX_MESSAGES', '40')),
+    keep_recent=int(os.environ.get('LLM_HISTORY_KEEP_RECENT', '6'))
+)
+
+async def build_context(input: MessageCreate, exclude_id: Optional[str] = None):
+    """Assemble the upstream prompt for a chat message and the hash of its context.
+
+    Adds the most similar turns from other sessions ahead of the session's
+    own history when recall is enabled for the request or agent, and a usage
+    summary for agents with the "analytics" flag.
+    """
+    await retention.ensure_hydrated(input.session_id)
+    prompt, context_hash = await history.build(input.session_id, input.agent_type, input.content, exclude_id=exclude_id)
+    sections = []
+    
+    recall = input.recall if input.recall is not None else AGENTS_CONFIG[input.agent_type].get("recall", False)
+    if recall:
+        related = await vector_memory.recall(
+            input.content, VECTOR_MEMORY_TOP_K, exclude_session=input.session_id, min_score=VECTOR_MEMORY_MIN_SCORE
+        )
+        if related:
+            sections.append(f"[İlgili geçmiş kayıtlar]\n{format_turns(related)}")
+    
+    if AGENTS_CONFIG[input.agent_type].get("analytics"):
+        summary = await analytics.summary(ANALYTICS_CONTEXT_DAYS)
+        sections.append(f"[Kullanım verileri]\n{format_usage(summary)}")
+    
+    if not sections:
+        return prompt, context_hash
+    prompt = "\n\n".join(sections + [prompt])
+    return prompt, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def format_usage(summary: Dict[str, Any]) -> str:
+    """Compact text form of an analytics summary for agent context"""
+    def line(label: str, entry: Dict[str, Any]) -> str:
+        messages = entry["messages"]
+        p95 = entry["latency_ms"]["p95"]
+        return (
+            f"{label}: {messages.get('user', 0)} soru, {messages.get('assistant', 0)} yanıt, "
+            f"{entry['calls']} model çağrısı (%{entry['error_rate'] * 100:.1f} hata), "
+            f"{entry['tokens']['prompt'] + entry['tokens']['completion']} token, "
+            f"${entry['cost_usd']:.4f}, p95 {p95 if p95 is not None else '-'} ms"
+        )
+    lines = [line(f"Toplam ({summary['from']} - {summary['to']})", summary["totals"])]
+    lines += [line(f"{entry['agent_type']} / {entry['model']}", entry) for entry in summary["breakdown"]]
+    return "\n".join(lines)
+
+async def execute_job_item(job: Dict[str, Any], item: Dict[str, Any]) -> str:
+    """Answer one batch job prompt through the regular LLM path"""
+    message = MessageCreate(session_id=job["session_id"], agent_type=job["agent_type"], content=item["prompt"])
+    reply, _ = await generate_reply(message, cache_key_for(message), request_deadline())
+    return reply
+
+def job_item_messages(job: Dict[str, Any], item: Dict[str, Any], output: str) -> List[Dict[str, Any]]:
+    """Build the user/assistant message documents for a finished batch item"""
+    common = {"session_id": job["session_id"], "agent_type": job["agent_type"]}
+    # Stable ids: an item redone after a lost lease is not stored twice
+    return [
+        to_mongo(Message(
+            **common, id=item_message_id(job["id"], item["index"], "user"),
+            role="user", content=item["prompt"], timestamp=item["started_at"]
+        )),
+        to_mongo(Message(
+            **common, id=item_message_id(job["id"], item["index"], "assistant"),
+            role="assistant", content=output, timestamp=item["finished_at"]
+        )),
+    ]
+
+async def record_job_messages(job: Dict[str, Any], documents: List[Dict[str, Any]]):
+    # job_item_messages writes user/assistant pairs
+    for user, assistant in zip(documents[::2], documents[1::2]):
+        model = llm_router.primary_for(job["agent_type"], user["content"])
+        analytics.record_message(job["agent_type"], model, "user")
+        analytics.record_message(job["agent_type"], model, "assistant")
+    await record_session_activity(job["session_id"], len(documents), documents[-1]["content"])
+
+job_runner = JobRunner(
+    db,
+    execute=execute_job_item,
+    make_documents=job_item_messages,
+    workers=int(os.environ.get('JOB_WORKERS', '2')),
+    item_concurrency=int(os.environ.get('JOB_ITEM_CONCURRENCY', '4')),
+    max_retries=int(os.environ.get('JOB_MAX_RETRIES', '2')),
+    flush_size=int(os.environ.get('JOB_FLUSH_SIZE', '20')),
+    lease_seconds=float(os.environ.get('JOB_LEASE_SECONDS', '60')),
+    on_messages=record_job_messages
+)
+
+async def execute_scheduled_task(task: Dict[str, Any]) -> str:
+    """Answer a scheduled prompt and record the exchange in the task's session"""
+    message = MessageCreate(session_id=task["session_id"], agent_type=task["agent_type"], content=task["prompt"])
+    user_message = Message(session_id=message.session_id, agent_type=message.agent_type, role="user", content=message.content)
+    user_write = message_writer.write(to_mongo(user_message))
+    user_activity = spawn_background(
+        record_session_activity(message.session_id, 1, user_message.content, writes=(user_write,))
+    )
+    
+    prompt, context_hash = await build_context(message, exclude_id=user_message.id)
+    reply, _ = await generate_reply(message, cache_key_for(message, context_hash=context_hash), request_deadline(), prompt, context_hash)
+    model = llm_router.primary_for(message.agent_type, message.content)
+    analytics.record_message(message.agent_type, model, "user")
+    analytics.record_message(message.agent_type, model, "assistant")
+    
+    assistant_message = Message(session_id=message.session_id, agent_type=message.agent_type, role="assistant", content=reply)
+    assistant_write = message_writer.write(to_mongo(assistant_message))
+    await record_session_activity(message.session_id, 1, reply, writes=(user_activity, assistant_write))
+    return reply
+
+task_scheduler = TaskScheduler(
+    db,
+    execute=execute_scheduled_task,
+    publisher=task_publisher,
+    workers=int(os.environ.get('SCHEDULER_WORKERS', '4')),
+    lease_seconds=float(os.environ.get('SCHEDULER_LEASE_SECONDS', '120')),
+    refresh_interval=float(os.environ.get('SCHEDULER_REFRESH_SECONDS', '60')),
+    horizon=float(os.environ.get('SCHEDULER_HORIZON_SECONDS', '300')),
+    max_retries=int(os.environ.get('SCHEDULER_MAX_RETRIES', '2')),
+    retry_delay=float(os.environ.get('SCHEDULER_RETRY_DELAY_SECONDS', '30'))
+)
+
+def job_progress(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize a job document for progress events"""
+    return {key: job.get(key) for key in ("id", "status", "total", "completed", "failed", "updated_at")}
+
+async def stream_job_events(job_id: str) -> AsyncIterator[str]:
+    """Emit job progress as SSE until the job reaches a terminal status.
+
+    Polls the jobs collection, so it works no matter which worker process
+    is running the job.
+    """
+    last = None
+    while True:
+        job = await db.jobs.find_one({"id": job_id}, {"_id": 0, "items": 0})
+        if job is None:
+            yield sse_event("error", {"detail": "Job not found"})
+            return
+        progress = job_progress(job)
+        if progress != last:
+            last = progress
+            if job["status"] in TERMINAL_STATUSES:
+                yield sse_event("done", progress)
+                return
+            yield sse_event("progress", progress)
+        else:
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
 
 # Routes
 @api_router.get("/")
@@ -174,9 +1171,9 @@ async def root():
     return {"message": "Meta AI Orchestrator API - Active"}
 
 @api_router.get("/agents")
-async def get_agents():
+async def get_agents(request: Request):
     """Get all available agent configurations"""
-    return AGENTS_CONFIG
+    return json_response(request=request, body=AGENTS_BODY, etag=AGENTS_ETAG, cache_control=AGENTS_CACHE_CONTROL)
 
 @api_router.post("/sessions", response_model=ChatSession)
 async def create_chat_session(input: ChatSessionCreate):
@@ -187,42 +1184,136 @@ async def create_chat_session(input: ChatSessionCreate):
     session = ChatSession(**input.model_dump())
     
     # Store in MongoDB
-    session_dict = prepare_for_mongo(session.model_dump())
+    session_dict = to_mongo(session)
     await db.chat_sessions.insert_one(session_dict)
     
     return session
 
 @api_router.get("/sessions", response_model=List[ChatSession])
-async def get_chat_sessions():
-    """Get all chat sessions"""
-    sessions = await db.chat_sessions.find({}, {"_id": 0}).to_list(1000)
+async def get_chat_sessions(
+    request: Request,
+    agent_type: Optional[str] = None,
+    limit: int = Query(SESSIONS_PAGE_DEFAULT, ge=1, le=SESSIONS_PAGE_MAX),
+    cursor: Optional[str] = None
+):
+    """Get chat sessions, most recently active first.
+
+    ``agent_type`` restricts the list to one agent. Pages continue from the
+    X-Next-Cursor header of the previous page; X-Has-More tells whether the
+    page was full. Responses carry an ETag derived from the session count,
+    the total message count and the newest ``updated_at``, so unchanged
+    polls are answered with 304 without reading the list.
+    """
+    if agent_type and agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    
+    query: Dict[str, Any] = {}
+    if agent_type:
+        query["agent_type"] = agent_type
+    
+    # Every chat write bumps some message_count, deletes move updated_at, creates and purges change the count
+    version = await db.chat_sessions.aggregate([
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "sessions": {"$sum": 1},
+            "messages": {"$sum": "$message_count"},
+            "latest": {"$max": "$updated_at"},
+        }},
+    ]).to_list(1)
+    etag = make_etag("sessions", agent_type, cursor, limit, version)
+    if not_modified(request, etag):
+        return not_modified_response(etag, "no-cache")
+    
+    # The version above includes deleted sessions, since deleting one bumps its updated_at
+    query["deleted_at"] = None
+    if cursor:
+        updated_at, session_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "id": {"$lt": session_id}}
+        ]
     
-    # Parse datetime fields
+    # Fetch one extra document to know whether another page exists
+    sessions = await db.chat_sessions.find(query, {"_id": 0, **{field: 0 for field in INTERNAL_FIELDS}}).sort(
+        [("updated_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
     for session in sessions:
-        session = parse_from_mongo(session)
+        # Sessions created before the counters existed
+        session.setdefault("message_count", 0)
+        session.setdefault("last_message_preview", None)
+    
+    headers = {"X-Has-More": "true" if has_more else "false"}
+    if has_more:
+        headers["X-Next-Cursor"] = encode_cursor(sessions[-1], "updated_at")
     
-    return sessions
+    return json_response(sessions, request, etag=etag, headers=headers)
 
 @api_router.delete("/sessions/{session_id}")
 async def delete_chat_session(session_id: str):
-    """Delete a chat session and its messages"""
-    # Delete session
-    session_result = await db.chat_sessions.delete_one({"id": session_id})
-    if session_result.deleted_count == 0:
+    """Delete a chat session; its messages are purged in the background"""
+    if not await retention.soft_delete(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Delete associated messages
-    await db.messages.delete_many({"session_id": session_id})
+    message_search.forget_session(session_id)
+    await vector_memory.forget_session(session_id)
     
     return {"message": "Session deleted successfully"}
 
+@api_router.get("/export")
+async def export_sessions(
+    session_id: Optional[List[str]] = Query(None),
+    agent_type: Optional[str] = None,
+    images: bool = False
+):
+    """Stream sessions with their messages (and optionally images) as gzip'd NDJSON"""
+    if agent_type and agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    
+    records = export_records(
+        db, image_store if images else None, session_id, agent_type, TRANSFER_BATCH_SIZE, archive=retention
+    )
+    filename = f"sessions-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.ndjson.gz"
+    return StreamingResponse(
+        gzip_ndjson(records),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def index_imported_messages(documents: List[Dict[str, Any]]):
+    # Index right away so searches and recall see the messages without waiting for a sync
+    message_search.add_backfilled(documents)
+    await vector_memory.add_backfilled(documents)
+
+@api_router.post("/import")
+async def import_sessions(request: Request):
+    """Ingest an export (gzip'd or plain NDJSON) from the request body.
+    
+    Records whose id is already stored are skipped, so a failed import can be
+    retried with the same file.
+    """
+    try:
+        counts = await import_records(
+            db, read_ndjson(request.stream()), image_store, TRANSFER_BATCH_SIZE, on_messages=index_imported_messages
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return counts
+
 @api_router.post("/chat", response_model=Message)
-async def send_message(input: MessageCreate):
+async def send_message(input: MessageCreate, request: Request, response: Response):
     """Send a message to an agent and get response"""
     if input.agent_type not in AGENTS_CONFIG:
         raise HTTPException(status_code=400, detail="Invalid agent type")
     
-    # Store user message
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return await stream_message(input, request)
+    
+    # Store user message; the write overlaps context assembly and the LLM call
     user_message = Message(
         session_id=input.session_id,
         agent_type=input.agent_type,
@@ -230,55 +1321,467 @@ async def send_message(input: MessageCreate):
         content=input.content
     )
     
-    user_msg_dict = prepare_for_mongo(user_message.model_dump())
-    await db.messages.insert_one(user_msg_dict)
-    
-    # Get agent config
-    agent_config = AGENTS_CONFIG[input.agent_type]
+    user_write = message_writer.write(to_mongo(user_message))
+    # Counted on its own: the user message stays stored even when the reply fails
+    user_activity = spawn_background(
+        record_session_activity(input.session_id, 1, user_message.content, writes=(user_write,))
+    )
     
     try:
-        # Initialize LLM chat
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=input.session_id,
-            system_message=agent_config["system_message"]
-        ).with_model("openai", "gpt-5")
-        
-        # Create user message for LLM
-        llm_user_message = UserMessage(text=input.content)
+        # Assemble bounded conversation context from stored history
+        with stage("context"):
+            prompt, context_hash = await build_context(input, exclude_id=user_message.id)
         
-        # Get response from LLM
-        response = await chat.send_message(llm_user_message)
+        # Get response from cache or LLM
+        with stage("llm"):
+            reply, cache_status = await generate_reply(
+                input, cache_key_for(input, request, context_hash), request_deadline(), prompt, context_hash
+            )
+        response.headers[CACHE_HEADER] = cache_status
+        model = llm_router.primary_for(input.agent_type, input.content)
+        analytics.record_message(input.agent_type, model, "user")
+        analytics.record_message(input.agent_type, model, "assistant", cached=cache_status == "hit")
         
-        # Store assistant response
+        # Store assistant response (queued behind the user message)
         assistant_message = Message(
             session_id=input.session_id,
             agent_type=input.agent_type,
             role="assistant",
-            content=response
+            content=reply
         )
         
-        assistant_msg_dict = prepare_for_mongo(assistant_message.model_dump())
-        await db.messages.insert_one(assistant_msg_dict)
+        assistant_write = message_writer.write(to_mongo(assistant_message))
+        # Waiting on the user update too keeps the reply as the session preview
+        session_update = record_session_activity(
+            input.session_id, 1, assistant_message.content, writes=(user_activity, assistant_write)
+        )
+        if MESSAGE_WRITE_ACK:
+            with stage("db_write"):
+                await session_update
+        else:
+            spawn_background(session_update)
         
         return assistant_message
         
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM response deadline exceeded")
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=502, detail=f"All upstream models failed: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
+@api_router.post("/chat/stream")
+async def stream_message(input: MessageCreate, request: Request):
+    """Send a message to an agent and stream the response as Server-Sent Events"""
+    if input.agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    
+    try:
+        events, ticket = await open_chat_stream(input, cache_bypass_requested(request))
+    except Overloaded as e:
+        raise overloaded_error(e)
+    
+    return StreamingResponse(
+        stream_chat_events(events),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        # Covers streams that never start; release() is idempotent
+        background=BackgroundTask(ticket.release) if ticket is not None else None
+    )
+
 @api_router.get("/chat/{session_id}/messages", response_model=List[Message])
-async def get_messages(session_id: str):
-    """Get all messages for a session"""
-    messages = await db.messages.find(
-        {"session_id": session_id}, 
-        {"_id": 0}
-    ).sort("timestamp", 1).to_list(1000)
-    
-    # Parse datetime fields
+async def get_messages(
+    session_id: str,
+    request: Request,
+    limit: int = Query(MESSAGES_PAGE_DEFAULT, ge=1, le=MESSAGES_PAGE_MAX),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    latest: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Get a page of messages for a session in chronological order.
+
+    Pages are addressed with keyset cursors: ``after`` walks forward from the
+    oldest message, ``before`` walks back in history, and ``latest`` returns
+    the newest ``limit`` messages for a first render. Cursors for the first
+    and last returned message are sent in the X-Before-Cursor and
+    X-After-Cursor headers, and X-Has-More tells whether the page was full.
+    ``since``/``until`` restrict the page to a time range.
+    
+    The ETag comes from the session's write version (updated_at and
+    message_count), so an unchanged page costs one indexed lookup and a 304.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    
+    version = await db.chat_sessions.find_one(
+        {"id": session_id}, {"_id": 0, "updated_at": 1, "message_count": 1, "deleted_at": 1, "archive_state": 1}
+    )
+    etag = None
+    if version is not None:
+        if version.pop("deleted_at", None):
+            raise HTTPException(status_code=404, detail="Session not found")
+        archive_state = version.pop("archive_state", None)
+        etag = make_etag("messages", session_id, version, sorted(request.query_params.multi_items()))
+        if not_modified(request, etag):
+            return not_modified_response(etag, "no-cache")
+        # Archiving does not change the history, so the ETag survives a rehydration
+        if archive_state:
+            with stage("rehydrate"):
+                await retention.ensure_hydrated(session_id, archive_state)
+    
+    backwards = bool(before) or latest
+    if before:
+        query = keyset_filter(session_id, before, "$lt")
+    elif after:
+        query = keyset_filter(session_id, after, "$gt")
+    else:
+        query = {"session_id": session_id}
+    
+    time_range = {}
+    if since:
+        time_range["$gte"] = since
+    if until:
+        time_range["$lt"] = until
+    if time_range:
+        query["timestamp"] = time_range
+    
+    direction = -1 if backwards else 1
+    # Fetch one extra document to know whether another page exists
+    messages = await db.messages.find(query, {"_id": 0}).sort(
+        [("timestamp", direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if backwards:
+        messages.reverse()
     for message in messages:
-        message = parse_from_mongo(message)
+        message.setdefault("partial", False)
     
-    return messages
+    headers = {"X-Has-More": "true" if has_more else "false"}
+    if messages:
+        headers["X-Before-Cursor"] = encode_cursor(messages[0])
+        headers["X-After-Cursor"] = encode_cursor(messages[-1])
+    
+    # Without a session document (e.g. orchestration runs) the ETag falls back to a body hash
+    return json_response(messages, request, etag=etag, headers=headers)
+
+@api_router.get("/search", response_model=List[SearchHit])
+async def search_messages(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    agent_type: Optional[str] = None,
+    session_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(SEARCH_PAGE_DEFAULT, ge=1, le=SEARCH_PAGE_MAX)
+):
+    """Search message content across sessions, best matches first.
+
+    Results can be narrowed by agent, session and a ``since``/``until``
+    time range. Pages are addressed by ``offset``; X-Has-More tells whether
+    another page follows and X-Next-Offset is where it starts.
+    """
+    if agent_type and agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    
+    hits, has_more = await message_search.search(
+        q, agent_type=agent_type, session_id=session_id, since=since, until=until, offset=offset, limit=limit
+    )
+    
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    if has_more:
+        response.headers["X-Next-Offset"] = str(offset + len(hits))
+    
+    return hits
+
+@api_router.get("/sessions/retention")
+async def get_retention_stats():
+    """Retention policies and purge/archive counters"""
+    return retention.stats()
+
+@api_router.get("/analytics/summary")
+async def get_analytics_summary(
+    days: int = Query(7, ge=1, le=366),
+    agent_type: Optional[str] = None,
+    model: Optional[str] = None
+):
+    """Usage totals for the last `days` days, per agent and model: messages, calls, tokens, cost and latency percentiles"""
+    if agent_type and agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    return await analytics.summary(days, agent_type, model)
+
+@api_router.get("/analytics/daily")
+async def get_analytics_daily(
+    days: int = Query(30, ge=1, le=366),
+    agent_type: Optional[str] = None,
+    model: Optional[str] = None
+):
+    """The same usage figures as a per-day series"""
+    if agent_type and agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    return await analytics.daily(days, agent_type, model)
+
+@api_router.get("/search/stats")
+async def get_search_stats():
+    """Search backend and index statistics"""
+    return message_search.stats()
+
+@api_router.post("/orchestrate", response_model=Orchestration)
+async def orchestrate(input: OrchestrationRequest):
+    """Run a task across several agents, executing independent steps concurrently"""
+    return await run_orchestration(input)
+
+@api_router.get("/orchestrate/{orchestration_id}", response_model=Orchestration)
+async def get_orchestration(orchestration_id: str):
+    """Get a stored orchestration run"""
+    orchestration = await db.orchestrations.find_one({"id": orchestration_id}, {"_id": 0})
+    if orchestration is None:
+        raise HTTPException(status_code=404, detail="Orchestration not found")
+    
+    return orchestration
+
+async def ws_chat(frame: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Stream one chat reply over the WebSocket channel"""
+    try:
+        input = MessageCreate(**{key: frame.get(key) for key in ("session_id", "agent_type", "content")})
+    except ValidationError as e:
+        yield {"type": "error", "data": {"detail": e.errors(include_url=False), "status": 422}}
+        return
+    if input.agent_type not in AGENTS_CONFIG:
+        yield {"type": "error", "data": {"detail": "Invalid agent type", "status": 400}}
+        return
+    
+    try:
+        events, ticket = await open_chat_stream(input, frame.get("cache") == "bypass")
+    except Overloaded as e:
+        yield {"type": "error", "data": {"detail": f"Server busy: {e.reason}", "status": e.status_code, "retry_after": e.retry_after}}
+        return
+    
+    try:
+        async for event, data in events:
+            if event != "keepalive":  # The channel has its own heartbeat
+                yield {"type": event, "data": data}
+    finally:
+        await events.aclose()
+        if ticket is not None:
+            ticket.release()
+
+async def ws_orchestrate(frame: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Run an orchestration and push each step result as it happens"""
+    try:
+        input = OrchestrationRequest(**{key: frame.get(key) for key in ("task", "steps", "timeout") if key in frame})
+    except ValidationError as e:
+        yield {"type": "error", "data": {"detail": e.errors(include_url=False), "status": 422}}
+        return
+    
+    progress: asyncio.Queue = asyncio.Queue()
+    
+    async def on_event(event: str, result: Dict[str, Any]):
+        await progress.put({"type": event, "data": result})
+    
+    run = asyncio.ensure_future(run_orchestration(input, on_event=on_event))
+    try:
+        while not run.done() or not progress.empty():
+            if progress.empty():
+                waiter = asyncio.ensure_future(progress.get())
+                await asyncio.wait({waiter, run}, return_when=asyncio.FIRST_COMPLETED)
+                if not waiter.done():
+                    waiter.cancel()
+                    continue
+                yield waiter.result()
+            else:
+                yield progress.get_nowait()
+        try:
+            orchestration = run.result()
+        except HTTPException as e:
+            yield {"type": "error", "data": {"detail": e.detail, "status": e.status_code}}
+            return
+        yield {"type": "orchestration", "data": orchestration.model_dump(mode="json")}
+    finally:
+        if not run.done():
+            run.cancel()
+
+WS_HANDLERS = {
+    "chat": ws_chat,
+    "orchestrate": ws_orchestrate,
+}
+
+@api_router.websocket("/ws")
+async def websocket_channel(websocket: WebSocket):
+    """Multiplexed channel for streamed chats and orchestration progress"""
+    connection = ChannelConnection(
+        websocket,
+        WS_HANDLERS,
+        send_queue_size=WS_SEND_QUEUE_SIZE,
+        heartbeat_seconds=WS_HEARTBEAT_SECONDS,
+        idle_timeout=WS_IDLE_TIMEOUT_SECONDS,
+        max_inflight=WS_MAX_INFLIGHT
+    )
+    await connection.run()
+
+@api_router.post("/jobs", response_model=BatchJob, response_model_exclude={"items"})
+async def create_job(input: BatchJobCreate):
+    """Submit a batch of prompts to be answered by background workers"""
+    if input.agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    if len(input.prompts) > JOB_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"A job may contain at most {JOB_MAX_PROMPTS} prompts")
+    
+    job_id = str(uuid.uuid4())
+    job = BatchJob(
+        id=job_id,
+        name=input.name,
+        agent_type=input.agent_type,
+        session_id=input.session_id or job_id,
+        total=len(input.prompts),
+        items=[BatchJobItem(index=i, prompt=prompt, status=PENDING) for i, prompt in enumerate(input.prompts)]
+    )
+    await db.jobs.insert_one(to_mongo(job))
+    job_runner.submit(job.id)
+    
+    return job
+
+@api_router.get("/jobs/{job_id}", response_model=BatchJob)
+async def get_job(job_id: str, include_items: bool = False):
+    """Get a batch job's progress, optionally with per-prompt results"""
+    projection = {"_id": 0} if include_items else {"_id": 0, "items": 0}
+    job = await db.jobs.find_one({"id": job_id}, projection)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job
+
+@api_router.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """Stream a batch job's progress as Server-Sent Events"""
+    if await db.jobs.count_documents({"id": job_id}, limit=1) == 0:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return StreamingResponse(stream_job_events(job_id), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@api_router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a batch job; prompts already answered are kept"""
+    result = await db.jobs.update_one(
+        {"id": job_id, "status": {"$nin": list(TERMINAL_STATUSES)}},
+        {"$set": {"status": CANCELLED, "updated_at": datetime.now(timezone.utc)}}
+    )
+    if result.matched_count == 0:
+        if await db.jobs.count_documents({"id": job_id}, limit=1) == 0:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail="Job already finished")
+    
+    return {"message": "Job cancelled successfully"}
+
+@api_router.post("/schedules", response_model=ScheduledTask)
+async def create_scheduled_task(input: ScheduledTaskCreate):
+    """Schedule an agent prompt to run at `run_at`, optionally repeating and publishing the reply"""
+    if input.agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    if input.every_seconds is not None and input.every_seconds < SCHEDULE_MIN_INTERVAL_SECONDS:
+        raise HTTPException(status_code=400, detail=f"every_seconds must be at least {SCHEDULE_MIN_INTERVAL_SECONDS:g}")
+    
+    run_at = input.run_at if input.run_at.tzinfo else input.run_at.replace(tzinfo=timezone.utc)
+    task_id = str(uuid.uuid4())
+    task = ScheduledTask(
+        id=task_id,
+        **input.model_dump(exclude={"run_at", "session_id"}),
+        session_id=input.session_id or task_id,
+        run_at=run_at.astimezone(timezone.utc)
+    )
+    await db.scheduled_tasks.insert_one(to_mongo(task))
+    task_scheduler.submit(task.id, task.run_at)
+    
+    return task
+
+@api_router.get("/schedules", response_model=List[ScheduledTask])
+async def get_scheduled_tasks(
+    status: Optional[ScheduledTaskStatus] = None,
+    agent_type: Optional[AgentType] = None,
+    limit: int = Query(50, ge=1, le=SCHEDULE_PAGE_MAX)
+):
+    """List scheduled tasks by next run time"""
+    query: Dict[str, Any] = {}
+    if status:
+        query["status"] = status
+    if agent_type:
+        query["agent_type"] = agent_type
+    
+    cursor = db.scheduled_tasks.find(query, {"_id": 0}).sort([("run_at", 1), ("id", 1)])
+    return await cursor.to_list(limit)
+
+@api_router.get("/schedules/stats")
+async def get_scheduler_stats():
+    """Timer heap, worker pool and claim counters for this process"""
+    return task_scheduler.stats()
+
+@api_router.get("/schedules/{task_id}", response_model=ScheduledTask)
+async def get_scheduled_task(task_id: str):
+    """Get a scheduled task with its last output and publish result"""
+    task = await db.scheduled_tasks.find_one({"id": task_id}, {"_id": 0})
+    if task is None:
+        raise HTTPException(status_code=404, detail="Scheduled task not found")
+    
+    return task
+
+@api_router.delete("/schedules/{task_id}")
+async def cancel_scheduled_task(task_id: str):
+    """Cancel a scheduled task; a run already in progress finishes but is not published or repeated"""
+    result = await db.scheduled_tasks.update_one(
+        {"id": task_id, "status": {"$nin": list(TASK_TERMINAL_STATUSES)}},
+        {"$set": {"status": TASK_CANCELLED, "updated_at": datetime.now(timezone.utc)}}
+    )
+    if result.matched_count == 0:
+        if await db.scheduled_tasks.count_documents({"id": task_id}, limit=1) == 0:
+            raise HTTPException(status_code=404, detail="Scheduled task not found")
+        raise HTTPException(status_code=409, detail="Scheduled task already finished")
+    task_scheduler.forget(task_id)
+    
+    return {"message": "Scheduled task cancelled successfully"}
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Get LLM response cache hit/miss counters"""
+    return response_cache.stats()
+
+@api_router.get("/llm/stats")
+async def get_llm_stats():
+    """Get upstream LLM call counters: routing, coalescing, admission queues, history, vector memory, message writes and connection pool"""
+    return {
+        "routing": llm_router.stats(),
+        "coalescing": llm_flights.stats(),
+        "admission": admission.stats(),
+        "history": history.stats(),
+        "memory": vector_memory.stats(),
+        "message_writes": message_writer.stats(),
+        "http_pool": llm_http_pool.stats(),
+        "warmup": warmup_state
+    }
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics in the text exposition format"""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_router.delete("/cache")
+async def clear_cache(agent_type: Optional[str] = None):
+    """Clear cached LLM responses, optionally for a single agent"""
+    if agent_type and agent_type not in AGENTS_CONFIG:
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    
+    deleted = await response_cache.clear(agent_type)
+    return {"message": "Cache cleared", "deleted": deleted}
+
+@api_router.get("/images/stats")
+async def get_image_stats():
+    """Get image render pool and cache statistics"""
+    return image_renderer.stats()
 
 @api_router.post("/generate-image", response_model=ImageGenerationResponse)
 async def generate_image(input: ImageGenerationRequest):
@@ -288,45 +1791,27 @@ async def generate_image(input: ImageGenerationRequest):
         # This will allow the platform to work while we resolve the image generation
         logger.info("Generating mock image for demo purposes")
         
-        # Create a simple base64 encoded placeholder image (1x1 pixel PNG)
-        placeholder_image_base64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChAI9jU8iYwAAAABJRU5ErkJggg=="
+        # Render in the process pool (or serve the cached render)
+        image_bytes = await image_renderer.render(input.prompt)
         
-        # For demo purposes, create a simple colored square based on prompt
-        # This ensures the image generation feature works for testing
-        from PIL import Image, ImageDraw, ImageFont
-        import io
-        import hashlib
-        
-        # Create a 512x512 image with a color based on prompt hash
-        img = Image.new('RGB', (512, 512), color=(70, 130, 180))  # Steel blue default
-        draw = ImageDraw.Draw(img)
-        
-        # Add prompt text to image
-        try:
-            # Simple text overlay
-            prompt_short = input.prompt[:50] + "..." if len(input.prompt) > 50 else input.prompt
-            draw.text((20, 20), f"Generated: {prompt_short}", fill='white')
-            draw.text((20, 450), "Demo Mode - Meta AI Platform", fill='white')
-        except:
-            # If text drawing fails, just use solid color
-            pass
-        
-        # Convert to base64
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        # Store the bytes in GridFS and the metadata in generated_images
+        image = GeneratedImage(
+            prompt=input.prompt,
+            agent_session_id=input.agent_session_id,
+            content_hash=await image_store.put(image_bytes),
+            size=len(image_bytes)
+        )
+        await db.generated_images.insert_one(to_mongo(image))
         
         response_obj = ImageGenerationResponse(
-            image_base64=image_base64,
+            id=image.id,
+            url=f"/api/images/{image.id}",
+            thumbnail_url=f"/api/images/{image.id}?variant=thumb",
+            image_base64=base64.b64encode(image_bytes).decode('utf-8') if input.inline else None,
             prompt=input.prompt,
-            timestamp=datetime.now(timezone.utc)
+            timestamp=image.timestamp
         )
         
-        # Optionally store in database if session_id is provided
-        if input.agent_session_id:
-            image_dict = prepare_for_mongo(response_obj.model_dump())
-            await db.generated_images.insert_one(image_dict)
-        
         return response_obj
         
     except Exception as e:
@@ -344,6 +1829,70 @@ async def generate_image(input: ImageGenerationRequest):
         
         raise HTTPException(status_code=500, detail=error_message)
 
+async def iter_blob(grid_out, length: int) -> AsyncIterator[bytes]:
+    """Stream ``length`` bytes from the current position of a GridFS file"""
+    remaining = length
+    while remaining > 0:
+        chunk = await grid_out.read(min(IMAGE_STREAM_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+@api_router.get("/images/{image_id}")
+async def get_image(image_id: str, request: Request, variant: str = Query("full", pattern="^(full|thumb)$")):
+    """Serve a generated image (or its thumbnail) with ETag and Range support"""
+    image = await db.generated_images.find_one(
+        {"id": image_id}, {"_id": 0, "content_hash": 1, "thumbnail_hash": 1, "content_type": 1}
+    )
+    if image is None or not image.get("content_hash"):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    content_hash = image["content_hash"]
+    if variant == "thumb":
+        content_hash = image.get("thumbnail_hash")
+        if not content_hash:
+            original = await image_store.open(image["content_hash"])
+            if original is None:
+                raise HTTPException(status_code=404, detail="Image not found")
+            thumbnail = await image_renderer.thumbnail(await original.read(), IMAGE_THUMBNAIL_SIZE)
+            content_hash = await image_store.put(thumbnail)
+            await db.generated_images.update_one({"id": image_id}, {"$set": {"thumbnail_hash": content_hash}})
+    
+    etag = f'"{content_hash}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if not_modified(request, etag):
+        return not_modified_response(etag, IMAGE_CACHE_CONTROL, {"Accept-Ranges": "bytes"})
+    
+    grid_out = await image_store.open(content_hash)
+    if grid_out is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    length = grid_out.length
+    try:
+        byte_range = parse_range(request.headers.get("range"), length)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+    
+    start, end = byte_range or (0, length - 1)
+    if start:
+        grid_out.seek(start)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    
+    return StreamingResponse(
+        iter_blob(grid_out, end - start + 1),
+        status_code=206 if byte_range else 200,
+        media_type=image.get("content_type", "image/png"),
+        headers=headers
+    )
+
+@app.exception_handler(ArchiveBusy)
+async def archive_busy_handler(request: Request, exc: ArchiveBusy):
+    # Another worker is moving the session between tiers; that takes seconds
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -353,8 +1902,12 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Has-More", "X-Before-Cursor", "X-After-Cursor", "X-Next-Cursor", "X-Next-Offset", CACHE_HEADER, "Retry-After", "ETag", "Content-Range", "Server-Timing"],
 )
 
+# Outermost, so route latency and Server-Timing cover the whole request
+app.add_middleware(MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -362,6 +1915,70 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def warm_up():
+    """Run the STARTUP_WARMUP steps; failures are logged and left to first use"""
+    async def warm_llm():
+        if LLM_BACKEND != "stub":
+            await asyncio.to_thread(llm_sdk)
+    
+    steps = {"llm": warm_llm, "images": image_renderer.warm}
+    warmup_state["status"] = "running"
+    for name in STARTUP_WARMUP:
+        if name not in steps:
+            logger.warning(f"Unknown warm-up step '{name}'")
+            continue
+        started = time.perf_counter()
+        try:
+            await steps[name]()
+            warmup_state["steps"][name] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1)}
+        except Exception as e:
+            logger.error(f"Warm-up step '{name}' failed: {e}")
+            warmup_state["steps"][name] = {"ok": False, "error": str(e)}
+    warmup_state["status"] = "done"
+
+async def create_indexes():
+    # Keyset pagination over a session's history walks this index in both directions
+    await db.messages.create_index(
+        [("session_id", 1), ("timestamp", 1), ("id", 1)],
+        name="session_timestamp_id"
+    )
+    await response_cache.ensure_indexes()
+    await db.jobs.create_index("id", unique=True, name="id_unique")
+    # Session lists are sorted by recency, optionally within one agent
+    # Unique ids on chat_sessions, messages and generated_images keep imports idempotent under concurrency
+    await ensure_unique_ids(db)
+    await db.chat_sessions.create_index([("updated_at", -1), ("id", -1)], name="updated_at_id")
+    await db.chat_sessions.create_index([("agent_type", 1), ("updated_at", -1), ("id", -1)], name="agent_type_updated_at_id")
+    await db.generated_images.create_index("agent_session_id", name="agent_session_id")
+    await image_store.ensure_indexes()
+    await history.ensure_indexes()
+    await message_search.ensure_indexes()
+    await db.jobs.create_index([("status", 1), ("created_at", 1)], name="status_created_at")
+    await retention.ensure_indexes()
+    await analytics.ensure_indexes()
+    await task_scheduler.ensure_indexes()
+
+async def startup():
+    await create_indexes()
+    # Not awaited: the worker starts serving while the warm-up runs
+    if STARTUP_WARMUP:
+        spawn_background(warm_up())
+    await asyncio.to_thread(vector_memory.load)
+    await job_runner.start()
+    await task_scheduler.start()
+    await analytics.start()
+    await retention.start()
+
+async def shutdown():
+    """Stop the workers, then let pending writes land before the database client closes"""
+    await job_runner.stop()
+    await task_scheduler.stop()
+    await retention.stop()
+    # Counter updates and partial replies still queue writes, so they go before the writer stops
+    await drain_background_tasks(SHUTDOWN_DRAIN_SECONDS)
+    await message_writer.stop()
+    await analytics.stop()
+    await vector_memory.save()
+    await llm_http_pool.stop()
+    image_renderer.shutdown()
+    client.close()
@@ -0,0 +1,28 @@
+"""Denormalized chat session counters.
+
+Each session document carries ``message_count``, ``last_message_preview``
+and an ``updated_at`` that follows its newest message, so session lists can
+be filtered and sorted by recency without touching ``messages``.
+"""
+from datetime import datetime
+from typing import Any, Dict
+
+PREVIEW_CHARS = 160
+
+# Lifecycle bookkeeping (soft delete, archive tier) never returned by the API or exported
+INTERNAL_FIELDS = ("deleted_at", "archive_state", "archive_state_at", "archived_at", "rehydrated_at")
+
+def message_preview(content: str) -> str:
+    """Single-line, length-capped excerpt of a message"""
+    text = " ".join(content.split())
+    if len(text) <= PREVIEW_CHARS:
+        return text
+    return text[:PREVIEW_CHARS - 1].rstrip() + "…"
+
+def activity_update(count: int, last_content: str, last_at: datetime) -> Dict[str, Any]:
+    """Atomic session update for ``count`` new messages ending with ``last_content``"""
+    return {
+        "$inc": {"message_count": count},
+        "$set": {"last_message_preview": message_preview(last_content)},
+        "$max": {"updated_at": last_at},
+    }
@@ -0,0 +1,51 @@
+"""Coalescing of identical concurrent upstream calls.
+
+The first caller for a key starts the call; everyone arriving while it is in
+flight awaits the same task and receives the same result or exception.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Share one in-flight call between all callers using the same key"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.counters = {"executed": 0, "coalesced": 0, "errors": 0, "abandoned": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finish(key, call))
+            self.counters["executed"] += 1
+        else:
+            self.counters["coalesced"] += 1
+
+        call.waiters += 1
+        try:
+            # Shield so one caller disconnecting does not cancel the call for the others
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is left to receive the answer
+                self.counters["abandoned"] += 1
+                call.task.cancel()
+
+    def _finish(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled() and call.task.exception() is not None:
+            self.counters["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._calls), **self.counters}
@@ -0,0 +1,59 @@
+"""Deterministic stand-in for LlmChat, for load tests and offline development.
+
+Enabled with ``LLM_BACKEND=stub``. Replies are derived from a hash of the
+prompt, so identical prompts get identical answers, and are paced to a
+configurable first-token latency and token rate so benchmarks see
+realistic upstream timing without network access or API keys.
+"""
+import os
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+STUB_WORDS = [
+    "strateji", "içerik", "analiz", "kampanya", "hedef", "kitle", "veri", "plan",
+    "büyüme", "etkileşim", "rapor", "bütçe", "zamanlama", "trend", "öneri", "sonuç",
+]
+
+@dataclass
+class StubUserMessage:
+    """UserMessage lookalike, so the stub backend never imports the real SDK"""
+    text: str
+
+class StubLlmChat:
+    """Offline LlmChat lookalike with tunable latency and token rate"""
+
+    def __init__(self, api_key=None, session_id: str = "", system_message: str = ""):
+        self.session_id = session_id
+        self.system_message = system_message
+        self.provider = self.model = None
+        self.latency = float(os.environ.get('LLM_STUB_LATENCY_MS', '300')) / 1000
+        self.tokens_per_second = float(os.environ.get('LLM_STUB_TOKENS_PER_SECOND', '50'))
+        self.reply_tokens = int(os.environ.get('LLM_STUB_REPLY_TOKENS', '60'))
+        self.error_rate = float(os.environ.get('LLM_STUB_ERROR_RATE', '0'))
+
+    def with_model(self, provider: str, model: str) -> "StubLlmChat":
+        self.provider, self.model = provider, model
+        return self
+
+    def _reply(self, text: str):
+        digest = hashlib.sha256(f"{self.model}\n{self.system_message}\n{text}".encode("utf-8")).digest()
+        if digest[0] / 255 < self.error_rate:
+            raise RuntimeError("Stub upstream error")
+        words = [STUB_WORDS[digest[i % len(digest)] % len(STUB_WORDS)] for i in range(self.reply_tokens)]
+        return [word + " " for word in words]
+
+    async def stream_message(self, message) -> AsyncIterator[str]:
+        tokens = self._reply(message.text)
+        await asyncio.sleep(self.latency)
+        for token in tokens:
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield token
+
+    async def send_message(self, message) -> str:
+        tokens = self._reply(message.text)
+        delay = self.latency + (len(tokens) / self.tokens_per_second if self.tokens_per_second > 0 else 0)
+        await asyncio.sleep(delay)
+        return "".join(tokens).strip()
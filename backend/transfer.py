@@ -0,0 +1,285 @@
+"""Bulk export and import of chat sessions as gzip'd NDJSON.
+
+An export is one JSON record per line: a header, then each session followed
+by its messages (and, optionally, its generated images with their PNG bytes
+inline). Records are read straight off Mongo cursors and compressed as they
+go, so memory stays flat however large the dataset is.
+
+Imports stream the same format back in unordered ``insert_many`` batches.
+Records whose ``id`` is already stored are skipped, so an interrupted import
+can simply be run again. The unique ``id`` indexes (``ensure_unique_ids``)
+make that hold for concurrent imports and imports racing live writes too:
+a lookup filters most repeats up front and duplicate-key errors count the
+rest as skipped.
+"""
+import zlib
+import base64
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from http_cache import json_bytes, json_loads
+from sessions import INTERNAL_FIELDS
+from write_buffer import DUPLICATE_KEY
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "meta-ai-sessions"
+FORMAT_VERSION = 1
+
+# Record type -> (collection, datetime fields written as ISO strings)
+RECORD_TYPES = {
+    "session": ("chat_sessions", ("created_at", "updated_at")),
+    "message": ("messages", ("timestamp",)),
+    "image": ("generated_images", ("timestamp",)),
+}
+
+COMPRESS_CHUNK_BYTES = 256 * 1024
+
+async def ensure_unique_ids(db):
+    """Unique ``id`` index on every record collection (replacing the older non-unique "id" index)"""
+    for collection_name, _ in RECORD_TYPES.values():
+        collection = db[collection_name]
+        indexes = await collection.index_information()
+        try:
+            if "id" in indexes:
+                await collection.drop_index("id")
+            await collection.create_index("id", unique=True, name="id_unique")
+        except OperationFailure as e:
+            # Existing duplicates; keep lookups indexed until they are cleaned up
+            logger.error(f"{collection_name}: cannot build the unique id index, run `migrations.py unique-ids`: {e}")
+            await collection.create_index("id", name="id")
+
+def session_query(session_ids: Optional[Iterable[str]] = None, agent_type: Optional[str] = None) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"deleted_at": None}
+    if session_ids:
+        query["id"] = {"$in": list(session_ids)}
+    if agent_type:
+        query["agent_type"] = agent_type
+    return query
+
+async def image_record(image: Dict[str, Any], image_store) -> Optional[Dict[str, Any]]:
+    grid_out = await image_store.open(image["content_hash"])
+    if grid_out is None:
+        return None
+    # Thumbnails are derived data; the target regenerates them on first request
+    image.pop("thumbnail_hash", None)
+    return {"type": "image", "data": image, "blob": base64.b64encode(await grid_out.read()).decode("ascii")}
+
+async def export_records(
+    db,
+    image_store=None,
+    session_ids: Optional[Iterable[str]] = None,
+    agent_type: Optional[str] = None,
+    batch_size: int = 500,
+    archive=None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield export records; images are included when an image store is given.
+    
+    ``archive`` (a SessionRetention) lets archived sessions be exported from
+    their compressed parts without rehydrating them.
+    """
+    filtered = bool(session_ids or agent_type)
+    yield {
+        "type": "header",
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "exported_at": datetime.now(timezone.utc),
+        "images": image_store is not None,
+    }
+
+    sessions = db.chat_sessions.find(session_query(session_ids, agent_type), {"_id": 0}, batch_size=batch_size)
+    async for session in sessions:
+        state = session.get("archive_state")
+        for field in INTERNAL_FIELDS:
+            session.pop(field, None)
+        yield {"type": "session", "data": session}
+        if archive is not None and archive.reads_archive(state):
+            async for message in archive.iter_archived_messages(session["id"]):
+                yield {"type": "message", "data": message}
+        # Live messages too: anything written after the archive run (repeats are skipped on import)
+        messages = db.messages.find(
+            {"session_id": session["id"]}, {"_id": 0}, batch_size=batch_size
+        ).sort([("session_id", 1), ("timestamp", 1), ("id", 1)])
+        async for message in messages:
+            yield {"type": "message", "data": message}
+        if image_store is not None:
+            async for image in db.generated_images.find({"agent_session_id": session["id"]}, {"_id": 0}):
+                record = await image_record(image, image_store)
+                if record is not None:
+                    yield record
+
+    if image_store is not None and not filtered:
+        # Images generated outside any session
+        async for image in db.generated_images.find({"agent_session_id": None}, {"_id": 0}):
+            record = await image_record(image, image_store)
+            if record is not None:
+                yield record
+
+async def gzip_ndjson(records: AsyncIterator[Dict[str, Any]], level: int = 6) -> AsyncIterator[bytes]:
+    """Encode records as gzip'd NDJSON; compression of each chunk runs in a thread"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending: List[bytes] = []
+    size = 0
+    async for record in records:
+        line = json_bytes(record) + b"\n"
+        pending.append(line)
+        size += len(line)
+        if size >= COMPRESS_CHUNK_BYTES:
+            chunk = await asyncio.to_thread(compressor.compress, b"".join(pending))
+            pending, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b"".join(pending)) + compressor.flush()
+
+async def read_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Parse NDJSON from byte chunks, gunzipping when the stream starts with the gzip magic"""
+    decompressor = None
+    started = False
+    buffer = b""
+    line_number = 0
+
+    def parse(line: bytes) -> Optional[Dict[str, Any]]:
+        if not line.strip():
+            return None
+        try:
+            record = json_loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number}: invalid JSON ({e})")
+        if not isinstance(record, dict) or "type" not in record:
+            raise ValueError(f"Line {line_number}: expected an object with a 'type'")
+        return record
+
+    async for chunk in chunks:
+        if not started:
+            if not chunk:
+                continue
+            started = True
+            if chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        buffer += decompressor.decompress(chunk) if decompressor else chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            record = parse(line)
+            if record is not None:
+                yield record
+
+    if decompressor is not None:
+        buffer += decompressor.flush()
+        if not decompressor.eof:
+            raise ValueError("Truncated gzip stream")
+    line_number += 1
+    record = parse(buffer)
+    if record is not None:
+        yield record
+
+def parse_datetimes(document: Dict[str, Any], fields: Iterable[str]):
+    for field in fields:
+        value = document.get(field)
+        if isinstance(value, str):
+            parsed = datetime.fromisoformat(value)
+            document[field] = parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+class Importer:
+    """Buffers imported records per collection and writes them in batches"""
+
+    def __init__(
+        self,
+        db,
+        image_store=None,
+        batch_size: int = 500,
+        on_messages: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+    ):
+        self.db = db
+        self.image_store = image_store
+        self.batch_size = batch_size
+        self.on_messages = on_messages
+        self._pending: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in RECORD_TYPES}
+        self.counts = {kind: {"inserted": 0, "skipped": 0} for kind in RECORD_TYPES}
+        self.counts["blobs"] = {"stored": 0}
+
+    async def add(self, record: Dict[str, Any]):
+        kind = record["type"]
+        if kind == "header":
+            if record.get("format") != FORMAT or record.get("version", 0) > FORMAT_VERSION:
+                raise ValueError(f"Unsupported export format {record.get('format')!r} v{record.get('version')}")
+            return
+        if kind not in RECORD_TYPES:
+            raise ValueError(f"Unknown record type {kind!r}")
+
+        document = record.get("data")
+        if not isinstance(document, dict) or not document.get("id"):
+            raise ValueError(f"{kind} record without an id")
+        document.pop("_id", None)
+        parse_datetimes(document, RECORD_TYPES[kind][1])
+
+        if kind == "image":
+            await self._store_blob(document, record.get("blob"))
+        self._pending[kind].append(document)
+        if len(self._pending[kind]) >= self.batch_size:
+            await self._flush(kind)
+
+    async def _store_blob(self, image: Dict[str, Any], blob: Optional[str]):
+        if self.image_store is None or blob is None:
+            return
+        data = base64.b64decode(blob)
+        if hashlib.sha256(data).hexdigest() != image.get("content_hash"):
+            raise ValueError(f"Image {image['id']}: blob does not match its content hash")
+        await self.image_store.put(data, image.get("content_type", "image/png"))
+        self.counts["blobs"]["stored"] += 1
+
+    async def _flush(self, kind: str):
+        batch, self._pending[kind] = self._pending[kind], []
+        if not batch:
+            return
+        collection = self.db[RECORD_TYPES[kind][0]]
+        query: Dict[str, Any] = {"id": {"$in": [document["id"] for document in batch]}}
+        if kind == "message":
+            # Lets the lookup use the session_timestamp_id index
+            query["session_id"] = {"$in": list({document["session_id"] for document in batch})}
+        existing = {document["id"] async for document in collection.find(query, {"_id": 0, "id": 1})}
+
+        fresh = []
+        for document in batch:
+            if document["id"] in existing:
+                continue
+            existing.add(document["id"])  # Repeated ids within the file
+            fresh.append(document)
+        inserted = fresh
+        if fresh:
+            try:
+                await collection.insert_many(fresh, ordered=False)
+            except BulkWriteError as e:
+                # Stored by a concurrent import or a live write since the lookup
+                errors = e.details["writeErrors"]
+                if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                    raise
+                duplicates = {error["index"] for error in errors}
+                inserted = [document for index, document in enumerate(fresh) if index not in duplicates]
+            if kind == "message" and self.on_messages is not None and inserted:
+                await self.on_messages(inserted)
+        self.counts[kind]["inserted"] += len(inserted)
+        self.counts[kind]["skipped"] += len(batch) - len(inserted)
+
+    async def finish(self) -> Dict[str, Any]:
+        for kind in RECORD_TYPES:
+            await self._flush(kind)
+        return self.counts
+
+async def import_records(
+    db,
+    records: AsyncIterator[Dict[str, Any]],
+    image_store=None,
+    batch_size: int = 500,
+    on_messages: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+) -> Dict[str, Any]:
+    """Ingest export records; returns inserted/skipped counts per record type"""
+    importer = Importer(db, image_store, batch_size, on_messages)
+    async for record in records:
+        await importer.add(record)
+    return await importer.finish()
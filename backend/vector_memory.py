@@ -0,0 +1,295 @@
+"""Local vector memory over stored messages.
+
+Messages are embedded with an offline hashing embedder (no model files or
+network), kept as rows of a float32 NumPy matrix and indexed with an
+inverted-file (IVF) index: rows are bucketed by their nearest k-means
+centroid and a query only scores the buckets closest to it. New rows are
+assigned to existing buckets on insert and the centroids are retrained as
+the matrix grows. The index catches up incrementally from the ``messages``
+collection, in insertion order, and is persisted to disk so restarts do not
+re-embed history. Searches and index updates are serialized by one lock,
+since updates run in a worker thread and resize or rebuild the arrays.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from search import inserted_since, tokenize
+
+logger = logging.getLogger(__name__)
+
+class HashingEmbedder:
+    """Signed feature hashing of word unigrams and bigrams into a fixed dimension"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                column, sign = self._bucket(feature)
+                matrix[row, column] += sign
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-9)
+
+class VectorIndex:
+    """Growable embedding matrix with an IVF index for approximate search"""
+
+    def __init__(self, dim: int, train_threshold: int = 2048, nprobe: int = 8):
+        self.dim = dim
+        self.train_threshold = train_threshold
+        self.nprobe = nprobe
+        self.vectors = np.zeros((1024, dim), dtype=np.float32)
+        self.count = 0
+        self.ids: List[str] = []
+        self.known: Set[str] = set()
+        self.sessions: List[str] = []
+        self.deleted = np.zeros(1024, dtype=bool)
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(1024, dtype=np.int32)
+        self.lists: List[List[int]] = []
+        self.trained_at = 0
+
+    def _reserve(self, extra: int):
+        capacity = len(self.vectors)
+        if self.count + extra <= capacity:
+            return
+        while capacity < self.count + extra:
+            capacity *= 2
+        self.vectors = np.resize(self.vectors, (capacity, self.dim))
+        self.deleted = np.resize(self.deleted, capacity)
+        self.assignments = np.resize(self.assignments, capacity)
+        self.deleted[self.count:] = False
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray, sessions: Sequence[str]):
+        if not len(ids):
+            return
+        self._reserve(len(ids))
+        start = self.count
+        self.vectors[start:start + len(ids)] = vectors
+        self.ids.extend(ids)
+        self.known.update(ids)
+        self.sessions.extend(sessions)
+        self.count += len(ids)
+
+        if self.count >= max(self.train_threshold, 4 * self.trained_at):
+            self.train()
+        elif self.centroids is not None:
+            self._assign(range(start, self.count))
+
+    def train(self, iterations: int = 8, sample_size: int = 20000, seed: int = 0):
+        """Recompute k-means centroids and re-bucket every row"""
+        rng = np.random.default_rng(seed)
+        nlist = max(int(np.sqrt(self.count)), 1)
+        live = self.vectors[:self.count]
+        sample = live[rng.choice(self.count, size=min(sample_size, self.count), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            for index in range(nlist):
+                members = sample[nearest == index]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[index] = centroid / max(np.linalg.norm(centroid), 1e-9)
+        self.centroids = centroids
+        self.lists = [[] for _ in range(nlist)]
+        self._assign(range(self.count))
+        self.trained_at = self.count
+
+    def _assign(self, rows: range):
+        if not len(rows):
+            return
+        nearest = np.argmax(self.vectors[rows.start:rows.stop] @ self.centroids.T, axis=1)
+        self.assignments[rows.start:rows.stop] = nearest
+        for row, bucket in zip(rows, nearest):
+            self.lists[bucket].append(row)
+
+    def remove_session(self, session_id: str):
+        for row, session in enumerate(self.sessions):
+            if session == session_id:
+                self.deleted[row] = True
+
+    def search(self, vector: np.ndarray, k: int, exclude_session: Optional[str] = None) -> List[Tuple[str, float]]:
+        if not self.count:
+            return []
+        if self.centroids is None:
+            rows = np.arange(self.count)
+        else:
+            probe = np.argsort(self.centroids @ vector)[-self.nprobe:]
+            rows = np.fromiter((row for bucket in probe for row in self.lists[bucket]), dtype=np.int64)
+        if exclude_session is not None or self.deleted[:self.count].any():
+            keep = ~self.deleted[rows]
+            if exclude_session is not None:
+                keep &= np.array([self.sessions[row] != exclude_session for row in rows], dtype=bool)
+            rows = rows[keep]
+        if not len(rows):
+            return []
+
+        scores = self.vectors[rows] @ vector
+        top = np.argpartition(-scores, min(k, len(rows)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[rows[i]], float(scores[i])) for i in top]
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Copy the live state so it can be written outside the event loop"""
+        return {
+            "vectors": self.vectors[:self.count].copy(),
+            "ids": np.array(self.ids, dtype=str),
+            "sessions": np.array(self.sessions, dtype=str),
+            "deleted": self.deleted[:self.count].copy(),
+            "centroids": self.centroids.copy() if self.centroids is not None else np.zeros((0, self.dim), np.float32),
+            "assignments": self.assignments[:self.count].copy(),
+            "trained_at": np.array(self.trained_at),
+        }
+
+    def restore(self, data: Dict[str, np.ndarray]):
+        count = len(data["ids"])
+        self.count = 0
+        self._reserve(count)
+        self.vectors[:count] = data["vectors"]
+        self.deleted[:count] = data["deleted"]
+        self.assignments[:count] = data["assignments"]
+        self.ids = data["ids"].tolist()
+        self.known = set(self.ids)
+        self.sessions = data["sessions"].tolist()
+        self.count = count
+        self.trained_at = int(data["trained_at"])
+        self.centroids = data["centroids"] if len(data["centroids"]) else None
+        if self.centroids is not None:
+            self.lists = [[] for _ in range(len(self.centroids))]
+            for row, bucket in enumerate(self.assignments[:count]):
+                self.lists[bucket].append(row)
+
+class VectorMemory:
+    """Keeps the vector index in step with ``messages`` and answers recall queries"""
+
+    def __init__(
+        self,
+        db,
+        path: Path,
+        dim: int = 256,
+        save_every: int = 500,
+        sync_batch: int = 2000,
+        settle_seconds: float = 5
+    ):
+        self.db = db
+        self.path = Path(path)
+        self.embedder = HashingEmbedder(dim)
+        self.index = VectorIndex(dim)
+        self.save_every = save_every
+        self.sync_batch = sync_batch
+        self.settle_seconds = settle_seconds
+        self._position: Optional[ObjectId] = None
+        self._unsaved = 0
+        self._lock = asyncio.Lock()
+        self.counters = {"queries": 0, "embedded": 0, "saves": 0}
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path) as data:
+                self.index.restore({key: data[key] for key in data.files})
+                position = str(data["position"])
+                self._position = ObjectId(position) if position else None
+        except Exception as e:
+            logger.error(f"Could not load vector memory from {self.path}, rebuilding: {e}")
+            self.index = VectorIndex(self.embedder.dim)
+            self._position = None
+
+    async def save(self):
+        async with self._lock:
+            snapshot = self.index.snapshot()
+            position = str(self._position) if self._position else ""
+            self._unsaved = 0
+        snapshot["position"] = np.array(position)
+        await asyncio.to_thread(self._write, snapshot)
+        self.counters["saves"] += 1
+
+    def _write(self, snapshot: Dict[str, np.ndarray]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(".tmp.npz")
+        np.savez(temporary, **snapshot)
+        os.replace(temporary, self.path)
+
+    async def sync(self) -> int:
+        """Embed messages stored since the last sync; returns how many were added"""
+        added = 0
+        async with self._lock:
+            query = inserted_since(self._position, self.settle_seconds)
+            while True:
+                batch = await self.db.messages.find(
+                    query, {"id": 1, "session_id": 1, "content": 1}
+                ).sort("_id", 1).limit(self.sync_batch).to_list(self.sync_batch)
+                if not batch:
+                    break
+                fresh = [message for message in batch if message["id"] not in self.index.known]
+                if fresh:
+                    # Embedding and the occasional retrain are CPU work; keep them off the event loop
+                    await asyncio.to_thread(self._add_batch, fresh)
+                self._position = max(self._position or batch[-1]["_id"], batch[-1]["_id"])
+                query = {"_id": {"$gt": batch[-1]["_id"]}}
+                added += len(fresh)
+                if len(batch) < self.sync_batch:
+                    break
+            self._unsaved += added
+            self.counters["embedded"] += added
+        return added
+
+    async def add_backfilled(self, messages: List[Dict[str, Any]]) -> int:
+        """Embed messages as soon as they are inserted (imports, rehydrated archives), ahead of the next sync"""
+        async with self._lock:
+            batch = [message for message in messages if message["id"] not in self.index.known]
+            if batch:
+                await asyncio.to_thread(self._add_batch, batch)
+                self._unsaved += len(batch)
+                self.counters["embedded"] += len(batch)
+        return len(batch)
+
+    def _add_batch(self, batch: List[Dict[str, Any]]):
+        vectors = self.embedder.embed([m["content"] for m in batch])
+        self.index.add([m["id"] for m in batch], vectors, [m["session_id"] for m in batch])
+
+    async def forget_session(self, session_id: str):
+        async with self._lock:
+            self.index.remove_session(session_id)
+
+    async def recall(self, text: str, k: int, exclude_session: Optional[str] = None,
+                     min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """Return the stored messages most similar to ``text``, best first"""
+        self.counters["queries"] += 1
+        await self.sync()
+        if self._unsaved >= self.save_every:
+            await self.save()
+
+        vector = self.embedder.embed([text])[0]
+        async with self._lock:
+            hits = self.index.search(vector, k, exclude_session)
+        ranked = [(message_id, score) for message_id, score in hits if score > min_score]
+        if not ranked:
+            return []
+        scores = dict(ranked)
+        documents = await self.db.messages.find({"id": {"$in": list(scores)}}, {"_id": 0}).to_list(len(scores))
+        return sorted(documents, key=lambda doc: -scores[doc["id"]])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "vectors": self.index.count,
+            "dim": self.embedder.dim,
+            "buckets": len(self.index.lists),
+            "unsaved": self._unsaved,
+            **self.counters,
+        }
@@ -0,0 +1,114 @@
+"""Write-behind buffer for hot-path inserts.
+
+Documents are queued in memory and written by a single flusher with ordered
+``insert_many`` batches, group-commit style: a write to an idle buffer is
+sent at once, and writes that arrive while an insert is in flight are sent
+together as the next batch. Under load concurrent requests share round-trips
+instead of each paying for its own ``insert_one``, and a lone write never
+waits on a timer. Writes reach the database in the
+order they were queued (across batches too), which keeps a user message
+ahead of the reply that answers it. Every write returns a future that
+resolves once the document is stored, for callers that need the ack.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+class WriteBehindBuffer:
+    """Batches inserts into one collection; flush on shutdown with stop()"""
+
+    def __init__(self, collection, max_batch: int = 100):
+        self.collection = collection
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.counters = {"writes": 0, "batches": 0, "failed": 0, "max_batch_seen": 0}
+
+    def write(self, document: Dict[str, Any]) -> asyncio.Future:
+        """Queue a document; the returned future resolves when it is stored"""
+        loop = asyncio.get_running_loop()
+        if self._closing and (self._task is None or self._task.done()):
+            # Stopped already (late writes during shutdown): write directly
+            return asyncio.ensure_future(self.collection.insert_one(document))
+
+        future = loop.create_future()
+        # Callers that do not await still get failures logged, not "never retrieved" warnings
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending.append((document, future))
+        self.counters["writes"] += 1
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # No linger: whatever queues up during this flush becomes the next batch
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            if not self._pending:
+                self._wakeup.clear()
+            if batch:
+                await self._flush(batch)
+            if self._closing and not self._pending:
+                return
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        self.counters["batches"] += 1
+        self.counters["max_batch_seen"] = max(self.counters["max_batch_seen"], len(batch))
+        start = 0
+        while start < len(batch):
+            try:
+                await self.collection.insert_many([document for document, _ in batch[start:]], ordered=True)
+                self._resolve(batch[start:])
+                return
+            except BulkWriteError as e:
+                # Ordered writes stop at the first error: everything before it is stored
+                error = e.details["writeErrors"][0]
+                failed = start + error["index"]
+                self._resolve(batch[start:failed])
+                if error.get("code") == DUPLICATE_KEY:
+                    self._resolve(batch[failed:failed + 1])  # Already stored by an earlier attempt
+                else:
+                    self._fail(batch[failed:failed + 1], e)
+                start = failed + 1
+            except Exception as e:
+                self._fail(batch[start:], e)
+                return
+
+    def _resolve(self, items):
+        for _, future in items:
+            if not future.done():
+                future.set_result(None)
+
+    def _fail(self, items, error: Exception):
+        self.counters["failed"] += len(items)
+        logger.error(f"Write-behind insert into {self.collection.name} failed for {len(items)} document(s): {error}")
+        for _, future in items:
+            if not future.done():
+                future.set_exception(error)
+
+    async def stop(self):
+        """Flush everything queued and stop the flusher"""
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._pending),
+            "max_batch": self.max_batch,
+            **self.counters,
+        }
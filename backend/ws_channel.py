@@ -0,0 +1,144 @@
+"""Multiplexed WebSocket channel.
+
+One connection carries any number of concurrent requests. Every client frame
+is a JSON object with a ``type``; request frames also carry a client-chosen
+``request_id`` that is echoed on every frame the server sends back for that
+request, so chats with several sessions and agents can interleave freely.
+
+Built-in frame types are ``ping``/``pong`` (heartbeat) and ``cancel``
+(abort an in-flight request). Everything else is dispatched to a handler
+that yields the frames to send. Outgoing frames go through a bounded queue
+drained by a single sender, so a slow client slows its producers down
+instead of growing memory. Receiving, sending and the heartbeat run side by
+side; the connection ends when the first of them does (client gone, socket
+closed under the sender, or idle timeout).
+"""
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict
+
+from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]
+
+class ChannelConnection:
+    """Serve one WebSocket client until it disconnects or goes idle"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        handlers: Dict[str, Handler],
+        send_queue_size: int,
+        heartbeat_seconds: float,
+        idle_timeout: float,
+        max_inflight: int
+    ):
+        self.websocket = websocket
+        self.handlers = handlers
+        self.heartbeat_seconds = heartbeat_seconds
+        self.idle_timeout = idle_timeout
+        self.max_inflight = max_inflight
+        self._outbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=send_queue_size)
+        self._requests: Dict[str, asyncio.Task] = {}
+        self._last_seen = time.monotonic()
+
+    async def run(self):
+        await self.websocket.accept()
+        receiver = asyncio.create_task(self._receiver())
+        sender = asyncio.create_task(self._sender())
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            await asyncio.wait((receiver, sender, heartbeat), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            tasks = [*self._requests.values(), receiver, sender, heartbeat]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if heartbeat.done() and not heartbeat.cancelled() and self.websocket.application_state == WebSocketState.CONNECTED:
+            # Idle: nothing reads or writes the socket any more, so close it exactly once
+            try:
+                await self.websocket.close(code=1001)
+            except (WebSocketDisconnect, RuntimeError):
+                pass
+
+    async def _receiver(self):
+        while True:
+            try:
+                message = json.loads(await self.websocket.receive_text())
+            except (WebSocketDisconnect, RuntimeError):
+                return
+            except (ValueError, TypeError, KeyError):
+                await self.send({"type": "error", "data": {"detail": "Frames must be JSON objects"}})
+                continue
+            self._last_seen = time.monotonic()
+            if not isinstance(message, dict):
+                await self.send({"type": "error", "data": {"detail": "Frames must be JSON objects"}})
+                continue
+            await self._dispatch(message)
+
+    async def send(self, frame: Dict[str, Any]):
+        """Queue a frame, waiting while the client is behind"""
+        await self._outbox.put(frame)
+
+    async def _dispatch(self, message: Dict[str, Any]):
+        frame_type = message.get("type")
+        request_id = message.get("request_id")
+
+        if frame_type == "ping":
+            await self.send({"type": "pong"})
+            return
+        if frame_type == "pong":
+            return
+        if frame_type == "cancel":
+            task = self._requests.get(request_id)
+            if task is not None:
+                task.cancel()
+            return
+
+        handler = self.handlers.get(frame_type)
+        if handler is None:
+            await self.send({"type": "error", "request_id": request_id, "data": {"detail": f"Unknown frame type '{frame_type}'"}})
+            return
+        if not request_id or request_id in self._requests:
+            await self.send({"type": "error", "request_id": request_id, "data": {"detail": "A unique request_id is required"}})
+            return
+        if len(self._requests) >= self.max_inflight:
+            await self.send({"type": "error", "request_id": request_id, "data": {"detail": "Too many requests in flight on this connection", "status": 429}})
+            return
+
+        self._requests[request_id] = asyncio.create_task(self._run_request(handler, request_id, message))
+
+    async def _run_request(self, handler: Handler, request_id: str, message: Dict[str, Any]):
+        try:
+            async for frame in handler(message):
+                await self.send({**frame, "request_id": request_id})
+        except asyncio.CancelledError:
+            try:
+                self._outbox.put_nowait({"type": "cancelled", "request_id": request_id})
+            except asyncio.QueueFull:
+                pass
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket request {request_id} failed: {e}")
+            await self.send({"type": "error", "request_id": request_id, "data": {"detail": str(e)}})
+        finally:
+            self._requests.pop(request_id, None)
+
+    async def _sender(self):
+        while True:
+            frame = await self._outbox.get()
+            try:
+                await self.websocket.send_text(json.dumps(frame, ensure_ascii=False, default=str))
+            except (WebSocketDisconnect, RuntimeError):
+                return  # Closed under us; run() tears the connection down
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            if time.monotonic() - self._last_seen > self.idle_timeout:
+                return  # run() closes the socket
+            await self.send({"type": "ping"})
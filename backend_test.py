@@ -1,7 +1,8 @@
 import requests
 import sys
 import json
-from datetime import datetime
+import gzip
+from datetime import datetime, timezone
 import time
 
 class MetaAIBackendTester:
@@ -149,6 +150,45 @@ class MetaAIBackendTester:
         
         return success, response
 
+    def test_stream_message(self):
+        """Test streaming a message response as Server-Sent Events"""
+        if not self.session_id:
+            self.log_test("Stream Message", False, "No session ID available")
+            return False, {}
+        
+        url = f"{self.api_url}/chat/stream"
+        test_data = {
+            "session_id": self.session_id,
+            "agent_type": "research",
+            "content": "Kısaca SEO nedir?"
+        }
+        
+        print(f"\n🔍 Testing Stream Message...")
+        print(f"   URL: {url}")
+        
+        try:
+            events = []
+            with requests.post(url, json=test_data, stream=True, timeout=60) as response:
+                print(f"   Status: {response.status_code}")
+                if response.status_code != 200:
+                    self.log_test("Stream Message", False, f"Expected 200, got {response.status_code}")
+                    return False, {}
+                
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and line.startswith("event: "):
+                        events.append(line[len("event: "):])
+            
+            if events and events[0] == "start" and events[-1] == "done":
+                self.log_test("Stream Message", True, f"Received {len(events)} events")
+                return True, {"events": events}
+            
+            self.log_test("Stream Message", False, f"Unexpected event sequence: {events[:5]}...{events[-2:]}")
+            return False, {}
+        
+        except Exception as e:
+            self.log_test("Stream Message", False, f"Request error: {str(e)}")
+            return False, {}
+
     def test_get_messages(self):
         """Test getting messages for a session"""
         if not self.session_id:
@@ -157,6 +197,59 @@ class MetaAIBackendTester:
         
         return self.run_test("Get Messages", "GET", f"chat/{self.session_id}/messages", 200)
 
+    def test_get_latest_messages(self):
+        """Test the latest-N pagination mode for session messages"""
+        if not self.session_id:
+            self.log_test("Get Latest Messages", False, "No session ID available")
+            return False, {}
+        
+        success, response = self.run_test(
+            "Get Latest Messages", "GET", f"chat/{self.session_id}/messages?latest=true&limit=1", 200
+        )
+        
+        if success:
+            if isinstance(response, list) and len(response) <= 1:
+                self.log_test("Pagination Limit Validation", True, f"Returned {len(response)} message(s)")
+            else:
+                self.log_test("Pagination Limit Validation", False, "Limit not applied")
+        
+        return success, response
+
+    def test_search_messages(self):
+        """Test full-text search over stored messages"""
+        success, response = self.run_test(
+            "Search Messages", "GET", "search?q=sosyal%20medya&agent_type=content&limit=5", 200
+        )
+        
+        if success:
+            if isinstance(response, list) and len(response) <= 5 and all('score' in hit for hit in response):
+                self.log_test("Search Results Validation", True, f"Returned {len(response)} ranked hit(s)")
+            else:
+                self.log_test("Search Results Validation", False, "Unexpected search results")
+        
+        return success, response
+
+    def test_export_import(self):
+        """Test round-tripping a session through export and an idempotent import"""
+        print(f"\n🔍 Testing Export/Import...")
+        try:
+            export = requests.get(f"{self.api_url}/export", params={"session_id": self.session_id}, timeout=60)
+            lines = [json.loads(line) for line in gzip.decompress(export.content).splitlines()]
+            imported = requests.post(f"{self.api_url}/import", data=export.content, timeout=60)
+        except Exception as e:
+            self.log_test("Export/Import", False, f"Error: {str(e)}")
+            return False
+        
+        types = [line["type"] for line in lines]
+        success = export.status_code == 200 and types[:2] == ["header", "session"] and "message" in types
+        self.log_test("Export Session", success, f"Status: {export.status_code}, records: {len(lines)}")
+        
+        # Everything in the file already exists, so nothing is inserted again
+        counts = imported.json() if imported.status_code == 200 else {}
+        idempotent = imported.status_code == 200 and counts["session"]["inserted"] == 0 and counts["message"]["inserted"] == 0
+        self.log_test("Import Idempotency", idempotent, f"Status: {imported.status_code}, counts: {counts}")
+        return success and idempotent
+
     def test_generate_image(self):
         """Test image generation"""
         test_data = {
@@ -169,7 +262,7 @@ class MetaAIBackendTester:
         
         if success:
             # Verify response has required fields
-            required_fields = ['image_base64', 'prompt', 'timestamp']
+            required_fields = ['id', 'url', 'thumbnail_url', 'prompt', 'timestamp']
             missing_fields = [field for field in required_fields if field not in response]
             
             if missing_fields:
@@ -177,22 +270,155 @@ class MetaAIBackendTester:
             else:
                 self.log_test("Image Response Validation", True, "All required fields present")
                 
-                # Check if we got a base64 image
-                image_data = response.get('image_base64', '')
-                if len(image_data) > 1000:  # Base64 images should be quite long
-                    self.log_test("Image Data Quality", True, f"Image data length: {len(image_data)} chars")
-                else:
-                    self.log_test("Image Data Quality", False, "Image data too short or empty")
+                # Check that the image bytes are served from the returned URL
+                try:
+                    image_response = requests.get(f"{self.base_url}{response['url']}", timeout=30)
+                    if image_response.status_code == 200 and len(image_response.content) > 1000:
+                        self.log_test("Image Data Quality", True, f"Image size: {len(image_response.content)} bytes")
+                    else:
+                        self.log_test("Image Data Quality", False, f"Status {image_response.status_code}, {len(image_response.content)} bytes")
+                    
+                    etag = image_response.headers.get('ETag')
+                    cached_response = requests.get(
+                        f"{self.base_url}{response['url']}", headers={'If-None-Match': etag or ''}, timeout=30
+                    )
+                    self.log_test("Image Conditional GET", cached_response.status_code == 304,
+                                  f"Status: {cached_response.status_code}")
+                except Exception as e:
+                    self.log_test("Image Data Quality", False, f"Request error: {str(e)}")
         
         return success, response
 
+    def test_orchestrate(self):
+        """Test running a small multi-agent plan"""
+        test_data = {
+            "task": "Yeni bir kahve markası için tanıtım gönderisi hazırla",
+            "steps": [
+                {"id": "research", "agent_type": "research"},
+                {"id": "growth", "agent_type": "growth"},
+                {"id": "content", "agent_type": "content", "depends_on": ["research", "growth"]}
+            ]
+        }
+        
+        success, response = self.run_test("Orchestrate", "POST", "orchestrate", 200, test_data, timeout=240)
+        
+        if success:
+            statuses = {step['id']: step['status'] for step in response.get('steps', [])}
+            if set(statuses) == {"research", "growth", "content"}:
+                self.log_test("Orchestration Steps Validation", True, f"Step statuses: {statuses}")
+            else:
+                self.log_test("Orchestration Steps Validation", False, f"Unexpected steps: {statuses}")
+        
+        return success, response
+
+    def test_batch_job(self):
+        """Test submitting a batch job and polling it to completion"""
+        test_data = {
+            "agent_type": "content",
+            "prompts": ["Pazartesi için kısa bir gönderi yaz", "Salı için kısa bir gönderi yaz"]
+        }
+        
+        success, response = self.run_test("Create Batch Job", "POST", "jobs", 200, test_data)
+        if not success or 'id' not in response:
+            return success, response
+        
+        job_id = response['id']
+        for _ in range(60):
+            time.sleep(3)
+            success, job = self.run_test("Poll Batch Job", "GET", f"jobs/{job_id}", 200)
+            if not success:
+                return success, job
+            if job.get('status') in ('completed', 'failed', 'cancelled'):
+                passed = job['status'] == 'completed' and job.get('completed') == 2
+                self.log_test("Batch Job Completion", passed, f"Status: {job['status']}, completed: {job.get('completed')}")
+                return passed, job
+        
+        self.log_test("Batch Job Completion", False, "Job did not finish in time")
+        return False, {}
+
+    def test_scheduled_task(self):
+        """Test scheduling a publisher prompt and waiting for it to run and publish"""
+        test_data = {
+            "agent_type": "publisher",
+            "prompt": "Yarın sabah için kısa bir Instagram gönderisi yaz",
+            "run_at": datetime.now(timezone.utc).isoformat(),
+            "publish": True,
+            "target": "instagram"
+        }
+        
+        success, response = self.run_test("Create Scheduled Task", "POST", "schedules", 200, test_data)
+        if not success or 'id' not in response:
+            return success, response
+        
+        task_id = response['id']
+        for _ in range(40):
+            time.sleep(3)
+            success, task = self.run_test("Poll Scheduled Task", "GET", f"schedules/{task_id}", 200)
+            if not success:
+                return success, task
+            if task.get('status') in ('completed', 'failed', 'cancelled'):
+                passed = task['status'] == 'completed' and bool(task.get('output')) and bool(task.get('published'))
+                self.log_test("Scheduled Task Completion", passed, f"Status: {task['status']}, published: {task.get('published')}")
+                self.run_test("Cancel Finished Scheduled Task", "DELETE", f"schedules/{task_id}", 409)
+                return passed, task
+        
+        self.log_test("Scheduled Task Completion", False, "Task did not run in time")
+        return False, {}
+
+    def test_metrics(self):
+        """Test the Prometheus metrics endpoint"""
+        print(f"\n🔍 Testing Metrics...")
+        try:
+            response = requests.get(f"{self.api_url}/metrics", timeout=30)
+        except Exception as e:
+            self.log_test("Metrics", False, f"Error: {str(e)}")
+            return False
+        
+        success = response.status_code == 200 and "http_request_duration_seconds" in response.text
+        self.log_test("Metrics", success, f"Status: {response.status_code}")
+        
+        if success:
+            self.log_test("Server-Timing Header", "Server-Timing" in response.headers, response.headers.get("Server-Timing", "missing"))
+        
+        return success
+
+    def test_conditional_get(self):
+        """Test ETag revalidation on read endpoints"""
+        print(f"\n🔍 Testing Conditional GET...")
+        try:
+            first = requests.get(f"{self.api_url}/agents", timeout=30)
+            etag = first.headers.get("ETag")
+            second = requests.get(f"{self.api_url}/agents", headers={"If-None-Match": etag or ""}, timeout=30)
+        except Exception as e:
+            self.log_test("Conditional GET", False, f"Error: {str(e)}")
+            return False
+        
+        success = bool(etag) and second.status_code == 304
+        self.log_test("Conditional GET", success, f"ETag: {etag}, revalidation status: {second.status_code}")
+        return success
+
+    def test_analytics(self):
+        """Test the usage rollup endpoints"""
+        success, response = self.run_test("Analytics Summary", "GET", "analytics/summary?days=7", 200)
+        if success:
+            missing = [field for field in ("from", "to", "totals", "breakdown") if field not in response]
+            self.log_test("Analytics Summary Fields", not missing, f"Missing fields: {missing}" if missing else "All fields present")
+        
+        daily_success, _ = self.run_test("Analytics Daily", "GET", "analytics/daily?agent_type=report", 200)
+        self.run_test("Analytics Invalid Agent", "GET", "analytics/summary?agent_type=invalid_agent", 400)
+        return success and daily_success
+
     def test_delete_session(self):
         """Test deleting a session"""
         if not self.session_id:
             self.log_test("Delete Session", False, "No session ID available")
             return False, {}
         
-        return self.run_test("Delete Session", "DELETE", f"sessions/{self.session_id}", 200)
+        success, response = self.run_test("Delete Session", "DELETE", f"sessions/{self.session_id}", 200)
+        if success:
+            # Messages are purged in the background but hidden immediately
+            self.run_test("Deleted Session Messages", "GET", f"chat/{self.session_id}/messages", 404)
+        return success, response
 
     def test_invalid_agent_type(self):
         """Test error handling with invalid agent type"""
@@ -224,11 +450,27 @@ class MetaAIBackendTester:
         if self.session_id:
             self.test_send_message()
             time.sleep(2)  # Brief pause between tests
+            self.test_stream_message()
             self.test_get_messages()
+            self.test_get_latest_messages()
+            self.test_search_messages()
+            self.test_export_import()
+        
+        # Orchestration tests
+        self.test_orchestrate()
+        
+        # Batch job and scheduled task tests
+        self.test_batch_job()
+        self.test_scheduled_task()
         
         # Image generation tests
         self.test_generate_image()
         
+        # Observability tests
+        self.test_metrics()
+        self.test_conditional_get()
+        self.test_analytics()
+        
         # Cleanup tests
         self.test_delete_session()
         
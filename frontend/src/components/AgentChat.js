@@ -81,7 +81,9 @@ const AgentChat = ({ agents }) => {
     if (!sessionId) return;
     
     try {
-      const response = await axios.get(`${API}/chat/${sessionId}/messages`);
+      const response = await axios.get(`${API}/chat/${sessionId}/messages`, {
+        params: { latest: true, limit: 200 }
+      });
       setMessages(response.data);
     } catch (error) {
       console.error('Error loading messages:', error);
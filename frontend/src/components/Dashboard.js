@@ -95,7 +95,7 @@ const Dashboard = ({ agents }) => {
         prompt: imagePrompt
       });
       
-      setGeneratedImage(response.data.image_base64);
+      setGeneratedImage(`${BACKEND_URL}${response.data.url}`);
     } catch (error) {
       console.error('Error generating image:', error);
       setGeneratedImage(null);
@@ -208,7 +208,7 @@ const Dashboard = ({ agents }) => {
                   {generatedImage && (
                     <div className="mt-4" data-testid="generated-image-container">
                       <img 
-                        src={`data:image/png;base64,${generatedImage}`}
+                        src={generatedImage}
                         alt="Generated"
                         className="w-full rounded-lg border border-emerald-400/30"
                       />
@@ -0,0 +1,79 @@
+"""Offline unit tests for backend modules, run against mongomock.
+
+The backend uses flat imports (``from history import ...``), so its
+directory goes on the path. Endpoint tests import the app with the stub LLM
+and the in-memory database, the same setup as ``loadtest.py --in-memory``.
+"""
+import io
+import os
+import sys
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+os.environ.update({
+    "LLM_BACKEND": "stub",
+    "LLM_STUB_LATENCY_MS": "0",
+    "LLM_STUB_TOKENS_PER_SECOND": "100000",
+    "MONGO_URL": "mongomock://",
+    "DB_NAME": "test",
+    "SEARCH_BACKEND": "memory",  # mongomock has no $text support
+    "STARTUP_WARMUP": "",
+    "VECTOR_MEMORY_PATH": os.path.join(tempfile.mkdtemp(), "vector_memory.npz"),
+})
+
+@asynccontextmanager
+async def api_client():
+    """The app with its startup and shutdown hooks, serving over an in-process transport"""
+    from server import app
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            yield client
+
+@pytest.fixture
+def api():
+    return api_client
+
+class MemoryImageStore:
+    """ImageStore's put/open over a dict; mongomock has no GridFS"""
+
+    def __init__(self):
+        self.blobs = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def put(self, data, content_type="image/png"):
+        content_hash = hashlib.sha256(data).hexdigest()
+        self.blobs[content_hash] = data
+        return content_hash
+
+    async def open(self, content_hash):
+        if content_hash not in self.blobs:
+            return None
+        return MemoryBlob(self.blobs[content_hash])
+
+class MemoryBlob(io.BytesIO):
+    """The parts of GridOut the image endpoint uses"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.length = len(data)
+
+    async def read(self, size=-1):
+        return super().read(size)
+
+@pytest.fixture
+def memory_images(monkeypatch):
+    import server
+
+    store = MemoryImageStore()
+    monkeypatch.setattr(server, "image_store", store)
+    return store
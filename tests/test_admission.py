@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from admission import AdmissionController, ConcurrencyLimiter, Overloaded
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        limiter = ConcurrencyLimiter("content", limit=1, max_queue=1)
+        await limiter.acquire(1)
+        waiting = asyncio.create_task(limiter.acquire(1))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as rejected:
+            await limiter.acquire(1)
+        limiter.release()
+        await waiting
+        return limiter, rejected.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.status_code == 429 and error.retry_after >= 1
+    assert limiter.counters == {"admitted": 2, "rejected": 1, "timed_out": 0}
+
+def test_wait_past_the_deadline_is_shed_with_503():
+    async def scenario():
+        controller = AdmissionController(global_limit=4, agent_limits={"content": 1}, max_queue=8, queue_timeout=10)
+        ticket = await controller.acquire("content")
+        started = time.monotonic()
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire("content", deadline=time.monotonic() + 0.05)
+        elapsed = time.monotonic() - started
+        ticket.release()
+        return controller, shed.value, elapsed
+
+    controller, error, elapsed = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert elapsed < 1  # The deadline wins over the 10s queue timeout
+    stats = controller.stats()
+    assert stats["agents"]["content"]["timed_out"] == 1
+    assert stats["agents"]["content"]["queued"] == 0 and stats["agents"]["content"]["in_use"] == 0
+    assert stats["global"]["in_use"] == 0
+
+def test_slots_are_handed_to_waiters_in_order():
+    async def scenario():
+        limiter = ConcurrencyLimiter("content", limit=1, max_queue=4)
+        await limiter.acquire(1)
+        order = []
+
+        async def wait(name):
+            await limiter.acquire(1)
+            order.append(name)
+            limiter.release()
+
+        waiters = [asyncio.create_task(wait(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*waiters)
+        return limiter, order
+
+    limiter, order = asyncio.run(scenario())
+    assert order == ["a", "b", "c"]
+    assert limiter.in_use == 0
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        limiter = ConcurrencyLimiter("content", limit=1, max_queue=4)
+        await limiter.acquire(1)
+        waiting = asyncio.create_task(limiter.acquire(1))
+        await asyncio.sleep(0)
+        limiter.release()  # Hands the slot over...
+        waiting.cancel()  # ...to a caller that gives up before running
+        outcome, = await asyncio.gather(waiting, return_exceptions=True)
+        if not isinstance(outcome, BaseException):
+            limiter.release()  # wait_for may still deliver the slot; the caller then owns it
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.in_use == 0 and not limiter._waiters
+
+def test_global_rejection_gives_back_the_agent_slot():
+    async def scenario():
+        controller = AdmissionController(global_limit=1, agent_limits={"content": 2, "research": 2}, max_queue=0, queue_timeout=1)
+        ticket = await controller.acquire("research")
+        with pytest.raises(Overloaded):
+            await controller.acquire("content")
+        ticket.release()
+        ticket.release()  # Idempotent
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["agents"]["content"]["in_use"] == 0
+    assert stats["global"]["in_use"] == 0 and stats["global"]["rejected"] == 1
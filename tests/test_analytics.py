@@ -0,0 +1,156 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+
+from mongomock_motor import AsyncMongoMockClient
+
+from analytics import (
+    DEFAULT_MODEL_PRICES, SKETCH_ACCURACY, AnalyticsRollup, day_key, estimate_cost, merge_into, sketch_bucket,
+    sketch_quantiles,
+)
+
+MODEL = "openai/gpt-5"
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+class RollupCollection:
+    """Applies bulk UpdateOne operations one by one; mongomock's bulk_write rejects pymongo operations"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.bulk_writes = 0
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        for operation in operations:
+            await self.collection.update_one(operation._filter, operation._doc, upsert=operation._upsert)
+
+    def find(self, *args, **kwargs):
+        return self.collection.find(*args, **kwargs)
+
+class FailingCollection:
+    async def bulk_write(self, operations, ordered=True):
+        raise ConnectionError("mongo down")
+
+def make_rollup():
+    db = make_db()
+    collection = RollupCollection(db.analytics_daily)
+    return AnalyticsRollup(SimpleNamespace(analytics_daily=collection), prices=DEFAULT_MODEL_PRICES), collection
+
+def test_sketch_quantiles_stay_within_the_relative_accuracy():
+    latencies = [float(ms) for ms in range(1, 1001)]
+    buckets = {}
+    for ms in latencies:
+        key = str(sketch_bucket(ms))
+        buckets[key] = buckets.get(key, 0) + 1
+
+    estimates = sketch_quantiles(buckets, (0.5, 0.95, 0.99))
+    for label, exact in (("p50", 500.5), ("p95", 950.05), ("p99", 990.01)):
+        assert abs(estimates[label] - exact) / exact <= SKETCH_ACCURACY + 0.001
+    assert sketch_quantiles({}, (0.5,)) == {"p50": None}
+
+def test_sketches_merge_by_adding_bucket_counts():
+    first, second = {"10": 2, "20": 1}, {"20": 3, "30": 1}
+    merged = {}
+    merge_into(merged, {"latency": {"buckets": first, "count": 3}})
+    merge_into(merged, {"latency": {"buckets": second, "count": 4}, "flag": True})
+    assert merged == {"latency": {"buckets": {"10": 2, "20": 4, "30": 1}, "count": 7}}
+
+def test_estimate_cost_uses_per_million_token_prices():
+    assert estimate_cost(DEFAULT_MODEL_PRICES, MODEL, 1_000_000, 100_000) == 1.25 + 1.0
+    assert estimate_cost(DEFAULT_MODEL_PRICES, "unknown/model", 1000, 1000) == 0.0
+
+def test_day_key_is_utc():
+    late_evening = datetime(2026, 3, 1, 23, 30, tzinfo=timezone(timedelta(hours=-5)))
+    assert day_key(late_evening) == "2026-03-02"
+
+def test_flush_folds_buffered_counts_into_one_document_per_day_agent_and_model():
+    async def scenario():
+        rollup, collection = make_rollup()
+        rollup.record_message("content", MODEL, "user")
+        rollup.record_message("content", MODEL, "assistant", cached=True)
+        rollup.record_call("content", MODEL, 0.2, "ok")
+        rollup.record_call("content", MODEL, 1.5, "timeout")
+        rollup.record_tokens("content", MODEL, 1000, 500)
+        rollup.record_message("report", MODEL, "user")
+        await rollup.flush()
+        # A second flush adds to the same documents instead of creating new ones
+        rollup.record_message("content", MODEL, "user")
+        await rollup.flush()
+        await rollup.flush()
+        documents = await collection.find({}, {"_id": 0}).to_list(None)
+        return rollup, collection, documents
+
+    rollup, collection, documents = asyncio.run(scenario())
+    content = next(document for document in documents if document["agent_type"] == "content")
+    assert len(documents) == 2
+    assert content["day"] == day_key()
+    assert content["messages"] == {"user": 2, "assistant": 1, "cached": 1}
+    assert content["calls"] == {"ok": 1, "timeout": 1}
+    assert content["latency"]["count"] == 1 and content["latency"]["sum_ms"] == 200.0
+    assert content["tokens"] == {"prompt": 1000, "completion": 500}
+    assert collection.bulk_writes == 2
+    assert rollup.stats()["buffered_keys"] == 0
+    assert rollup.counters["documents_written"] == 3
+
+def test_failed_flush_keeps_counts_for_the_next_one():
+    async def scenario():
+        rollup, collection = make_rollup()
+        rollup.db = SimpleNamespace(analytics_daily=FailingCollection())
+        rollup.record_message("content", MODEL, "user")
+        await rollup.flush()
+        rollup.record_message("content", MODEL, "user")
+        failed = rollup.counters["flush_errors"]
+        rollup.db = SimpleNamespace(analytics_daily=collection)
+        await rollup.flush()
+        return failed, await collection.find({}, {"_id": 0}).to_list(None)
+
+    failed, documents = asyncio.run(scenario())
+    assert failed == 1
+    assert documents[0]["messages"] == {"user": 2}
+
+def test_summary_and_daily_read_only_the_requested_window():
+    async def scenario():
+        rollup, collection = make_rollup()
+        today = datetime.now(timezone.utc)
+        for days_ago, agent_type, messages, calls_ok in ((0, "content", 3, 2), (1, "report", 1, 1), (40, "content", 9, 9)):
+            await collection.collection.insert_one({
+                "day": day_key(today - timedelta(days=days_ago)), "agent_type": agent_type, "model": MODEL,
+                "messages": {"user": messages}, "calls": {"ok": calls_ok, "error": 1},
+                "latency": {"count": calls_ok, "sum_ms": 300.0 * calls_ok, "buckets": {str(sketch_bucket(300.0)): calls_ok}},
+                "tokens": {"prompt": 100, "completion": 50}, "cost_usd": 0.001,
+                "updated_at": today,
+            })
+        return (
+            await rollup.summary(days=7),
+            await rollup.summary(days=7, agent_type="report"),
+            await rollup.daily(days=7),
+        )
+
+    summary, report_only, daily = asyncio.run(scenario())
+    totals = summary["totals"]
+    assert totals["messages"] == {"user": 4}
+    assert totals["calls"] == 5 and totals["errors"] == 2 and totals["error_rate"] == 0.4
+    assert totals["tokens"] == {"prompt": 200, "completion": 100}
+    assert totals["cost_usd"] == 0.002
+    assert totals["latency_ms"]["mean"] == 300.0
+    assert abs(totals["latency_ms"]["p50"] - 300.0) / 300.0 <= SKETCH_ACCURACY
+    assert [(entry["agent_type"], entry["calls"]) for entry in summary["breakdown"]] == [("content", 3), ("report", 2)]
+    assert [entry["agent_type"] for entry in report_only["breakdown"]] == ["report"]
+    assert [entry["messages"] for entry in daily["days"]] == [{"user": 1}, {"user": 3}]
+
+def test_analytics_endpoints_validate_the_agent(api):
+    async def scenario():
+        async with api() as client:
+            return (
+                await client.get("/api/analytics/summary", params={"agent_type": "unknown"}),
+                await client.get("/api/analytics/daily", params={"days": 0}),
+                await client.get("/api/analytics/summary", params={"days": 3}),
+            )
+
+    invalid_agent, invalid_days, summary = asyncio.run(scenario())
+    assert invalid_agent.status_code == 400
+    assert invalid_days.status_code == 422
+    assert summary.status_code == 200 and set(summary.json()) == {"from", "to", "totals", "breakdown"}
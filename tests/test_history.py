@@ -0,0 +1,162 @@
+import asyncio
+import sys
+import types
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from history import HistoryAssembler, compose_prompt, estimate_tokens
+from llm_pool import LlmHttpPool
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+async def seed_messages(db, session_id: str, count: int, content: str = "mesaj"):
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    await db.messages.insert_many([
+        {
+            "id": f"m{i:03d}", "session_id": session_id, "agent_type": "content",
+            "role": "user" if i % 2 == 0 else "assistant", "content": f"{content} {i}",
+            "timestamp": start + timedelta(seconds=i),
+        }
+        for i in range(count)
+    ])
+
+def make_assembler(db, spawned: list, summaries: list = None, **kwargs):
+    async def summarize(agent_type, previous, turns):
+        if summaries is not None:
+            summaries.append((agent_type, previous, [t["id"] for t in turns]))
+        return f"özet: {len(turns)} mesaj"
+
+    options = {"token_budget": 1000, "max_messages": 20, "keep_recent": 2, **kwargs}
+    return HistoryAssembler(db, summarize, spawned.append, **options)
+
+def test_first_message_is_sent_bare_without_a_context_hash():
+    async def scenario():
+        spawned = []
+        assembler = make_assembler(make_db(), spawned)
+        return await assembler.build("s1", "content", "Merhaba"), spawned
+
+    (prompt, context_hash), spawned = asyncio.run(scenario())
+    assert prompt == "Merhaba"
+    assert context_hash is None
+    assert spawned == []
+
+def test_recent_turns_are_included_oldest_first_and_exclude_the_new_message():
+    async def scenario():
+        db = make_db()
+        await seed_messages(db, "s1", 4)
+        assembler = make_assembler(db, [])
+        return await assembler.build("s1", "content", "mesaj 3", exclude_id="m003")
+
+    prompt, context_hash = asyncio.run(scenario())
+    assert prompt.index("mesaj 0") < prompt.index("mesaj 1") < prompt.index("mesaj 2")
+    assert prompt.count("mesaj 3") == 1 and prompt.endswith("[Yeni mesaj]\nmesaj 3")
+    assert context_hash is not None and len(context_hash) == 64
+
+def test_context_hash_differs_between_sessions_with_different_history():
+    async def scenario():
+        db = make_db()
+        await seed_messages(db, "a", 2, content="elma")
+        await seed_messages(db, "b", 2, content="armut")
+        assembler = make_assembler(db, [])
+        return await assembler.build("a", "content", "x"), await assembler.build("b", "content", "x")
+
+    (_, first), (_, second) = asyncio.run(scenario())
+    assert first != second
+
+def test_turns_over_the_token_budget_are_dropped_and_compaction_is_scheduled():
+    async def scenario():
+        db = make_db()
+        await seed_messages(db, "s1", 10, content="x" * 40)
+        spawned = []
+        assembler = make_assembler(db, spawned, token_budget=3 * (estimate_tokens("x" * 40 + " 0") + 4))
+        prompt, _ = await assembler.build("s1", "content", "yeni")
+        # A second truncated build while compaction is pending schedules nothing new
+        await assembler.build("s1", "content", "yeni")
+        for coroutine in spawned:
+            coroutine.close()
+        return prompt, spawned, assembler.counters
+
+    prompt, spawned, counters = asyncio.run(scenario())
+    assert [f"{'x' * 40} {i}" in prompt for i in range(10)] == [False] * 7 + [True] * 3
+    assert len(spawned) == 1
+    assert counters["truncated"] == 2
+
+def test_max_messages_caps_turns_even_within_budget():
+    async def scenario():
+        db = make_db()
+        await seed_messages(db, "s1", 6)
+        spawned = []
+        assembler = make_assembler(db, spawned, max_messages=2)
+        prompt, _ = await assembler.build("s1", "content", "yeni")
+        for coroutine in spawned:
+            coroutine.close()
+        return prompt, spawned
+
+    prompt, spawned = asyncio.run(scenario())
+    assert "mesaj 4" in prompt and "mesaj 5" in prompt and "mesaj 3" not in prompt
+    assert len(spawned) == 1
+
+def test_compaction_summarizes_older_turns_and_keeps_recent_ones_verbatim():
+    async def scenario():
+        db = make_db()
+        await seed_messages(db, "s1", 6)
+        spawned, summaries = [], []
+        assembler = make_assembler(db, spawned, summaries, max_messages=3, keep_recent=2)
+        await assembler.build("s1", "content", "yeni")
+        await spawned.pop()
+        stored = await db.session_summaries.find_one({"session_id": "s1"}, {"_id": 0})
+        prompt, _ = await assembler.build("s1", "content", "yeni")
+        return summaries, stored, prompt, assembler.stats()
+
+    summaries, stored, prompt, stats = asyncio.run(scenario())
+    assert summaries == [("content", None, ["m000", "m001", "m002", "m003"])]
+    assert stored["summary"] == "özet: 4 mesaj"
+    assert stored["covered_until"]["id"] == "m003"
+    assert stored["message_count"] == 4
+    assert prompt.startswith("[Konuşma özeti]\nözet: 4 mesaj")
+    assert "mesaj 3" not in prompt and "mesaj 4" in prompt and "mesaj 5" in prompt
+    assert stats["compactions"] == 1 and stats["compacting"] == 0
+
+def test_compaction_failure_is_counted_and_releases_the_session():
+    async def scenario():
+        db = make_db()
+        await seed_messages(db, "s1", 6)
+        spawned = []
+
+        async def summarize(agent_type, previous, turns):
+            raise RuntimeError("upstream down")
+
+        assembler = HistoryAssembler(db, summarize, spawned.append, token_budget=1000, max_messages=3, keep_recent=2)
+        await assembler.build("s1", "content", "yeni")
+        await spawned.pop()
+        return assembler, await db.session_summaries.count_documents({})
+
+    assembler, summaries = asyncio.run(scenario())
+    assert summaries == 0
+    assert assembler.counters["compaction_errors"] == 1
+    assert assembler.stats()["compacting"] == 0
+
+def test_compose_prompt_sections():
+    turns = [{"role": "user", "content": "selam"}, {"role": "assistant", "content": "merhaba"}]
+    assert compose_prompt(None, [], "yeni") == "yeni"
+    assert compose_prompt("özet", turns, "yeni") == (
+        "[Konuşma özeti]\nözet\n\n[Son mesajlar]\nKullanıcı: selam\nAsistan: merhaba\n\n[Yeni mesaj]\nyeni"
+    )
+
+def test_http_pool_hands_litellm_one_shared_client(monkeypatch):
+    litellm = types.SimpleNamespace(aclient_session=None)
+    monkeypatch.setitem(sys.modules, "litellm", litellm)
+    pool = LlmHttpPool(max_connections=10, max_keepalive=5, keepalive_expiry=30.0, timeout=60.0)
+
+    pool.start()
+    client = pool.client
+    pool.start()
+    assert litellm.aclient_session is client and pool.client is client
+    assert pool.stats()["active"] is True
+
+    asyncio.run(pool.stop())
+    assert litellm.aclient_session is None and client.is_closed
+    assert pool.stats()["active"] is False
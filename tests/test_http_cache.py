@@ -0,0 +1,66 @@
+import asyncio
+
+from starlette.requests import Request
+
+import server
+from http_cache import make_etag, not_modified
+
+def request_with(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+def test_if_none_match_uses_weak_comparison_over_a_list():
+    etag = make_etag("messages", "s", 1)
+    assert not_modified(request_with(etag), etag)
+    assert not_modified(request_with(f'"other", W/{etag}'), etag)
+    assert not_modified(request_with("*"), etag)
+    assert not not_modified(request_with(None), etag)
+    assert not not_modified(request_with(f'"x{etag[1:]}'), etag)  # Contains the tag, but is another one
+
+def test_image_revalidation_matches_whole_tags_only(api, memory_images):
+    async def scenario():
+        async with api() as client:
+            image = (await client.post("/api/generate-image", json={"prompt": "Deniz kenarında gün batımı"})).json()
+            first = await client.get(image["url"])
+            etag = first.headers["etag"]
+            listed = await client.get(image["url"], headers={"If-None-Match": f'"stale", W/{etag}'})
+            longer = await client.get(image["url"], headers={"If-None-Match": f'"v2-{etag}"'})
+            anything = await client.get(image["url"], headers={"If-None-Match": "*"})
+            return first, listed, longer, anything
+
+    first, listed, longer, anything = asyncio.run(scenario())
+    assert first.status_code == 200 and first.content
+    assert listed.status_code == 304 and listed.headers["etag"] == first.headers["etag"]
+    assert longer.status_code == 200 and longer.content == first.content
+    assert anything.status_code == 304
+
+async def settled():
+    while server._background_tasks:
+        await asyncio.gather(*server._background_tasks, return_exceptions=True)
+
+def test_message_etag_changes_with_every_stored_message(api, monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise server.UpstreamUnavailable("openai/gpt-5: ConnectionError")
+
+    async def scenario():
+        async with api() as client:
+            session_id = (await client.post("/api/sessions", json={"agent_type": "content", "name": "Deneme"})).json()["id"]
+            url = f"/api/chat/{session_id}/messages"
+            chat = {"session_id": session_id, "agent_type": "content", "content": "Merhaba"}
+            await client.post("/api/chat", json=chat)
+            first = await client.get(url)
+            unchanged = await client.get(url, headers={"If-None-Match": first.headers["etag"]})
+
+            with monkeypatch.context() as patch:
+                patch.setattr(server, "generate_reply", unavailable)
+                failed = await client.post("/api/chat", json={**chat, "content": "Orada mısın?"})
+            await settled()
+            after_failure = await client.get(url, headers={"If-None-Match": first.headers["etag"]})
+            return first, unchanged, failed, after_failure
+
+    first, unchanged, failed, after_failure = asyncio.run(scenario())
+    assert len(first.json()) == 2
+    assert unchanged.status_code == 304
+    assert failed.status_code == 502
+    assert after_failure.status_code == 200 and after_failure.headers["etag"] != first.headers["etag"]
+    assert [message["content"] for message in after_failure.json()][-1] == "Orada mısın?"
@@ -0,0 +1,39 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from image_render import ByteLRU, ImageRenderer, render_key
+
+def test_render_key_covers_every_parameter():
+    key = render_key("gün batımı", size=512)
+    assert render_key("gün batımı", size=512) == key
+    assert render_key("gün batımı", size=256) != key
+    assert render_key("Gün batımı", size=512) != key
+
+def test_byte_lru_is_bounded_by_total_size():
+    cache = ByteLRU(max_bytes=10)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    cache.get("a")
+    cache.set("c", b"1234")  # Over budget: evicts b, the least recently used
+    cache.set("huge", b"x" * 11)  # Larger than the whole cache: never stored
+    assert (cache.get("a"), cache.get("b"), cache.get("c"), cache.get("huge")) == (b"1234", None, b"1234", None)
+    assert cache.size == 8
+
+def test_renders_in_the_pool_once_per_prompt():
+    async def scenario():
+        renderer = ImageRenderer(workers=1, cache_bytes=10 * 1024 * 1024)
+        try:
+            first, second = await asyncio.gather(renderer.render("gün batımı", 64), renderer.render("gün batımı", 64))
+            again = await renderer.render("gün batımı", 64)
+            thumbnail = await renderer.thumbnail(first, 16)
+        finally:
+            renderer.shutdown()
+        return first, second, again, thumbnail, renderer.counters
+
+    first, second, again, thumbnail, counters = asyncio.run(scenario())
+    assert first == second == again
+    assert Image.open(io.BytesIO(first)).size == (64, 64)
+    assert Image.open(io.BytesIO(thumbnail)).size == (16, 16)
+    assert counters["renders"] == 1 and counters["hits"] == 1
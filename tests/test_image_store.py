@@ -0,0 +1,49 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+import server
+from image_store import parse_range
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-2", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+def test_images_are_served_by_url_with_ranges(api, memory_images):
+    async def scenario():
+        async with api() as client:
+            created = (await client.post("/api/generate-image", json={"prompt": "Dağ manzarası"})).json()
+            inline = (await client.post("/api/generate-image", json={"prompt": "Dağ manzarası", "inline": True})).json()
+            stored = await server.db.generated_images.find_one({"id": created["id"]}, {"_id": 0})
+            full = await client.get(created["url"])
+            part = await client.get(created["url"], headers={"Range": "bytes=0-15"})
+            beyond = await client.get(created["url"], headers={"Range": f"bytes={len(full.content)}-"})
+            thumb = await client.get(created["thumbnail_url"])
+            missing = await client.get("/api/images/yok")
+            return created, inline, stored, full, part, beyond, thumb, missing
+
+    created, inline, stored, full, part, beyond, thumb, missing = asyncio.run(scenario())
+    assert created["image_base64"] is None and inline["image_base64"]
+    assert "image_base64" not in stored and stored["size"] == len(full.content)
+    assert len(memory_images.blobs) == 2  # Both renders share one blob; the other is the thumbnail
+    assert full.status_code == 200 and full.headers["content-type"] == "image/png"
+    assert part.status_code == 206 and part.content == full.content[:16]
+    assert part.headers["content-range"] == f"bytes 0-15/{len(full.content)}"
+    assert beyond.status_code == 416
+    assert thumb.status_code == 200 and max(Image.open(io.BytesIO(thumb.content)).size) <= server.IMAGE_THUMBNAIL_SIZE
+    assert missing.status_code == 404
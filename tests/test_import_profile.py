@@ -0,0 +1,29 @@
+from import_profile import parse_importtime, run_importtime, summarize
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _frozen_importlib_external
+import time:       300 |        300 |     litellm.types
+import time:      2500 |       2800 |   litellm
+import time:       400 |        400 |   history
+import time:      1000 |       4200 | server
+"""
+
+def test_report_flags_eager_lazy_modules():
+    report = summarize(parse_importtime(IMPORTTIME), "server", top=2)
+    assert report["total_ms"] == 4.2 and report["modules"] == 5
+    assert report["eager_lazy_modules"] == ["litellm", "litellm.types"]
+    assert report["packages"][0] == {"package": "litellm", "ms": 2.8}
+
+def test_eager_litellm_import_is_caught_in_a_real_import(tmp_path, monkeypatch):
+    (tmp_path / "litellm").mkdir()
+    (tmp_path / "litellm" / "__init__.py").write_text("")
+    (tmp_path / "eager_app.py").write_text("import litellm\n")
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+
+    report = summarize(parse_importtime(run_importtime("eager_app")), "eager_app", top=5)
+    assert report["eager_lazy_modules"] == ["litellm"]
+
+def test_server_imports_no_lazy_modules():
+    report = summarize(parse_importtime(run_importtime("server")), "server", top=5)
+    assert report["eager_lazy_modules"] == [], report["eager_lazy_modules"]
@@ -0,0 +1,90 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from search import MessageSearch
+from vector_memory import VectorMemory
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+def message(content, timestamp, session_id="s1"):
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "agent_type": "content",
+        "role": "assistant",
+        "content": content,
+        "timestamp": timestamp,
+    }
+
+def test_late_insert_with_older_timestamp_is_indexed(tmp_path):
+    async def scenario():
+        db = make_db()
+        search = MessageSearch(db, backend="memory")
+        memory = VectorMemory(db, tmp_path / "memory.npz")
+        now = datetime.now(timezone.utc)
+
+        # A streamed reply is timestamped when the stream starts but stored when it ends
+        late = message("kampanya bütçesi planı", now - timedelta(seconds=30))
+        await db.messages.insert_one(message("haftalık rapor özeti", now))
+        await search.sync()
+        await memory.sync()
+        await db.messages.insert_one(late)
+
+        hits, _ = await search.search("kampanya")
+        recalled = await memory.recall("kampanya bütçesi planı", k=3)
+        return hits, recalled, late
+
+    hits, recalled, late = asyncio.run(scenario())
+    assert [hit["id"] for hit in hits] == [late["id"]]
+    assert late["id"] in [doc["id"] for doc in recalled]
+
+def test_resync_does_not_duplicate_vectors(tmp_path):
+    async def scenario():
+        db = make_db()
+        memory = VectorMemory(db, tmp_path / "memory.npz")
+        await db.messages.insert_many([message(f"mesaj {i}", datetime.now(timezone.utc)) for i in range(5)])
+        first = await memory.sync()
+        # The settle window is read again on every sync
+        second = await memory.sync()
+        await memory.save()
+        reloaded = VectorMemory(db, tmp_path / "memory.npz")
+        reloaded.load()
+        third = await reloaded.sync()
+        return first, second, third, memory.index.count, reloaded.index.count
+
+    assert asyncio.run(scenario()) == (5, 0, 0, 5, 5)
+
+def test_saved_memory_resumes_without_re_embedding(tmp_path):
+    async def scenario():
+        db = make_db()
+        now = datetime.now(timezone.utc)
+        await db.messages.insert_many([message(f"kampanya notu {i}", now) for i in range(3)])
+        memory = VectorMemory(db, tmp_path / "memory.npz")
+        await memory.sync()
+        await memory.save()
+
+        restarted = VectorMemory(db, tmp_path / "memory.npz")
+        restarted.load()
+        await db.messages.insert_one(message("yeni bütçe planı", now))
+        added = await restarted.sync()
+        return added, memory._position, restarted
+
+    added, saved_position, restarted = asyncio.run(scenario())
+    assert added == 1
+    assert restarted._position > saved_position
+    assert len(restarted.index.known) == 4
+
+def test_unreadable_memory_file_is_rebuilt(tmp_path):
+    async def scenario():
+        db = make_db()
+        await db.messages.insert_one(message("haftalık rapor", datetime.now(timezone.utc)))
+        (tmp_path / "memory.npz").write_bytes(b"bozuk")
+        memory = VectorMemory(db, tmp_path / "memory.npz")
+        memory.load()
+        return await memory.sync()
+
+    assert asyncio.run(scenario()) == 1
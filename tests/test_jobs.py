@@ -0,0 +1,84 @@
+import asyncio
+import uuid
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from jobs import COMPLETED, PENDING, QUEUED, RUNNING, JobRunner, item_message_id
+from transfer import ensure_unique_ids
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+def make_documents(job, item, output):
+    return [
+        {"id": item_message_id(job["id"], item["index"], role), "session_id": job["id"], "role": role, "content": content}
+        for role, content in (("user", item["prompt"]), ("assistant", output))
+    ]
+
+async def insert_job(db, items: int, **fields):
+    job = {
+        "id": str(uuid.uuid4()), "agent_type": "content", "status": QUEUED, "total": items,
+        "completed": 0, "failed": 0, "created_at": datetime.now(timezone.utc), "updated_at": datetime.now(timezone.utc),
+        "items": [{"index": i, "prompt": f"soru {i}", "status": PENDING} for i in range(items)],
+        **fields,
+    }
+    await db.jobs.insert_one(dict(job))
+    return job["id"]
+
+async def wait_for_status(db, job_id, status, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        job = await db.jobs.find_one({"id": job_id})
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job stayed {job['status']}")
+
+def test_slow_item_keeps_its_lease_against_a_second_runner():
+    calls = Counter()
+
+    async def execute(job, item):
+        calls[item["index"]] += 1
+        await asyncio.sleep(0.6)  # Several lease lengths
+        return "yanıt"
+
+    async def scenario():
+        db = make_db()
+        job_id = await insert_job(db, items=2)
+        first = JobRunner(db, execute, make_documents, lease_seconds=0.15)
+        second = JobRunner(db, execute, make_documents, lease_seconds=0.15)
+        await first.start()
+        first.submit(job_id)
+        await asyncio.sleep(0.1)
+        await second.start()  # Sees a running job with a live lease
+        job = await wait_for_status(db, job_id, COMPLETED)
+        await first.stop()
+        await second.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job["completed"] == 2
+    assert calls == {0: 1, 1: 1}
+
+def test_expired_lease_is_reclaimed_without_duplicate_messages():
+    async def execute(job, item):
+        return "yanıt"
+
+    async def scenario():
+        db = make_db()
+        await ensure_unique_ids(db)
+        expired = datetime.now(timezone.utc) - timedelta(seconds=5)
+        job_id = await insert_job(db, items=3, status=RUNNING, lease_owner="dead-worker", lease_until=expired)
+        # The dead worker stored item 0's messages but not the job update
+        await db.messages.insert_many(make_documents({"id": job_id}, {"index": 0, "prompt": "soru 0"}, "yanıt"))
+        runner = JobRunner(db, execute, make_documents, lease_seconds=0.2)
+        await runner.start()
+        job = await wait_for_status(db, job_id, COMPLETED)
+        await runner.stop()
+        return job, await db.messages.count_documents({"session_id": job_id})
+
+    job, messages = asyncio.run(scenario())
+    assert job["completed"] == 3 and "lease_owner" not in job
+    assert messages == 6
@@ -0,0 +1,89 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from llm_cache import LRUTTLCache, ResponseCache, make_cache_key
+
+def make_collection():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"].llm_cache
+
+class FailingCollection:
+    async def find_one(self, *args, **kwargs):
+        raise ConnectionError("mongo down")
+
+    async def replace_one(self, *args, **kwargs):
+        raise ConnectionError("mongo down")
+
+def test_key_ignores_whitespace_and_case_but_not_context():
+    key = make_cache_key("sistem", "openai/gpt-5", "Kampanya  fikri\nver")
+    assert make_cache_key("sistem", "openai/gpt-5", "  kampanya fikri ver ") == key
+    assert make_cache_key("sistem", "openai/gpt-5", "Kampanya fikri ver", context_hash="abc") != key
+    assert make_cache_key("sistem", "openai/gpt-4o", "Kampanya fikri ver") != key
+
+def test_lru_evicts_least_recent_and_expires_entries():
+    cache = LRUTTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+    cache.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None and len(cache) == 1
+
+def test_second_worker_is_answered_from_the_shared_tier():
+    async def scenario():
+        collection = make_collection()
+        first = ResponseCache(collection, enabled=True, maxsize=10, ttl_seconds=60)
+        second = ResponseCache(collection, enabled=True, maxsize=10, ttl_seconds=60)
+        await first.set("k", "yanıt", "research", "openai/gpt-5")
+        answers = [await second.get("k"), await second.get("k"), await second.get("missing")]
+        return answers, second.stats()
+
+    answers, stats = asyncio.run(scenario())
+    assert answers == ["yanıt", "yanıt", None]
+    assert (stats["shared_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+
+def test_expired_shared_entry_is_a_miss():
+    async def scenario():
+        collection = make_collection()
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await collection.insert_one({"_id": "k", "response": "eski", "agent_type": "research", "expires_at": past})
+        return await ResponseCache(collection, enabled=True, maxsize=10, ttl_seconds=60).get("k")
+
+    assert asyncio.run(scenario()) is None
+
+def test_shared_tier_failures_fall_back_to_memory():
+    async def scenario():
+        cache = ResponseCache(FailingCollection(), enabled=True, maxsize=10, ttl_seconds=60)
+        await cache.set("k", "yanıt", "research", "openai/gpt-5")
+        return await cache.get("k"), await cache.get("other"), cache.counters
+
+    hit, miss, counters = asyncio.run(scenario())
+    assert hit == "yanıt" and miss is None
+    assert counters["errors"] == 2 and counters["misses"] == 1
+
+def test_repeat_question_is_served_from_cache(api, monkeypatch):
+    monkeypatch.setattr(server.response_cache, "enabled", True)  # Off unless LLM_CACHE_ENABLED is set
+
+    async def scenario():
+        async with api() as client:
+            statuses = []
+            for content in ("Bu haftanın trendleri neler?", "  bu haftanın   trendleri neler? "):
+                session_id = (await client.post("/api/sessions", json={"agent_type": "research", "name": "Trend"})).json()["id"]
+                response = await client.post("/api/chat", json={"session_id": session_id, "agent_type": "research", "content": content})
+                statuses.append((response.headers["x-llm-cache"], response.json()["content"]))
+            bypassed = await client.post(
+                "/api/chat", json={"session_id": session_id, "agent_type": "research", "content": content},
+                headers={"X-LLM-Cache": "bypass"}
+            )
+            return statuses, bypassed.headers["x-llm-cache"]
+
+    (first, second), bypassed = asyncio.run(scenario())
+    assert first[0] == "miss" and second == ("hit", first[1])
+    assert bypassed == "skip"
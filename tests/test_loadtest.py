@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from loadtest import Recorder, compare, parse_mix, percentile, run_load, summarize
+from stub_llm import StubLlmChat, StubUserMessage
+
+def test_percentile_picks_nearest_rank():
+    ordered = [i / 100 for i in range(1, 101)]
+    assert percentile(ordered, 0.50) == 0.51
+    assert percentile(ordered, 0.99) == 1.0
+    assert percentile([0.2], 0.95) == 0.2
+    assert percentile([], 0.5) == 0.0
+
+def test_summarize_reports_rates_and_milliseconds():
+    summary = summarize([0.3, 0.1, 0.2, 0.4], errors=1, elapsed=2.0, statuses={"200": 3, "502": 1})
+    assert summary == {
+        "requests": 4, "errors": 1, "error_rate": 0.25, "throughput_rps": 2.0,
+        "p50_ms": 300.0, "p95_ms": 400.0, "p99_ms": 400.0, "max_ms": 400.0,
+        "statuses": {"200": 3, "502": 1},
+    }
+    assert summarize([], 0, 0.0, {})["throughput_rps"] == 0.0
+
+def test_recorder_counts_errors_and_exceptions_per_endpoint():
+    recorder = Recorder()
+    recorder.record("chat", 0.1, 200)
+    recorder.record("chat", 0.2, 502)
+    recorder.record("search", 0.05, None)
+
+    summary = recorder.summary(elapsed=1.0)
+    assert summary["endpoints"]["chat"]["statuses"] == {"200": 1, "502": 1}
+    assert summary["endpoints"]["search"]["statuses"] == {"exception": 1}
+    assert summary["total"]["requests"] == 3 and summary["total"]["errors"] == 2
+    assert "statuses" not in summary["total"]
+
+def test_parse_mix_defaults_weights_and_rejects_unknown_scenarios():
+    assert parse_mix("chat=3, agents") == {"chat": 3, "agents": 1}
+    with pytest.raises(SystemExit):
+        parse_mix("chat=1,upload=2")
+
+def endpoint(p50, p95=None, p99=None, rps=100.0, error_rate=0.0):
+    return {"p50_ms": p50, "p95_ms": p95 or p50, "p99_ms": p99 or p50, "throughput_rps": rps, "error_rate": error_rate}
+
+def test_compare_flags_only_meaningful_regressions():
+    baseline = {"endpoints": {"chat": endpoint(100.0), "agents": endpoint(1.0), "search": endpoint(10.0)}}
+    results = {"endpoints": {
+        "chat": endpoint(130.0, rps=80.0, error_rate=0.05),
+        # +100% on a 1 ms endpoint is jitter, below min_delta_ms
+        "agents": endpoint(2.0),
+        "search": endpoint(11.0),
+        "stream": endpoint(500.0),
+    }}
+
+    regressions = compare(results, baseline, tolerance=0.15)
+    assert regressions == [
+        "chat p50_ms: 100.0 -> 130.0",
+        "chat p95_ms: 100.0 -> 130.0",
+        "chat p99_ms: 100.0 -> 130.0",
+        "chat throughput_rps: 100.0 -> 80.0",
+        "chat error_rate: 0.0 -> 0.05",
+    ]
+
+def test_stub_replies_are_deterministic_and_can_fail():
+    async def scenario():
+        chat = StubLlmChat(session_id="s", system_message="sistem").with_model("openai", "gpt-5")
+        first = await chat.send_message(StubUserMessage("Merhaba"))
+        second = await chat.send_message(StubUserMessage("Merhaba"))
+        streamed = "".join([token async for token in chat.stream_message(StubUserMessage("Merhaba"))]).strip()
+        return first, second, streamed
+
+    first, second, streamed = asyncio.run(scenario())
+    assert first == second == streamed
+    assert len(first.split()) == 60
+
+    failing = StubLlmChat().with_model("openai", "gpt-5")
+    failing.error_rate = 1.0
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing.send_message(StubUserMessage("Merhaba")))
+
+def test_run_load_against_the_in_process_app(api):
+    async def scenario():
+        async with api() as client:
+            return await run_load(
+                client, concurrency=2, duration=None, total_requests=12,
+                mix={"chat": 1, "messages": 1, "agents": 1}, seed=3
+            )
+
+    results = asyncio.run(scenario())
+    assert results["total"]["requests"] == 12 + 2  # plus one session per virtual user
+    assert results["total"]["errors"] == 0
+    assert "create_session" in results["endpoints"]
+    assert set(results["endpoints"]) <= {"create_session", "chat", "messages", "agents"}
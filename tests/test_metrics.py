@@ -0,0 +1,121 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import metrics
+from metrics import MetricsMiddleware, MongoCommandTimer, Registry, server_timing_header, stage
+
+def test_counter_gauge_and_histogram_render_the_exposition_format():
+    registry = Registry()
+    calls = registry.counter("calls_total", "Calls", ("agent",))
+    in_flight = registry.gauge("in_flight", "In flight")
+    latency = registry.histogram("latency_seconds", "Latency", ("agent",), buckets=(0.1, 1.0))
+
+    calls.inc("content")
+    calls.inc("content", amount=2)
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    latency.observe(0.05, "content")
+    latency.observe(0.5, "content")
+    latency.observe(5.0, "content")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE calls_total counter" in lines
+    assert 'calls_total{agent="content"} 3.0' in lines
+    assert "in_flight 1.0" in lines
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{agent="content",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{agent="content",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{agent="content",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{agent="content"} 5.55' in lines
+    assert 'latency_seconds_count{agent="content"} 3' in lines
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("errors_total", "Errors", ("error",)).inc('bad "quote"\\\n')
+    assert 'errors_total{error="bad \\"quote\\"\\\\\\n"} 1.0' in registry.render()
+
+def test_callback_gauge_reads_samples_at_scrape_time():
+    registry = Registry()
+    queued = {"global": 0}
+    registry.callback_gauge("queued", "Queued", ("limiter",), lambda: [((name,), value) for name, value in queued.items()])
+    queued["global"] = 4
+    assert 'queued{limiter="global"} 4' in registry.render()
+
+def test_duplicate_metric_names_are_rejected():
+    registry = Registry()
+    registry.counter("calls_total", "Calls")
+    with pytest.raises(ValueError):
+        registry.gauge("calls_total", "Calls again")
+
+def test_server_timing_header_lists_stages_serialization_and_total():
+    header = server_timing_header([("context", 0.002, 10.002), ("llm", 0.5, 10.502)], started=10.0, now=10.6)
+    assert header == "context;dur=2.0, llm;dur=500.0, serialize;dur=98.0, total;dur=600.0"
+    assert server_timing_header([], started=10.0, now=10.01) == "total;dur=10.0"
+
+def test_stage_outside_a_request_still_records_the_histogram():
+    before = metrics.STAGE_LATENCY.series.get(("test-only",), [0])[-1]
+    with stage("test-only"):
+        pass
+    assert metrics.STAGE_LATENCY.series[("test-only",)][-1] == before + 1
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        with stage("lookup"):
+            await asyncio.sleep(0)
+        return {"id": item_id}
+
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+def test_middleware_adds_server_timing_and_labels_latency_by_route():
+    async def scenario():
+        transport = httpx.ASGITransport(app=make_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/items/42"), await client.get("/missing")
+
+    before = metrics.HTTP_LATENCY.series.get(("GET", "/items/{item_id}", "200"), [0])[-1]
+    found, missing = asyncio.run(scenario())
+    assert found.status_code == 200
+    entries = [entry.split(";")[0] for entry in found.headers["Server-Timing"].split(", ")]
+    assert entries == ["lookup", "serialize", "total"]
+    assert missing.headers["Server-Timing"].startswith("total;dur=")
+    assert metrics.HTTP_LATENCY.series[("GET", "/items/{item_id}", "200")][-1] == before + 1
+    assert ("GET", "/items/42", "200") not in metrics.HTTP_LATENCY.series
+    assert metrics.HTTP_IN_FLIGHT.values[()] == 0
+
+def test_mongo_command_timer_labels_commands_by_collection():
+    timer = MongoCommandTimer()
+    key = ("find", "messages_for_metrics_test", "ok")
+    before = metrics.MONGO_LATENCY.series.get(key, [0])[-1]
+
+    timer.started(SimpleNamespace(
+        command_name="find", command={"find": "messages_for_metrics_test"}, connection_id=("db", 1), request_id=7
+    ))
+    timer.succeeded(SimpleNamespace(command_name="find", duration_micros=1500, connection_id=("db", 1), request_id=7))
+
+    assert metrics.MONGO_LATENCY.series[key][-1] == before + 1
+    assert timer._collections == {}
+
+def test_metrics_endpoint_and_chat_server_timing(api):
+    async def scenario():
+        async with api() as client:
+            session = (await client.post("/api/sessions", json={"agent_type": "content", "name": "Metrik"})).json()
+            chat = await client.post("/api/chat", json={"session_id": session["id"], "agent_type": "content", "content": "Merhaba"})
+            return chat, await client.get("/api/metrics")
+
+    chat, scrape = asyncio.run(scenario())
+    assert chat.status_code == 200
+    assert {"context", "llm", "total"} <= {entry.split(";")[0] for entry in chat.headers["Server-Timing"].split(", ")}
+    assert scrape.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = scrape.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/chat",status="200"}' in body
+    assert 'request_stage_duration_seconds_count{stage="llm"}' in body
+    assert "# TYPE llm_call_duration_seconds histogram" in body
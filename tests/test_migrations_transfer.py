@@ -0,0 +1,46 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+import migrations
+from retention import ARCHIVED, SessionRetention
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+async def seed_archived_session(db, messages: int = 3) -> str:
+    session_id = str(uuid.uuid4())
+    updated_at = datetime.now(timezone.utc) - timedelta(days=90)
+    await db.chat_sessions.insert_one({
+        "id": session_id, "name": "Eski oturum", "agent_type": "content",
+        "created_at": updated_at, "updated_at": updated_at, "deleted_at": None, "archive_state": None,
+    })
+    await db.messages.insert_many([
+        {
+            "id": str(uuid.uuid4()), "session_id": session_id, "agent_type": "content",
+            "role": "user" if i % 2 == 0 else "assistant", "content": f"mesaj {i}",
+            "timestamp": updated_at + timedelta(seconds=i),
+        }
+        for i in range(messages)
+    ])
+    assert await SessionRetention(db, {}, part_messages=2).archive_session(session_id, updated_at)
+    return session_id
+
+def test_cli_export_keeps_archived_messages(tmp_path):
+    async def scenario():
+        source, target = make_db(), make_db()
+        session_id = await seed_archived_session(source)
+        session = await source.chat_sessions.find_one({"id": session_id})
+        live = await source.messages.count_documents({"session_id": session_id})
+
+        path = str(tmp_path / "export.ndjson.gz")
+        await migrations.export_sessions(source, path, None, None, images=False, batch_size=2)
+        await migrations.import_sessions(target, path, batch_size=2)
+        imported = await target.messages.find({"session_id": session_id}, {"_id": 0}).sort("timestamp", 1).to_list(None)
+        return session["archive_state"], live, imported
+
+    state, live, imported = asyncio.run(scenario())
+    assert state == ARCHIVED and live == 0
+    assert [message["content"] for message in imported] == ["mesaj 0", "mesaj 1", "mesaj 2"]
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from orchestrator import COMPLETED, FAILED, SKIPPED, TIMEOUT, PlanError, critical_path_ms, run_plan, topological_order
+
+def step(step_id, *depends_on, timeout=None, agent_type="content"):
+    return SimpleNamespace(id=step_id, agent_type=agent_type, depends_on=list(depends_on), timeout=timeout)
+
+def test_independent_steps_run_in_parallel_and_feed_their_dependents():
+    steps = [step("research"), step("seo"), step("planner"), step("content", "research", "seo", "planner")]
+    seen = {}
+
+    async def execute(current, inputs):
+        seen[current.id] = inputs
+        await asyncio.sleep(0.1)
+        return f"{current.id} çıktısı"
+
+    async def scenario():
+        started = time.monotonic()
+        results = await run_plan(steps, execute, step_timeout=5, total_timeout=5)
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(scenario())
+    assert all(result["status"] == COMPLETED for result in results.values())
+    assert elapsed < 0.35  # Two levels of 0.1s, not four steps in a row
+    assert seen["content"] == {"research": "research çıktısı", "seo": "seo çıktısı", "planner": "planner çıktısı"}
+    assert 195 <= critical_path_ms(steps, results) < 300
+
+def test_failures_skip_dependents_and_timeouts_keep_partial_results():
+    steps = [step("ok"), step("broken"), step("slow", timeout=0.05), step("after", "broken"), step("stuck")]
+
+    async def execute(current, inputs):
+        if current.id == "broken":
+            raise RuntimeError("upstream reset")
+        if current.id == "slow":
+            await asyncio.sleep(1)
+        if current.id == "stuck":
+            await asyncio.sleep(10)
+        return "tamam"
+
+    results = asyncio.run(run_plan(steps, execute, step_timeout=5, total_timeout=0.2))
+    statuses = {step_id: result["status"] for step_id, result in results.items()}
+    assert statuses == {"ok": COMPLETED, "broken": FAILED, "slow": TIMEOUT, "after": SKIPPED, "stuck": TIMEOUT}
+    assert results["broken"]["error"] == "upstream reset"
+    assert results["stuck"]["error"] == "Plan timed out" and results["ok"]["output"] == "tamam"
+
+def test_progress_events_follow_each_step():
+    events = []
+
+    async def on_event(event, result):
+        events.append((event, result["id"]))
+        raise RuntimeError("listener bug")  # Must not break the run
+
+    async def execute(current, inputs):
+        return "tamam"
+
+    results = asyncio.run(run_plan([step("a"), step("b", "a")], execute, 5, 5, on_event=on_event))
+    assert results["b"]["status"] == COMPLETED
+    assert events == [("step_started", "a"), ("step_completed", "a"), ("step_started", "b"), ("step_completed", "b")]
+
+@pytest.mark.parametrize("steps, message", [
+    ([step("a"), step("a")], "Duplicate step id"),
+    ([step("a", "missing")], "unknown step"),
+    ([step("a", "b"), step("b", "a")], "Dependency cycle"),
+])
+def test_invalid_plans_are_rejected(steps, message):
+    with pytest.raises(PlanError, match=message):
+        topological_order(steps)
+
+def test_orchestrate_endpoint_runs_the_default_plan(api):
+    async def scenario():
+        async with api() as client:
+            run = (await client.post("/api/orchestrate", json={"task": "Yeni ürün lansmanı"})).json()
+            stored = (await client.get(f"/api/orchestrate/{run['id']}")).json()
+            invalid = await client.post("/api/orchestrate", json={"task": "x", "steps": [{"id": "a", "agent_type": "content", "depends_on": ["a"]}]})
+            return run, stored, invalid.status_code
+
+    run, stored, invalid = asyncio.run(scenario())
+    assert run["status"] == "completed" and {step["status"] for step in run["steps"]} == {COMPLETED}
+    assert stored["id"] == run["id"] and len(stored["steps"]) == len(run["steps"])
+    assert invalid == 400
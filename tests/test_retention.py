@@ -0,0 +1,144 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from retention import ARCHIVED, ARCHIVING, PURGING, REHYDRATING, ArchiveBusy, SessionRetention
+from transfer import ensure_unique_ids
+
+POLICIES = {"content": {"archive_after_days": 30}}
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+async def seed_idle_session(db, messages: int = 5) -> str:
+    session_id = str(uuid.uuid4())
+    updated_at = datetime.now(timezone.utc) - timedelta(days=90)
+    await db.chat_sessions.insert_one({
+        "id": session_id, "name": "Eski oturum", "agent_type": "content", "message_count": messages,
+        "created_at": updated_at, "updated_at": updated_at, "deleted_at": None, "archive_state": None,
+    })
+    await db.messages.insert_many([
+        {
+            "id": str(uuid.uuid4()), "session_id": session_id, "agent_type": "content",
+            "role": "user" if i % 2 == 0 else "assistant", "content": f"mesaj {i}",
+            "timestamp": updated_at + timedelta(seconds=i),
+        }
+        for i in range(messages)
+    ])
+    return session_id
+
+async def session_messages(db, session_id):
+    return await db.messages.find({"session_id": session_id}, {"_id": 0}).sort("timestamp", 1).to_list(None)
+
+async def session_state(db, session_id):
+    return (await db.chat_sessions.find_one({"id": session_id})).get("archive_state")
+
+def test_idle_session_is_archived_and_rehydrated_on_access():
+    reindexed = []
+
+    async def on_messages(documents):
+        reindexed.extend(document["id"] for document in documents)
+
+    async def scenario():
+        db = make_db()
+        await ensure_unique_ids(db)
+        session_id = await seed_idle_session(db)
+        before = await session_messages(db, session_id)
+        retention = SessionRetention(db, POLICIES, part_messages=2, on_messages=on_messages)
+
+        await retention.run_once()
+        archived = (await session_state(db, session_id), await session_messages(db, session_id),
+                    await db.session_archives.count_documents({"session_id": session_id}))
+
+        await retention.ensure_hydrated(session_id)
+        await retention.run_once()  # Freshly rehydrated: not archived again straight away
+        session = await db.chat_sessions.find_one({"id": session_id})
+        return before, archived, session, await session_messages(db, session_id), retention, db
+
+    before, archived, session, after, retention, db = asyncio.run(scenario())
+    assert archived == (ARCHIVED, [], 3)
+    assert after == before
+    assert sorted(reindexed) == sorted(message["id"] for message in before)
+    assert "archive_state" not in session and session["rehydrated_at"] is not None
+    assert retention.counters["archived_sessions"] == 1 and retention.counters["rehydrated_messages"] == 5
+
+def test_reader_cancels_an_archive_still_copying():
+    async def scenario():
+        db = make_db()
+        session_id = await seed_idle_session(db)
+        retention = SessionRetention(db, POLICIES, part_messages=2)
+        set_state = retention._set_state
+        interrupted = []
+
+        async def read_during_copy(session_id, expected, state, **fields):
+            if (expected, state) == (ARCHIVING, ARCHIVING) and not interrupted:
+                interrupted.append(await session_state(db, session_id))
+                await retention.ensure_hydrated(session_id)
+            return await set_state(session_id, expected, state, **fields)
+
+        retention._set_state = read_during_copy
+        await retention.run_once()
+        return (interrupted, await session_state(db, session_id), len(await session_messages(db, session_id)),
+                await db.session_archives.count_documents({}), retention.counters)
+
+    interrupted, state, live, parts, counters = asyncio.run(scenario())
+    assert interrupted == [ARCHIVING]
+    assert state is None and live == 5 and parts == 0
+    assert counters["cancelled_archives"] == 1 and counters["archived_sessions"] == 0
+
+def test_reader_gives_up_on_a_session_held_mid_transition():
+    async def scenario():
+        db = make_db()
+        session_id = await seed_idle_session(db)
+        await db.chat_sessions.update_one(
+            {"id": session_id}, {"$set": {"archive_state": PURGING, "archive_state_at": datetime.now(timezone.utc)}}
+        )
+        retention = SessionRetention(db, POLICIES, wait_timeout=0.1)
+        with pytest.raises(ArchiveBusy):
+            await retention.ensure_hydrated(session_id)
+
+    asyncio.run(scenario())
+
+def test_stale_rehydration_is_finished_without_duplicates():
+    async def scenario():
+        db = make_db()
+        await ensure_unique_ids(db)
+        session_id = await seed_idle_session(db)
+        before = await session_messages(db, session_id)
+        retention = SessionRetention(db, POLICIES, part_messages=2, stale_after=60)
+        await retention.run_once()
+        # A process died partway through rehydrating: one message is back, the state is stale
+        await db.messages.insert_one(dict(before[0]))
+        await db.chat_sessions.update_one({"id": session_id}, {"$set": {
+            "archive_state": REHYDRATING, "archive_state_at": datetime.now(timezone.utc) - timedelta(minutes=5),
+        }})
+        await retention.run_once()
+        return before, await session_messages(db, session_id), await session_state(db, session_id)
+
+    before, after, state = asyncio.run(scenario())
+    assert after == before
+    assert state is None
+
+def test_purge_removes_everything_the_session_left_behind():
+    async def scenario():
+        db = make_db()
+        session_id = await seed_idle_session(db)
+        keep_id = await seed_idle_session(db)
+        for owner in (session_id, keep_id):
+            await db.session_summaries.insert_one({"session_id": owner, "summary": "Özet", "covered": 4})
+        retention = SessionRetention(db, POLICIES, part_messages=2)
+        await retention.run_once()  # Both archived
+        assert await retention.soft_delete(session_id)
+        await retention.run_once()
+        left = {
+            name: await db[name].count_documents({"session_id": session_id})
+            for name in ("messages", "session_archives", "session_summaries")
+        }
+        return left, await db.chat_sessions.count_documents({"id": session_id}), await db.session_summaries.count_documents({"session_id": keep_id})
+
+    left, sessions, kept = asyncio.run(scenario())
+    assert left == {"messages": 0, "session_archives": 0, "session_summaries": 0}
+    assert sessions == 0 and kept == 1
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+from routing import ModelRouter, UpstreamUnavailable
+
+class StubLLM:
+    """Per-model latency and failures; records calls and cancellations"""
+
+    def __init__(self, latency, failing=()):
+        self.latency = latency
+        self.failing = set(failing)
+        self.calls = []
+        self.cancelled = []
+
+    async def __call__(self, model, agent_type, session_id, prompt):
+        self.calls.append(model)
+        try:
+            await asyncio.sleep(self.latency[model])
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        if model in self.failing:
+            raise ConnectionError("upstream reset")
+        return f"{model}: {prompt}"
+
+def make_router(llm, hedge=True, retries=0):
+    route = {"primary": "openai/main", "fallbacks": ["anthropic/backup"], "hedge": hedge}
+    router = ModelRouter(llm, route, {"content": {}}, attempt_timeout=5, retries=retries, hedge_min_samples=5)
+    for _ in range(5):
+        router.tracker("openai/main").record(0.02)  # p95 of 20ms
+    return router
+
+def deadline(seconds=5):
+    return time.monotonic() + seconds
+
+def test_hedge_wins_and_the_slow_primary_is_cancelled():
+    llm = StubLLM({"openai/main": 1.0, "anthropic/backup": 0.01})
+
+    async def scenario():
+        router = make_router(llm)
+        result = await router.complete("content", "s", "merhaba", deadline())
+        await asyncio.sleep(0)  # Let the cancelled primary unwind
+        return router, result
+
+    router, (text, model) = asyncio.run(scenario())
+    assert model == "anthropic/backup" and text == "anthropic/backup: merhaba"
+    assert llm.cancelled == ["openai/main"]
+    assert router.counters["hedges"] == 1 and router.counters["hedges_won"] == 1
+
+def test_primary_winning_the_race_cancels_the_hedge():
+    llm = StubLLM({"openai/main": 0.06, "anthropic/backup": 1.0})
+
+    async def scenario():
+        router = make_router(llm)
+        result = await router.complete("content", "s", "merhaba", deadline())
+        await asyncio.sleep(0)
+        return router, result
+
+    router, (_, model) = asyncio.run(scenario())
+    assert model == "openai/main"
+    assert llm.calls == ["openai/main", "anthropic/backup"]
+    assert llm.cancelled == ["anthropic/backup"]
+    assert router.counters["hedges"] == 1 and router.counters["hedges_won"] == 0
+
+def test_fast_primary_is_not_hedged():
+    llm = StubLLM({"openai/main": 0.0, "anthropic/backup": 0.0})
+    async def scenario():
+        router = make_router(llm)
+        return router, await router.complete("content", "s", "merhaba", deadline())
+
+    router, (_, model) = asyncio.run(scenario())
+    assert model == "openai/main" and llm.calls == ["openai/main"]
+    assert router.counters["hedges"] == 0
+
+def test_abandoned_request_cancels_both_racers():
+    llm = StubLLM({"openai/main": 1.0, "anthropic/backup": 1.0})
+
+    async def scenario():
+        router = make_router(llm)
+        request = asyncio.create_task(router.complete("content", "s", "merhaba", deadline()))
+        await asyncio.sleep(0.1)  # Past the hedge delay: both calls are in flight
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert sorted(llm.cancelled) == ["anthropic/backup", "openai/main"]
+
+def test_failures_fall_back_then_give_up():
+    llm = StubLLM({"openai/main": 0.0, "anthropic/backup": 0.0}, failing={"openai/main", "anthropic/backup"})
+
+    async def scenario():
+        router = make_router(llm, hedge=False, retries=1)
+        with pytest.raises(UpstreamUnavailable) as failed:
+            await router.complete("content", "s", "merhaba", deadline())
+        return router, failed.value
+
+    router, error = asyncio.run(scenario())
+    assert llm.calls == ["openai/main", "openai/main", "anthropic/backup"]
+    assert "openai/main" in str(error) and "anthropic/backup" in str(error)
+    assert router.counters["retries"] == 1 and router.counters["fallbacks"] == 1
@@ -0,0 +1,163 @@
+import asyncio
+import uuid
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from publishers import LocalPublisher
+from scheduler import CANCELLED, COMPLETED, FAILED, RUNNING, SCHEDULED, TaskScheduler, next_occurrence
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+async def insert_task(db, **fields):
+    now = datetime.now(timezone.utc)
+    task = {
+        "id": str(uuid.uuid4()), "agent_type": "publisher", "prompt": "Paylaşım yaz", "session_id": "s",
+        "run_at": now - timedelta(seconds=1), "status": SCHEDULED, "attempts": 0, "runs": 0,
+        "publish": False, "created_at": now, "updated_at": now,
+        **fields,
+    }
+    await db.scheduled_tasks.insert_one(dict(task))
+    return task["id"]
+
+async def wait_for_status(db, task_id, status, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        task = await db.scheduled_tasks.find_one({"id": task_id})
+        if task["status"] == status:
+            return task
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"task stayed {task['status']}")
+
+def test_expired_lease_is_reclaimed():
+    calls = Counter()
+
+    async def execute(task):
+        calls[task["id"]] += 1
+        return "yanıt"
+
+    async def scenario():
+        db = make_db()
+        past = datetime.now(timezone.utc) - timedelta(seconds=5)
+        task_id = await insert_task(db, status=RUNNING, lease_owner="dead:1:0", lease_until=past, attempts=1)
+        scheduler = TaskScheduler(db, execute, lease_seconds=1, refresh_interval=0.1)
+        await scheduler.start()
+        task = await wait_for_status(db, task_id, COMPLETED)
+        await scheduler.stop()
+        return task_id, task
+
+    task_id, task = asyncio.run(scenario())
+    assert calls[task_id] == 1
+    assert task["runs"] == 1 and task["output"] == "yanıt"
+    assert "lease_owner" not in task and "lease_until" not in task
+
+def test_live_lease_is_left_alone():
+    calls = Counter()
+
+    async def execute(task):
+        calls[task["id"]] += 1
+        return "yanıt"
+
+    async def scenario():
+        db = make_db()
+        future = datetime.now(timezone.utc) + timedelta(seconds=30)
+        task_id = await insert_task(db, status=RUNNING, lease_owner="other:1:0", lease_until=future)
+        scheduler = TaskScheduler(db, execute, lease_seconds=1, refresh_interval=0.05)
+        await scheduler.start()
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        return await db.scheduled_tasks.find_one({"id": task_id})
+
+    task = asyncio.run(scenario())
+    assert not calls
+    assert task["status"] == RUNNING and task["lease_owner"] == "other:1:0"
+
+def test_two_schedulers_run_each_task_once():
+    calls = Counter()
+
+    async def execute(task):
+        calls[task["id"]] += 1
+        await asyncio.sleep(0.02)
+        return "yanıt"
+
+    async def scenario():
+        db = make_db()
+        task_ids = [await insert_task(db) for _ in range(8)]
+        schedulers = [TaskScheduler(db, execute, workers=3, refresh_interval=0.05) for _ in range(2)]
+        for scheduler in schedulers:
+            await scheduler.start()
+        for task_id in task_ids:
+            await wait_for_status(db, task_id, COMPLETED)
+        for scheduler in schedulers:
+            await scheduler.stop()
+        return task_ids, schedulers
+
+    task_ids, schedulers = asyncio.run(scenario())
+    assert sorted(calls) == sorted(task_ids) and set(calls.values()) == {1}
+    assert sum(scheduler.counters["claimed"] for scheduler in schedulers) == len(task_ids)
+
+def test_failing_task_is_retried_then_failed():
+    calls = Counter()
+
+    async def execute(task):
+        calls[task["id"]] += 1
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        db = make_db()
+        task_id = await insert_task(db)
+        scheduler = TaskScheduler(db, execute, refresh_interval=0.05, max_retries=1, retry_delay=0.01)
+        await scheduler.start()
+        task = await wait_for_status(db, task_id, FAILED)
+        await scheduler.stop()
+        return task_id, task, scheduler
+
+    task_id, task, scheduler = asyncio.run(scenario())
+    assert calls[task_id] == 2
+    assert task["error"] == "upstream down" and task["runs"] == 1
+    assert scheduler.counters["retried"] == 1 and scheduler.counters["failed"] == 1
+
+def test_task_cancelled_mid_run_is_not_published_or_repeated():
+    async def scenario():
+        db = make_db()
+        running = asyncio.Event()
+
+        async def execute(task):
+            running.set()
+            await asyncio.sleep(0.1)
+            return "yanıt"
+
+        task_id = await insert_task(db, publish=True, every_seconds=60)
+        scheduler = TaskScheduler(db, execute, publisher=LocalPublisher(db), refresh_interval=0.05)
+        await scheduler.start()
+        await running.wait()
+        await db.scheduled_tasks.update_one({"id": task_id}, {"$set": {"status": CANCELLED}})
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return await db.scheduled_tasks.find_one({"id": task_id}), await db.published_posts.count_documents({}), scheduler
+
+    task, posts, scheduler = asyncio.run(scenario())
+    assert task["status"] == CANCELLED and task["runs"] == 0
+    assert posts == 0
+    assert scheduler.counters["leases_lost"] == 1
+
+def test_missed_runs_collapse_into_one():
+    run_at = datetime(2026, 1, 1, 9, 0, tzinfo=timezone.utc)
+    now = run_at + timedelta(minutes=5, seconds=30)
+    assert next_occurrence(run_at, 60, now) == run_at + timedelta(minutes=6)
+    assert next_occurrence(run_at, None, now) is None
+
+def test_schedule_list_validates_its_filters_and_page_size(api):
+    async def scenario():
+        async with api() as client:
+            statuses = {}
+            for query in ("status=scheduled", "status=bogus", "agent_type=publisher", "agent_type=nope",
+                          "limit=1", f"limit={server.SCHEDULE_PAGE_MAX}", f"limit={server.SCHEDULE_PAGE_MAX + 1}"):
+                statuses[query] = (await client.get(f"/api/schedules?{query}")).status_code
+            return statuses
+
+    statuses = asyncio.run(scenario())
+    assert list(statuses.values()) == [200, 422, 200, 422, 200, 200, 422]
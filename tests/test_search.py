@@ -0,0 +1,205 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from search import InvertedIndex, MessageSearch, tokenize
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+async def seed(db, session_id, content, deleted=False, agent_type="content", timestamp=None):
+    now = datetime.now(timezone.utc)
+    if not await db.chat_sessions.find_one({"id": session_id}):
+        await db.chat_sessions.insert_one({"id": session_id, "agent_type": agent_type, "deleted_at": now if deleted else None})
+    message_id = str(uuid.uuid4())
+    await db.messages.insert_one({
+        "id": message_id, "session_id": session_id, "agent_type": agent_type,
+        "role": "user", "content": content, "timestamp": timestamp or now,
+    })
+    return message_id
+
+class RecordingCursor:
+    def __init__(self, filters):
+        self.filters = filters
+
+    def sort(self, *args):
+        return self
+
+    def skip(self, offset):
+        return self
+
+    def limit(self, limit):
+        return self
+
+    async def to_list(self, length):
+        return []
+
+class RecordingMessages:
+    """Captures the $text query; mongomock cannot run it"""
+
+    def __init__(self):
+        self.queries = []
+
+    def find(self, filters, projection=None):
+        self.queries.append(filters)
+        return RecordingCursor(filters)
+
+def test_memory_backend_hides_soft_deleted_sessions():
+    async def scenario():
+        db = make_db()
+        await seed(db, "live", "kampanya bütçesi")
+        await seed(db, "gone", "kampanya takvimi", deleted=True)
+        search = MessageSearch(db, backend="memory")
+        hits, _ = await search.search("kampanya")
+        scoped, _ = await search.search("kampanya", session_id="gone")
+        return hits, scoped
+
+    hits, scoped = asyncio.run(scenario())
+    assert [hit["session_id"] for hit in hits] == ["live"]
+    assert scoped == []
+
+def test_mongo_backend_excludes_soft_deleted_sessions_in_the_query():
+    async def scenario():
+        db = make_db()
+        await seed(db, "live", "kampanya bütçesi")
+        await seed(db, "gone", "kampanya takvimi", deleted=True)
+        messages = RecordingMessages()
+        search = MessageSearch(SimpleNamespace(chat_sessions=db.chat_sessions, messages=messages))
+        await search.search("kampanya")
+        await search.search("kampanya", session_id="live")
+        scoped = await search.search("kampanya", session_id="gone")
+        return messages.queries, scoped
+
+    queries, scoped = asyncio.run(scenario())
+    assert queries[0]["session_id"] == {"$nin": ["gone"]}
+    assert queries[1]["session_id"] == "live"
+    assert len(queries) == 2 and scoped == ([], False)
+
+def indexed(*contents):
+    index = InvertedIndex()
+    start = datetime.now(timezone.utc)
+    for i, content in enumerate(contents):
+        index.add({
+            "id": f"m{i}", "session_id": "s1", "agent_type": "content",
+            "content": content, "timestamp": start + timedelta(seconds=i),
+        })
+    return index
+
+def ranked(index, query):
+    return [message_id for message_id, _ in index.search(query, agent_type=None, session_id=None, since=None, until=None)]
+
+def test_tokenize_casefolds_and_drops_single_characters():
+    assert tokenize("Kampanya BÜTÇE, a 2025!") == ["kampanya", "bütçe", "2025"]
+
+def test_bm25_prefers_rarer_terms_and_denser_matches():
+    index = indexed(
+        "kampanya bütçesi",
+        "kampanya takvimi ve kampanya bütçesi",
+        "takvim",
+        "kampanya",
+    )
+    # Both terms in a short message beat both in a long one; "kampanya" alone ranks last
+    assert ranked(index, "bütçesi kampanya") == ["m0", "m1", "m3"]
+
+def test_equal_scores_rank_newest_first():
+    index = indexed("rapor hazır", "rapor hazır")
+    assert ranked(index, "rapor") == ["m1", "m0"]
+
+def test_removed_messages_leave_the_index():
+    index = indexed("kampanya bütçesi", "kampanya takvimi")
+    index.remove("m0")
+    assert ranked(index, "kampanya") == ["m1"]
+    assert "bütçesi" not in index.postings
+    index.remove_session("s1")
+    assert index.docs == {} and index.total_length == 0
+
+def test_memory_backend_filters_by_agent_session_and_time():
+    async def scenario():
+        db = make_db()
+        now = datetime.now(timezone.utc)
+        await seed(db, "a", "rapor taslağı", agent_type="report", timestamp=now - timedelta(days=3))
+        await seed(db, "a", "rapor son hali", agent_type="report", timestamp=now)
+        await seed(db, "b", "rapor fikirleri", agent_type="content", timestamp=now)
+        search = MessageSearch(db, backend="memory")
+        by_agent, _ = await search.search("rapor", agent_type="report")
+        by_session, _ = await search.search("rapor", session_id="b")
+        recent, _ = await search.search("rapor", since=now - timedelta(days=1))
+        older, _ = await search.search("rapor", until=now - timedelta(days=1))
+        return by_agent, by_session, recent, older
+
+    by_agent, by_session, recent, older = asyncio.run(scenario())
+    assert {hit["content"] for hit in by_agent} == {"rapor taslağı", "rapor son hali"}
+    assert [hit["content"] for hit in by_session] == ["rapor fikirleri"]
+    assert {hit["content"] for hit in recent} == {"rapor son hali", "rapor fikirleri"}
+    assert [hit["content"] for hit in older] == ["rapor taslağı"]
+
+def test_memory_backend_pages_and_picks_up_new_messages():
+    async def scenario():
+        db = make_db()
+        for i in range(5):
+            await seed(db, "s1", f"kampanya notu {i}")
+        search = MessageSearch(db, backend="memory")
+        first, first_more = await search.search("kampanya", limit=3)
+        second, second_more = await search.search("kampanya", offset=3, limit=3)
+        await seed(db, "s1", "yeni kampanya")
+        everything, _ = await search.search("kampanya", limit=10)
+        return first, first_more, second, second_more, everything, search.stats()
+
+    first, first_more, second, second_more, everything, stats = asyncio.run(scenario())
+    assert (len(first), first_more, len(second), second_more) == (3, True, 2, False)
+    assert not {hit["id"] for hit in first} & {hit["id"] for hit in second}
+    assert len(everything) == 6 and all(hit["score"] > 0 for hit in everything)
+    assert stats["backend"] == "memory" and stats["indexed_messages"] == 6 and stats["queries"] == 3
+
+def test_memory_backend_drops_hits_whose_messages_were_deleted():
+    async def scenario():
+        db = make_db()
+        gone = await seed(db, "s1", "kampanya bütçesi")
+        await seed(db, "s1", "kampanya takvimi")
+        search = MessageSearch(db, backend="memory")
+        await search.search("kampanya")
+        await db.messages.delete_one({"id": gone})
+        hits, _ = await search.search("kampanya")
+        return hits, search.index.docs
+
+    hits, docs = asyncio.run(scenario())
+    assert [hit["content"] for hit in hits] == ["kampanya takvimi"]
+    assert len(docs) == 1
+
+def test_mongo_backend_builds_the_text_query_with_filters():
+    async def scenario():
+        db = make_db()
+        messages = RecordingMessages()
+        search = MessageSearch(SimpleNamespace(chat_sessions=db.chat_sessions, messages=messages))
+        since = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        await search.search("kampanya", agent_type="content", since=since)
+        return messages.queries[0], since
+
+    query, since = asyncio.run(scenario())
+    assert query == {"$text": {"$search": "kampanya"}, "agent_type": "content", "timestamp": {"$gte": since}}
+
+def test_search_endpoint_pages_with_headers(api):
+    async def scenario():
+        async with api() as client:
+            sessions = [f"search-{uuid.uuid4().hex}" for _ in range(3)]
+            for i, session_id in enumerate(sessions):
+                await seed(server.db, session_id, f"lansman planı {i}")
+            try:
+                first = await client.get("/api/search", params={"q": "lansman", "limit": 2})
+                last = await client.get("/api/search", params={"q": "lansman", "offset": first.headers["X-Next-Offset"], "limit": 2})
+                invalid = await client.get("/api/search", params={"q": "lansman", "agent_type": "unknown"})
+            finally:
+                await server.db.chat_sessions.delete_many({"id": {"$in": sessions}})
+                await server.db.messages.delete_many({"session_id": {"$in": sessions}})
+            return first, last, invalid
+
+    first, last, invalid = asyncio.run(scenario())
+    assert first.status_code == 200 and len(first.json()) == 2
+    assert first.headers["X-Has-More"] == "true" and first.headers["X-Next-Offset"] == "2"
+    assert len(last.json()) == 1 and last.headers["X-Has-More"] == "false"
+    assert "X-Next-Offset" not in last.headers
+    assert invalid.status_code == 400
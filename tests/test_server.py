@@ -0,0 +1,32 @@
+import asyncio
+
+import server
+
+def test_shutdown_drains_background_writes_before_closing(api):
+    async def late_reply(session_id):
+        await asyncio.sleep(0.2)  # Still running when shutdown starts
+        document = server.to_mongo(server.Message(session_id=session_id, agent_type="content", role="assistant", content="Yarım yanıt"))
+        await server.record_session_activity(session_id, 1, document["content"], writes=(server.message_writer.write(document),))
+
+    async def scenario():
+        async with api() as client:
+            session_id = (await client.post("/api/sessions", json={"agent_type": "content", "name": "Deneme"})).json()["id"]
+            server.spawn_background(late_reply(session_id))
+        return (
+            await server.db.messages.count_documents({"session_id": session_id}),
+            await server.db.chat_sessions.find_one({"id": session_id}),
+        )
+
+    stored, session = asyncio.run(scenario())
+    assert stored == 1
+    assert session["message_count"] == 1 and session["last_message_preview"] == "Yarım yanıt"
+    assert not server._background_tasks
+
+def test_drain_cancels_tasks_that_outlive_the_timeout():
+    async def scenario():
+        stuck = server.spawn_background(asyncio.sleep(60))
+        await server.drain_background_tasks(0.05)
+        return stuck
+
+    stuck = asyncio.run(scenario())
+    assert stuck.cancelled()
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import server
+from routing import UpstreamUnavailable
+from sessions import PREVIEW_CHARS, activity_update, message_preview
+
+async def create_session(client, agent_type="content"):
+    response = await client.post("/api/sessions", json={"agent_type": agent_type, "name": "Deneme"})
+    return response.json()["id"]
+
+async def background_settled():
+    while server._background_tasks:
+        await asyncio.gather(*server._background_tasks, return_exceptions=True)
+
+async def session_document(session_id):
+    return await server.db.chat_sessions.find_one({"id": session_id}, {"_id": 0})
+
+def test_failed_chat_still_counts_the_stored_user_message(api, monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise UpstreamUnavailable("openai/gpt-5: ConnectionError")
+
+    monkeypatch.setattr(server, "generate_reply", unavailable)
+
+    async def scenario():
+        async with api() as client:
+            session_id = await create_session(client)
+            response = await client.post("/api/chat", json={"session_id": session_id, "agent_type": "content", "content": "Merhaba"})
+            await background_settled()
+            messages = (await client.get(f"/api/chat/{session_id}/messages")).json()
+            return response.status_code, await session_document(session_id), messages
+
+    status, session, messages = asyncio.run(scenario())
+    assert status == 502
+    assert [message["role"] for message in messages] == ["user"]
+    assert session["message_count"] == 1 and session["last_message_preview"] == "Merhaba"
+
+def test_successful_chat_counts_both_messages_and_previews_the_reply(api):
+    async def scenario():
+        async with api() as client:
+            session_id = await create_session(client)
+            response = await client.post("/api/chat", json={"session_id": session_id, "agent_type": "content", "content": "Merhaba"})
+            return response.json(), await session_document(session_id)
+
+    reply, session = asyncio.run(scenario())
+    assert session["message_count"] == 2
+    assert session["last_message_preview"] == message_preview(reply["content"])
+    assert session["updated_at"] >= session["created_at"]
+
+def test_preview_is_one_capped_line():
+    preview = message_preview("ilk satır\n\n  ikinci   satır " + "x" * 400)
+    assert preview.startswith("ilk satır ikinci satır x")
+    assert len(preview) == PREVIEW_CHARS and preview.endswith("…")
+
+def test_failed_scheduled_run_still_counts_its_user_message(api, monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise UpstreamUnavailable("openai/gpt-5: ConnectionError")
+
+    monkeypatch.setattr(server, "generate_reply", unavailable)
+
+    async def scenario():
+        async with api() as client:
+            session_id = await create_session(client, "publisher")
+            task = {"id": "t", "session_id": session_id, "agent_type": "publisher", "prompt": "Yarın için paylaşım yaz"}
+            try:
+                await server.execute_scheduled_task(task)
+            except UpstreamUnavailable:
+                pass
+            await background_settled()
+            return await session_document(session_id)
+
+    session = asyncio.run(scenario())
+    assert session["message_count"] == 1 and session["last_message_preview"] == "Yarın için paylaşım yaz"
+
+def test_session_list_etag_moves_with_any_session_write(api):
+    async def scenario():
+        async with api() as client:
+            older = await create_session(client)
+            await create_session(client)
+            first = await client.get("/api/sessions?agent_type=content")
+            revalidated = await client.get("/api/sessions?agent_type=content", headers={"If-None-Match": first.headers["etag"]})
+            # A late write to a session that does not become the newest one
+            stored = await session_document(older)
+            await server.db.chat_sessions.update_one(
+                {"id": older}, activity_update(1, "Geç gelen mesaj", stored["updated_at"])
+            )
+            after = await client.get("/api/sessions?agent_type=content", headers={"If-None-Match": first.headers["etag"]})
+            return first, revalidated, after, older
+
+    first, revalidated, after, older = asyncio.run(scenario())
+    assert revalidated.status_code == 304
+    assert after.status_code == 200 and after.headers["etag"] != first.headers["etag"]
+    assert next(session for session in after.json() if session["id"] == older)["message_count"] == 1
+
+def test_session_list_pages_by_recency(api):
+    async def scenario():
+        async with api() as client:
+            await server.db.chat_sessions.delete_many({"agent_type": "research"})
+            created = [await create_session(client, "research") for _ in range(3)]
+            # Sessions created within the same millisecond would tie on updated_at
+            start = datetime.now(timezone.utc)
+            for i, session_id in enumerate(created):
+                await server.db.chat_sessions.update_one({"id": session_id}, {"$set": {"updated_at": start + timedelta(seconds=i)}})
+            first = await client.get("/api/sessions?agent_type=research&limit=2")
+            second = await client.get(f"/api/sessions?agent_type=research&limit=2&cursor={first.headers['x-next-cursor']}")
+            return created, first, second
+
+    created, first, second = asyncio.run(scenario())
+    assert [session["id"] for session in first.json() + second.json()] == created[::-1]
+    assert first.headers["x-has-more"] == "true" and second.headers["x-has-more"] == "false"
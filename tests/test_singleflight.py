@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+class Upstream:
+    def __init__(self, delay=0.05, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return f"yanıt {self.calls}"
+
+def test_concurrent_callers_share_one_call():
+    upstream = Upstream()
+
+    async def scenario():
+        flights = SingleFlight()
+        answers = await asyncio.gather(*(flights.do("k", upstream) for _ in range(5)))
+        later = await flights.do("k", upstream)  # The first call has finished: a new one starts
+        return answers, later, flights.stats()
+
+    answers, later, stats = asyncio.run(scenario())
+    assert answers == ["yanıt 1"] * 5 and later == "yanıt 2"
+    assert stats == {"in_flight": 0, "executed": 2, "coalesced": 4, "errors": 0, "abandoned": 0}
+
+def test_different_keys_are_not_coalesced():
+    upstream = Upstream()
+
+    async def scenario():
+        flights = SingleFlight()
+        await asyncio.gather(flights.do("a", upstream), flights.do("b", upstream))
+        return flights.counters
+
+    counters = asyncio.run(scenario())
+    assert upstream.calls == 2 and counters["coalesced"] == 0
+
+def test_every_waiter_gets_the_error():
+    upstream = Upstream(error=ConnectionError("upstream reset"))
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("k", upstream) for _ in range(3)), return_exceptions=True)
+        return results, flights.counters
+
+    results, counters = asyncio.run(scenario())
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert upstream.calls == 1 and counters["errors"] == 1
+
+def test_call_survives_one_caller_leaving_and_is_cancelled_when_all_leave():
+    upstream = Upstream(delay=1)
+
+    async def scenario():
+        flights = SingleFlight()
+        first = asyncio.create_task(flights.do("k", upstream))
+        second = asyncio.create_task(flights.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        still_running = not upstream.cancelled
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        await asyncio.sleep(0)
+        return still_running, flights.stats()
+
+    still_running, stats = asyncio.run(scenario())
+    assert still_running and upstream.cancelled
+    assert stats["abandoned"] == 1 and stats["in_flight"] == 0
@@ -0,0 +1,67 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+from mongomock_motor import AsyncMongoMockClient
+
+from transfer import FORMAT, FORMAT_VERSION, ensure_unique_ids, import_records
+
+def make_db():
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+def export_file(messages: int):
+    now = datetime.now(timezone.utc).isoformat()
+    session_id = str(uuid.uuid4())
+    records = [
+        {"type": "header", "format": FORMAT, "version": FORMAT_VERSION},
+        {"type": "session", "data": {"id": session_id, "name": "S", "agent_type": "content", "created_at": now, "updated_at": now}},
+    ]
+    records += [
+        {"type": "message", "data": {
+            "id": str(uuid.uuid4()), "session_id": session_id, "agent_type": "content",
+            "role": "user", "content": f"mesaj {i}", "timestamp": now,
+        }}
+        for i in range(messages)
+    ]
+    return records
+
+async def replay(records):
+    for record in records:
+        # Each import works on its own copies, as when parsing a file
+        yield {**record, "data": dict(record["data"])} if "data" in record else dict(record)
+
+def test_concurrent_imports_of_one_file_insert_once(monkeypatch):
+    async def scenario():
+        db = make_db()
+        await ensure_unique_ids(db)
+        records = export_file(10)
+        # Both imports look ids up before either inserts, as two servers racing would
+        barrier = asyncio.Barrier(2)
+        collection_class = type(db.messages)
+        insert_many = collection_class.insert_many
+
+        async def racing_insert_many(self, documents, **kwargs):
+            await barrier.wait()
+            return await insert_many(self, documents, **kwargs)
+
+        monkeypatch.setattr(collection_class, "insert_many", racing_insert_many)
+        first, second = await asyncio.gather(
+            import_records(db, replay(records), batch_size=4),
+            import_records(db, replay(records), batch_size=4),
+        )
+        return first, second, await db.messages.count_documents({}), await db.chat_sessions.count_documents({})
+
+    first, second, messages, sessions = asyncio.run(scenario())
+    assert (messages, sessions) == (10, 1)
+    assert first["message"]["inserted"] + second["message"]["inserted"] == 10
+    assert first["message"]["skipped"] + second["message"]["skipped"] == 10
+
+def test_unique_id_index_replaces_legacy_index():
+    async def scenario():
+        db = make_db()
+        await db.chat_sessions.create_index("id", name="id")
+        await ensure_unique_ids(db)
+        return await db.chat_sessions.index_information()
+
+    indexes = asyncio.run(scenario())
+    assert "id" not in indexes and indexes["id_unique"]["unique"]
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+from write_buffer import WriteBehindBuffer
+
+class SlowCollection:
+    """Records insert_many batches; each round-trip takes ``latency`` seconds"""
+
+    name = "messages"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.batches = []
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(self.latency)
+        self.batches.append([document["n"] for document in documents])
+
+def test_lone_write_is_sent_immediately():
+    async def scenario():
+        collection = SlowCollection(latency=0)
+        buffer = WriteBehindBuffer(collection)
+        started = time.perf_counter()
+        await buffer.write({"n": 0})
+        elapsed = time.perf_counter() - started
+        await buffer.stop()
+        return elapsed, collection.batches
+
+    elapsed, batches = asyncio.run(scenario())
+    assert batches == [[0]]
+    assert elapsed < 0.004
+
+def test_writes_during_a_flush_share_the_next_batch_in_order():
+    async def scenario():
+        collection = SlowCollection(latency=0.02)
+        buffer = WriteBehindBuffer(collection)
+        first = buffer.write({"n": 0})
+        await asyncio.sleep(0.005)  # The first insert is now in flight
+        rest = [buffer.write({"n": n}) for n in range(1, 6)]
+        await asyncio.gather(first, *rest)
+        await buffer.stop()
+        return collection.batches
+
+    assert asyncio.run(scenario()) == [[0], [1, 2, 3, 4, 5]]
+
+def test_max_batch_splits_large_bursts():
+    async def scenario():
+        collection = SlowCollection(latency=0)
+        buffer = WriteBehindBuffer(collection, max_batch=3)
+        await asyncio.gather(*(buffer.write({"n": n}) for n in range(7)))
+        await buffer.stop()
+        return collection.batches
+
+    assert asyncio.run(scenario()) == [[0, 1, 2], [3, 4, 5], [6]]
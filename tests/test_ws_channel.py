@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from ws_channel import ChannelConnection
+
+class FakeWebSocket:
+    """Follows Starlette's rules: receiving or sending after close() raises RuntimeError"""
+
+    def __init__(self):
+        self.application_state = WebSocketState.CONNECTING
+        self.incoming: "asyncio.Queue" = asyncio.Queue()
+        self.sent = []
+        self.closes = []
+
+    async def accept(self):
+        self.application_state = WebSocketState.CONNECTED
+
+    def _check(self):
+        if self.application_state != WebSocketState.CONNECTED:
+            raise RuntimeError('WebSocket is not connected. Need to call "accept" first.')
+
+    async def receive_text(self):
+        self._check()
+        text = await self.incoming.get()
+        if text is None:
+            raise WebSocketDisconnect(1000)
+        self._check()
+        return text
+
+    async def send_text(self, text):
+        self._check()
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self._check()
+        self.application_state = WebSocketState.DISCONNECTED
+        self.closes.append(code)
+        self.incoming.put_nowait("{}")  # A frame that was already on the wire
+
+def connection(websocket, idle_timeout=5.0):
+    return ChannelConnection(
+        websocket, handlers={}, send_queue_size=8,
+        heartbeat_seconds=0.01, idle_timeout=idle_timeout, max_inflight=2
+    )
+
+def test_idle_close_ends_the_connection_once():
+    async def scenario():
+        websocket = FakeWebSocket()
+        await asyncio.wait_for(connection(websocket, idle_timeout=0.03).run(), 1)
+        return websocket
+
+    websocket = asyncio.run(scenario())
+    assert websocket.closes == [1001]
+    assert websocket.application_state == WebSocketState.DISCONNECTED
+
+def test_client_disconnect_ends_the_connection_without_closing():
+    async def scenario():
+        websocket = FakeWebSocket()
+        websocket.incoming.put_nowait(json.dumps({"type": "ping"}))
+        websocket.incoming.put_nowait(None)
+        await asyncio.wait_for(connection(websocket).run(), 1)
+        return websocket
+
+    websocket = asyncio.run(scenario())
+    assert websocket.closes == []
+
+def test_send_on_a_closed_socket_ends_the_connection():
+    class ClosedUnderUs(FakeWebSocket):
+        async def send_text(self, text):
+            raise RuntimeError('Cannot call "send" once a close message has been sent.')
+
+    async def scenario():
+        websocket = ClosedUnderUs()
+        websocket.incoming.put_nowait(json.dumps({"type": "ping"}))
+        await asyncio.wait_for(connection(websocket).run(), 1)
+        return websocket
+
+    websocket = asyncio.run(scenario())
+    assert websocket.closes == []